@@ -0,0 +1,295 @@
+""" Scaling benchmark of the dataset functions
+
+    Builds synthetic leagues (functions.synthetic) of each size, seasons x
+    teams x games per season, and times every function at each size:
+
+        row     the row-wise functions of the notebooks (teamhistory,
+                coach_history, previous_yrs, opponent_stats, fixTOP,
+                removeSlashes, extract_name, create_variables) applied to a
+                sample of rows; projected_seconds is the time per call times
+                the rows they would be applied to
+        table   their table versions on all the rows
+        stage   the DatasetCreation stages and the whole pipeline
+                (build_dataset and model_matrix)
+
+    Times are the best of --repeat runs, peak_mb is the peak of the Python
+    allocations (tracemalloc) in a separate run.  The results go to a JSON
+    file with the scaling exponent of each function (the slope of log time
+    over log team-games), and --compare prints the time and memory ratios to
+    an earlier results file, so a change can be checked for regressions:
+
+        python -m functions.benchmark --sizes 2x16x12,4x32x12,8x64x12 --output functions_benchmark.json
+        python -m functions.benchmark --only table stage --compare functions_benchmark.json
+"""
+import argparse, gc, json, os, platform, subprocess, sys, time, tracemalloc, warnings
+import numpy as np
+import pandas as pd
+from functions.functions import teamhistory, teamhistory_table, coach_history, coach_history_table, coach_ledger, \
+previous_yrs, previous_yrs_table, opponent_stats, opponent_stats_table, fixTOP, fixTOP_column, removeSlashes, \
+removeSlashes_column, extract_name, parse_opponent, create_variables, parse_games
+from functions.dataset import combine_gamebygame, clean_master, build_gamestats, build_gamelist, coaches_by_team, \
+roster_table, row_hashes, input_hashes, dataset_tables, build_dataset, model_matrix, target_columns, ID_COLUMNS, YRS
+from functions.synthetic import synthetic_inputs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = '2x16x12,4x32x12,8x64x12'
+FIRST_YEAR = 2014
+
+
+def parse_sizes(text):
+    """ Returns [(seasons, teams, games)] from '2x16x12,4x32x12' """
+    return [tuple(int(x) for x in size.split('x')) for size in text.split(',')]
+
+
+def sample_rows(data, sample):
+    """ Returns up to sample rows of data, the same ones every run """
+    return data if len(data) <= sample else data.sample(n = sample, random_state = 0)
+
+
+def prepare(seasons, teams, games):
+    """ Returns the synthetic inputs of a size and the intermediate tables the functions are applied to """
+    inputs = synthetic_inputs(seasons = seasons, teams = teams, games = games, first_year = FIRST_YEAR)
+    master, collisions = combine_gamebygame(inputs['gamebygame'])
+    clean = clean_master(master)
+    gamestats = build_gamestats(clean)
+    coaches_list = coaches_by_team(inputs['coach_links'])
+    gamelist = build_gamelist(inputs['participation'], inputs['history'], coaches_list, inputs['coaches'])
+    tables = dataset_tables(gamelist, gamestats, row_hashes(master), input_hashes(inputs))
+
+    # The model matrix features are built on the stored (schema typed) tables
+    targets = target_columns(tables['gamestats'])
+    model_stats = tables['gamestats'].copy()
+    model_stats[targets] = model_stats[targets].fillna(value = 0, axis = 'columns')
+    # Slash columns as removeSlashes gets them (cols[3:] of the stat columns without TOP)
+    cols = [x for x in master.columns if x not in ID_COLUMNS and x != 'TOP']
+    return {'inputs': inputs, 'master': master, 'clean': clean, 'gamestats': gamestats, 'coaches_list': coaches_list,
+            'gamelist': gamelist, 'tables': tables, 'targets': targets, 'model_stats': model_stats,
+            'slash_cols': cols}
+
+
+def cases(data, sample):
+    """ Returns (name, kind, rows, calls, func) for every benchmark of a size
+
+        rows : rows the function is applied to in the build
+        calls : rows func applies it to (the sample for the row-wise functions)
+    """
+    inputs, master, gamelist = data['inputs'], data['master'], data['gamelist']
+    history, coaches, participation = inputs['history'], inputs['coaches'], inputs['participation']
+    targets, model_stats = data['targets'], data['model_stats']
+    # The previous year features are built from the stored game list
+    stored = data['tables']['gameslist']
+    teamlist = list(stored['Team'].unique())
+    opponents = stored[stored['opponentName'].isin(teamlist)]
+    ledger = coach_ledger(coaches)
+
+    games = sample_rows(gamelist, sample)
+    stored_games = sample_rows(stored, sample)
+    # coach_history fails for a coach without an earlier season, time it on the games with a record
+    coached = sample_rows(gamelist[coach_history_table(gamelist, ledger)['Coach_years'].notnull()], sample)
+    opponent_games = sample_rows(opponents, sample)
+    master_rows = sample_rows(master, sample)
+    participation_rows = sample_rows(participation, sample)
+    slash_cols = data['slash_cols']
+
+    out = [
+        ('teamhistory', 'row', len(gamelist), len(games),
+         lambda: games.apply(lambda row: teamhistory(row['Team'], row['year'], YRS, history), axis = 1)),
+        ('coach_history', 'row', len(gamelist), len(coached),
+         lambda: coached.apply(lambda row: coach_history(row['coach'], row['year'], coaches), axis = 1)),
+        ('previous_yrs', 'row', len(stored), len(stored_games),
+         lambda: stored_games.apply(lambda row: previous_yrs(row['Team'], row['year'], row['gamenumber'], targets, model_stats),
+                             axis = 1)),
+        ('opponent_stats', 'row', len(opponents), len(opponent_games),
+         lambda: opponent_games.apply(lambda row: opponent_stats(row['opponentName'], row['Date'], row['year'], targets,
+                                                                 model_stats), axis = 1)),
+        ('fixTOP', 'row', len(master), len(master_rows), lambda: master_rows['TOP'].apply(fixTOP)),
+        ('removeSlashes', 'row', len(master), len(master_rows),
+         lambda: master_rows.apply(lambda row: removeSlashes(row, slash_cols), axis = 1)),
+        ('extract_name', 'row', len(participation), len(participation_rows),
+         lambda: participation_rows.apply(extract_name, args = ('Opponent',), axis = 1)),
+        ('create_variables', 'row', len(gamelist), len(games), lambda: games.apply(create_variables, axis = 1)),
+
+        ('teamhistory_table', 'table', len(gamelist), len(gamelist),
+         lambda: teamhistory_table(history, YRS, gamelist[['org_id', 'year']], team = 'org_id')),
+        ('coach_history_table', 'table', len(gamelist), len(gamelist), lambda: coach_history_table(gamelist, ledger)),
+        ('previous_yrs_table', 'table', len(stored), len(stored),
+         lambda: previous_yrs_table(stored, targets, model_stats)),
+        ('opponent_stats_table', 'table', len(opponents), len(stored),
+         lambda: opponent_stats_table(stored, targets, model_stats, teamlist = teamlist)),
+        ('fixTOP_column', 'table', len(master), len(master), lambda: fixTOP_column(master['TOP'])),
+        ('removeSlashes_column', 'table', len(master), len(master),
+         lambda: master[slash_cols[3:]].apply(removeSlashes_column)),
+        ('parse_opponent', 'table', len(participation), len(participation),
+         lambda: parse_opponent(participation['Opponent'])),
+        ('parse_games', 'table', len(gamelist), len(gamelist), lambda: parse_games(gamelist)),
+
+        ('combine_gamebygame', 'stage', len(master), len(master), lambda: combine_gamebygame(inputs['gamebygame'])),
+        ('clean_master', 'stage', len(master), len(master), lambda: clean_master(master)),
+        ('build_gamestats', 'stage', len(master), len(master), lambda: build_gamestats(data['clean'])),
+        ('build_gamelist', 'stage', len(gamelist), len(gamelist),
+         lambda: build_gamelist(participation, history, data['coaches_list'], coaches)),
+        ('roster_table', 'stage', len(inputs['roster']), len(inputs['roster']), lambda: roster_table(inputs['roster'])),
+        ('model_matrix', 'stage', len(gamelist), len(gamelist),
+         lambda: model_matrix(data['tables']['gameslist'], data['tables']['gamestats'], base_year = FIRST_YEAR)),
+        ('pipeline', 'stage', len(gamelist), len(gamelist), lambda: pipeline(inputs)),
+    ]
+    return out
+
+
+def pipeline(inputs):
+    """ The whole DatasetCreation build: dataset tables, roster means and the model matrix """
+    tables = build_dataset(inputs)
+    roster_table(inputs['roster'])
+    return model_matrix(tables['gameslist'], tables['gamestats'], base_year = FIRST_YEAR)
+
+
+def measure(func, repeat = 3, memory = True):
+    """ Returns the best wall time of repeat calls and the peak traced allocations (MB, None without memory) """
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1] / 1024.0 ** 2
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def scaling(results):
+    """ Returns the log-log slope of projected seconds over team-games for each function (None with one size) """
+    out = {}
+    for name in dict.fromkeys(result['function'] for result in results):
+        points = [(result['team_games'], result['projected_seconds']) for result in results
+                  if result['function'] == name and result['projected_seconds'] > 0]
+        if len(set(x for x, _ in points)) < 2:
+            out[name] = None
+            continue
+        x, y = np.log([p[0] for p in points]), np.log([p[1] for p in points])
+        out[name] = round(float(np.polyfit(x, y, 1)[0]), 3)
+    return out
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd = ROOT,
+                                       stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, sample = 100, repeat = 3, memory = True, only = None, log = print):
+    """ Benchmark every function at every size, returns the results dict
+
+        Keyword arguments:
+
+        sizes : [(seasons, teams, games)]
+        sample : rows the row-wise functions are timed on
+        repeat : timed runs per function (the best is kept)
+        memory : also trace the allocations
+        only : function names or kinds to run (default all)
+        log : called with each result line
+    """
+    results = []
+    for seasons, teams, games in sizes:
+        label = '%dx%dx%d' % (seasons, teams, games)
+        with warnings.catch_warnings():
+            # The row-wise functions use deprecated pandas arguments
+            warnings.simplefilter('ignore')
+            data = prepare(seasons, teams, games)
+            for name, kind, rows, calls, func in cases(data, sample):
+                if only and name not in only and kind not in only:
+                    continue
+                seconds, peak = measure(func, repeat = repeat, memory = memory)
+                per_call = seconds / max(calls, 1)
+                result = {'function': name, 'kind': kind, 'size': label, 'seasons': seasons, 'teams': teams,
+                          'games': games, 'team_games': len(data['gamelist']), 'rows': rows, 'calls': calls,
+                          'seconds': round(seconds, 6), 'seconds_per_call': per_call,
+                          'projected_seconds': round(per_call * rows, 6),
+                          'peak_mb': None if peak is None else round(peak, 2)}
+                results.append(result)
+                log(format_result(result))
+        del data
+    return {'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'versions': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__},
+            'sample': sample,
+            'repeat': repeat,
+            'sizes': [list(size) for size in sizes],
+            'results': results,
+            'scaling': scaling(results),
+           }
+
+
+def format_result(result):
+    peak = '' if result['peak_mb'] is None else '%9.1fMB' % result['peak_mb']
+    return ("%-22s %-5s %-9s %7d rows %10.4fs projected %10.4fs%s" %
+            (result['function'], result['kind'], result['size'], result['rows'], result['seconds'],
+             result['projected_seconds'], peak))
+
+
+def compare(results, previous, tolerance = None, log = print):
+    """ Print the time and memory ratios to an earlier run, returns the results slower than 1 + tolerance
+
+        Keyword arguments:
+
+        results : output of run
+        previous : an earlier output of run
+        tolerance : allowed slowdown (0.2 for 20%), None to only report
+        log : called with each line
+    """
+    old = {(result['function'], result['size']): result for result in previous['results']}
+    slower = []
+    log("compared to %s (%s)" % (previous.get('commit'), previous.get('time')))
+    for result in results['results']:
+        before = old.get((result['function'], result['size']))
+        if before is None or not before['projected_seconds']:
+            continue
+        ratio = result['projected_seconds'] / before['projected_seconds']
+        memory = ''
+        if result['peak_mb'] and before.get('peak_mb'):
+            memory = '  memory x%.2f' % (result['peak_mb'] / before['peak_mb'])
+        flag = ''
+        if tolerance is not None and ratio > 1 + tolerance:
+            slower.append(result)
+            flag = '  SLOWER'
+        log("%-22s %-9s time x%.2f%s%s" % (result['function'], result['size'], ratio, memory, flag))
+    return slower
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Scaling benchmark of the dataset functions on synthetic data")
+    parser.add_argument('--sizes', default = SIZES, help = "comma separated SEASONSxTEAMSxGAMES league sizes")
+    parser.add_argument('--sample', type = int, default = 100, help = "rows to time the row-wise functions on")
+    parser.add_argument('--repeat', type = int, default = 3, help = "timed runs per function, the best is kept")
+    parser.add_argument('--no-memory', action = 'store_true', help = "skip the tracemalloc runs")
+    parser.add_argument('--only', nargs = '+', default = None, metavar = 'NAME', help = "functions or kinds (row, table, stage) to run")
+    parser.add_argument('--output', default = 'functions_benchmark.json', help = "results file")
+    parser.add_argument('--compare', default = None, metavar = 'JSON', help = "earlier results file to compare with")
+    parser.add_argument('--tolerance', type = float, default = None, help = "exit with an error if a function is this much slower than --compare")
+    args = parser.parse_args(argv)
+
+    results = run(parse_sizes(args.sizes), sample = args.sample, repeat = args.repeat, memory = not args.no_memory,
+                  only = args.only)
+    print("scaling exponents (time ~ team-games^k)")
+    for name, exponent in results['scaling'].items():
+        print("%-22s %s" % (name, '-' if exponent is None else '%.2f' % exponent))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent = 2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), tolerance = args.tolerance)
+        if slower:
+            sys.exit("%d functions slower than %s" % (len(slower), args.compare))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+""" Dataset build runner
+
+    Runs the build as a DAG of stages, from the crawls through to the model
+    matrix.  Each stage is keyed on a hash of its parameters, its code and the
+    contents of its input files, including the upstream outputs it reads.  A
+    stage whose key matches the last run and whose outputs are untouched is
+    skipped, so a stage whose upstream reran without changing its outputs is
+    not rerun either.  Outputs are also copied to .build/cache/<stage>/<key>,
+    so going back to earlier inputs or parameters restores the cached outputs
+    instead of running the stage again.  Stages whose dependencies are done
+    run in parallel.
+
+        python -m functions.build                    # everything
+        python -m functions.build features           # features and what it needs
+        python -m functions.build --force links_team --jobs 4
+        python -m functions.build --list
+
+    --profile runs the dataset stages under a functions.profiling.Profiler
+    (one stage at a time) and writes each one's step timings, memory peaks and
+    row/column counts to .build/profile/<stage>.json and .txt.  The profile
+    doesn't change the outputs, so add --force to profile up to date stages:
+
+        python -m functions.build --profile --force master features model_matrix
+"""
+import argparse, concurrent.futures, glob, hashlib, json, os, shutil, subprocess, sys, zipfile
+from functions.dataset import load_inputs, combine_gamebygame, clean_master, build_gamestats, row_hashes, \
+build_gamelist, coaches_by_team, input_hashes, dataset_tables, model_matrix, YRS
+from functions.featurestore import write_store, read_store
+from functions.profiling import Profiler
+from functions.schema import read_dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRAPY_DIR = os.path.join(ROOT, 'scrapy')
+BUILD_DIR = os.path.join(ROOT, '.build')
+
+
+class Stage(object):
+    """ A build stage
+
+        name : stage name
+        func : module level function called as func(stage)
+        deps : names of the stages that must run first
+        inputs : files/globs (relative to the repo root) whose contents key the stage
+        outputs : files/globs/directories the stage writes
+        params : JSON serializable parameters, passed on as stage.params
+        code : source files whose contents key the stage
+        options : settings that don't change the outputs (not part of the key), passed on as stage.options
+    """
+
+    def __init__(self, name, func, deps = (), inputs = (), outputs = (), params = None, code = (), options = None):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.code = list(code)
+        self.options = options or {}
+
+    def __repr__(self):
+        return "Stage(%r)" % self.name
+
+
+def expand(patterns):
+    """Returns the sorted repo-relative paths matched by file/glob patterns"""
+    paths = set()
+    for pattern in patterns:
+        paths.update(os.path.relpath(x, ROOT) for x in glob.glob(os.path.join(ROOT, pattern)))
+    return sorted(paths)
+
+
+def path_hash(path):
+    """Returns the sha1 of a file, or of the relative paths and contents of every file under a directory"""
+    digest = hashlib.sha1()
+    full = os.path.join(ROOT, path)
+    files = [full]
+    if os.path.isdir(full):
+        files = sorted(os.path.join(d, f) for d, _, fs in os.walk(full) for f in fs)
+    for file in files:
+        digest.update(os.path.relpath(file, full).encode('utf-8'))
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_key(stage):
+    """Returns the hash of a stage's name, parameters, code and input contents"""
+    description = {'name': stage.name,
+                   'params': stage.params,
+                   'code': {path: path_hash(path) for path in expand(stage.code)},
+                   'inputs': {path: path_hash(path) for path in expand(stage.inputs)},
+                  }
+    return hashlib.sha1(json.dumps(description, sort_keys = True).encode('utf-8')).hexdigest()
+
+
+def output_hashes(stage):
+    """Returns the hash of every output of a stage (None if an output is missing)"""
+    paths = expand(stage.outputs)
+    if not paths:
+        return None
+    return {path: path_hash(path) for path in paths}
+
+
+def read_state():
+    """Returns the key and output hashes of each stage's last run"""
+    state_file = os.path.join(BUILD_DIR, 'state.json')
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file) as f:
+        return json.load(f)
+
+
+def write_state(state):
+    """Save the key and output hashes of each stage's last run"""
+    os.makedirs(BUILD_DIR, exist_ok = True)
+    with open(os.path.join(BUILD_DIR, 'state.json'), 'w') as f:
+        json.dump(state, f, indent = 1, sort_keys = True)
+
+
+def copy_path(source, dest):
+    """Copy a file or directory, replacing dest"""
+    if os.path.isdir(dest):
+        shutil.rmtree(dest)
+    os.makedirs(os.path.dirname(dest), exist_ok = True)
+    if os.path.isdir(source):
+        shutil.copytree(source, dest)
+    else:
+        shutil.copy2(source, dest)
+
+
+def cache_dir(stage, key):
+    """Returns the directory holding a stage's outputs for a key"""
+    return os.path.join(BUILD_DIR, 'cache', stage.name, key)
+
+
+def save_cache(stage, key):
+    """Copy a stage's outputs into its cache directory"""
+    target = cache_dir(stage, key)
+    shutil.rmtree(target, ignore_errors = True)
+    for path in expand(stage.outputs):
+        copy_path(os.path.join(ROOT, path), os.path.join(target, path))
+
+
+def restore_cache(stage, key):
+    """Copy a stage's cached outputs back into place, returns False if there are none"""
+    source = cache_dir(stage, key)
+    if not os.path.isdir(source):
+        return False
+    for d, dirs, files in os.walk(source):
+        rel = os.path.relpath(d, source)
+        # Store directories are copied whole
+        if os.path.exists(os.path.join(d, 'manifest.json')):
+            copy_path(d, os.path.join(ROOT, rel))
+            dirs[:] = []
+            continue
+        for f in files:
+            copy_path(os.path.join(d, f), os.path.join(ROOT, rel, f))
+    return True
+
+
+def needed(stages, targets):
+    """Returns the names of the targets and every stage they depend on"""
+    lookup = {stage.name: stage for stage in stages}
+    out, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in lookup:
+            raise KeyError("Unknown stage: %s" % name)
+        if name not in out:
+            out.add(name)
+            todo.extend(lookup[name].deps)
+    return out
+
+
+def run(stages, targets = None, force = (), jobs = 1, dry_run = False, log = print):
+    """ Run the stages needed for the targets, skipping the ones that are up to date
+
+        Returns a dict of stage name -> 'fresh', 'restored', 'ran' (or 'stale' for a dry run)
+
+        Keyword arguments:
+
+        stages : list of Stage
+        targets : stage names to build (default all)
+        force : stage names to run even if they are up to date
+        jobs : stages to run at once
+        dry_run : only report what would run
+        log : function called with progress messages
+    """
+    lookup = {stage.name: stage for stage in stages}
+    todo = needed(stages, targets or list(lookup))
+    state = read_state()
+    keys, status = {}, {}
+    running = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = jobs) as pool:
+        while todo or running:
+            ready = [lookup[name] for name in sorted(todo) if all(dep in status for dep in lookup[name].deps)]
+            for stage in ready:
+                todo.discard(stage.name)
+                key = stage_key(stage)
+                keys[stage.name] = key
+                last = state.get(stage.name, {})
+                stale_dep = any(status[dep] == 'stale' for dep in stage.deps)
+                if (stage.name not in force and not stale_dep and last.get('key') == key
+                    and output_hashes(stage) == last.get('outputs')):
+                    status[stage.name] = 'fresh'
+                    log("%-20s up to date" % stage.name)
+                elif dry_run:
+                    status[stage.name] = 'stale'
+                    log("%-20s would run" % stage.name)
+                elif stage.name not in force and restore_cache(stage, key):
+                    status[stage.name] = 'restored'
+                    state[stage.name] = {'key': key, 'outputs': output_hashes(stage)}
+                    write_state(state)
+                    log("%-20s restored from cache" % stage.name)
+                else:
+                    log("%-20s running" % stage.name)
+                    running[pool.submit(stage.func, stage)] = stage
+
+            # Stages settled without running may have made others ready
+            if any(stage.name in status for stage in ready):
+                continue
+            if not running:
+                if todo:
+                    raise RuntimeError("Stages with unmet dependencies: %s" % sorted(todo))
+                break
+            done, _ = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                future.result()
+                save_cache(stage, keys[stage.name])
+                status[stage.name] = 'ran'
+                state[stage.name] = {'key': keys[stage.name], 'outputs': output_hashes(stage)}
+                write_state(state)
+                log("%-20s done" % stage.name)
+    return status
+
+
+# Stage functions
+
+def crawl(stage):
+    """Run the stage's spider from the scrapy project"""
+    subprocess.run([sys.executable, '-m', 'scrapy', 'crawl', stage.params['spider']], cwd = SCRAPY_DIR, check = True)
+
+
+def package_data(stage):
+    """Zip the crawled tables the dataset build reads into scrapy/Data/Data.zip"""
+    out = os.path.join(ROOT, stage.outputs[0])
+    with zipfile.ZipFile(out + '.tmp', 'w', zipfile.ZIP_DEFLATED) as zf:
+        for path in expand(stage.inputs):
+            zf.write(os.path.join(ROOT, path), os.path.basename(path))
+    os.replace(out + '.tmp', out)
+
+
+def stage_profiler(stage):
+    """Returns the profiler for a stage's steps (measuring them with the profile option)"""
+    return Profiler(enabled = stage.options.get('profile', False))
+
+
+def write_profile(stage, profiler):
+    """Write a profiled stage's report to .build/profile/<stage>.json and .txt"""
+    if not profiler.enabled:
+        return
+    path = os.path.join(BUILD_DIR, 'profile')
+    os.makedirs(path, exist_ok = True)
+    profiler.write(os.path.join(path, stage.name + '.json'))
+    with open(os.path.join(path, stage.name + '.txt'), 'w') as f:
+        f.write(profiler.report() + "\n")
+    print("%s profile\n%s" % (stage.name, profiler.report()))
+
+
+def build_master(stage):
+    """Clean the merged game-by-game data into the game stats"""
+    profiler = stage_profiler(stage)
+    with profiler.stage('load_inputs') as step:
+        inputs = step.output(load_inputs(os.path.join(ROOT, stage.inputs[0]), os.path.join(SCRAPY_DIR, 'Links')))
+    with profiler.stage('combine_gamebygame') as step:
+        master, collisions = step.output(combine_gamebygame(inputs['gamebygame'], profiler = profiler))
+    with profiler.stage('clean_master', master) as step:
+        clean = step.output(clean_master(master, profiler = profiler))
+    with profiler.stage('build_gamestats', clean) as step:
+        gamestats = step.output(build_gamestats(clean, profiler = profiler))
+    with profiler.stage('row_hashes', master) as step:
+        rowhash = step.output(row_hashes(master))
+    with profiler.stage('write_store', gamestats, rowhash):
+        write_store(os.path.join(ROOT, stage.outputs[0]), {'gamestats': gamestats, 'rowhash': rowhash})
+    write_profile(stage, profiler)
+
+
+def build_features(stage):
+    """Build the game list features and write the finalgamedata feature store"""
+    profiler = stage_profiler(stage)
+    with profiler.stage('load_inputs') as step:
+        inputs = step.output(load_inputs(os.path.join(ROOT, stage.inputs[0]), os.path.join(SCRAPY_DIR, 'Links')))
+    master = os.path.join(ROOT, 'Data', 'build', 'master')
+    with profiler.stage('build_gamelist', inputs['participation']) as step:
+        gamelist = step.output(build_gamelist(inputs['participation'],
+                                              inputs['history'],
+                                              coaches_by_team(inputs['coach_links']),
+                                              inputs['coaches'],
+                                              yrs = stage.params['yrs'],
+                                              workers = stage.options.get('workers', 1),
+                                              profiler = profiler
+                                             ))
+    with profiler.stage('read_store') as step:
+        gamestats, rowhash = step.output((read_store(master, 'gamestats'), read_store(master, 'rowhash')))
+    with profiler.stage('dataset_tables', gamelist, gamestats) as step:
+        tables = step.output(dataset_tables(gamelist, gamestats, rowhash, input_hashes(inputs)))
+    with profiler.stage('write_store', tables):
+        write_store(os.path.join(ROOT, stage.outputs[0]), tables)
+    write_profile(stage, profiler)
+
+
+def build_model_matrix(stage):
+    """Build the modelling dataset from the feature store"""
+    profiler = stage_profiler(stage)
+    store = os.path.join(ROOT, stage.inputs[0])
+    with profiler.stage('read_dataset') as step:
+        tables = step.output(read_dataset(store))
+    with profiler.stage('model_matrix', tables['gameslist'], tables['gamestats']) as step:
+        games = step.output(model_matrix(tables['gameslist'],
+                                         tables['gamestats'],
+                                         target_variables = stage.params['target_variables'],
+                                         base_year = stage.params['base_year'],
+                                         workers = stage.options.get('workers', 1),
+                                         profiler = profiler
+                                        ))
+    with profiler.stage('write_store', games):
+        write_store(os.path.join(ROOT, stage.outputs[0]), {'games': games})
+    write_profile(stage, profiler)
+
+
+def spider_stage(name, spider, deps, inputs, outputs):
+    """Returns a stage running a spider, keyed on the scrapy project code"""
+    return Stage(name, crawl, deps = deps, inputs = inputs, outputs = outputs, params = {'spider': spider},
+                 code = ['scrapy/ncaa_football/spiders/*.py', 'scrapy/ncaa_football/*.py'])
+
+
+def stages(yrs = YRS, target_variables = None, base_year = 2013, workers = 1, profile = False):
+    """ Returns the build stages
+
+        Keyword arguments:
+
+        yrs : years of program history for the features
+        target_variables : game stat columns for the model matrix (default all)
+        base_year : first year in the data
+        workers : processes for the feature stages (results are the same for any count)
+        profile : profile the steps of the dataset stages (see write_profile)
+    """
+    links = 'scrapy/Links/'
+    data = 'scrapy/Data/'
+    tables = [data + 'gamebygame_*.csv', data + 'history.csv', data + 'coaches.csv', data + 'roster.csv']
+    code = ['functions/*.py']
+    return [
+        # Crawl link lists
+        spider_stage('links_team', 'teamlinks', [], [], [links + 'links_team.csv']),
+        spider_stage('links_teaminfo', 'PeopleHistoryRosterStats', ['links_team'],
+                     [links + 'links_team.csv'], [links + 'links_teaminfo.csv']),
+        spider_stage('links_gamebygames', 'teamstats', ['links_teaminfo'],
+                     [links + 'links_teaminfo.csv'], [links + 'links_gamebygames.csv']),
+        # Crawl tables
+        spider_stage('tables_gamebygame', 'GameByGame', ['links_gamebygames'],
+                     [links + 'links_gamebygames.csv'], [data + 'gamebygame_*.csv']),
+        spider_stage('tables_history', 'History', ['links_teaminfo'],
+                     [links + 'links_teaminfo.csv'], [data + 'history.csv']),
+        spider_stage('tables_coach', 'Coach', ['links_teaminfo'],
+                     [links + 'links_teaminfo.csv'], [data + 'coaches.csv']),
+        spider_stage('tables_roster', 'Roster', ['links_teaminfo'],
+                     [links + 'links_teaminfo.csv'], [data + 'roster.csv']),
+        Stage('data_zip', package_data, deps = ['tables_gamebygame', 'tables_history', 'tables_coach', 'tables_roster'],
+              inputs = tables, outputs = [data + 'Data.zip']),
+        # Clean master
+        Stage('master', build_master, deps = ['data_zip'], inputs = [data + 'Data.zip'],
+              outputs = ['Data/build/master'], code = code, options = {'profile': profile}),
+        # Features
+        Stage('features', build_features, deps = ['master', 'links_teaminfo'],
+              inputs = [data + 'Data.zip', links + 'links_teaminfo.csv', 'Data/build/master'],
+              outputs = ['Data/finalgamedata'],
+              params = {'yrs': list(yrs)}, code = code, options = {'workers': workers, 'profile': profile}),
+        # Model matrix
+        Stage('model_matrix', build_model_matrix, deps = ['features'], inputs = ['Data/finalgamedata'],
+              outputs = ['Data/modelmatrix'],
+              params = {'target_variables': target_variables, 'base_year': base_year}, code = code,
+              options = {'workers': workers, 'profile': profile}),
+    ]
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Build the NCAA football dataset")
+    parser.add_argument('targets', nargs = '*', help = "stages to build, with their dependencies (default all)")
+    parser.add_argument('--force', nargs = '+', default = [], metavar = 'STAGE', help = "run these stages even if up to date")
+    parser.add_argument('--jobs', type = int, default = os.cpu_count(), help = "stages to run at once")
+    parser.add_argument('--dry-run', action = 'store_true', help = "show what would run")
+    parser.add_argument('--list', action = 'store_true', help = "list the stages")
+    parser.add_argument('--yrs', type = int, nargs = '+', default = YRS, help = "program history windows")
+    parser.add_argument('--target-variables', nargs = '+', default = None, help = "model matrix game stat columns")
+    parser.add_argument('--base-year', type = int, default = 2013, help = "first year in the data")
+    parser.add_argument('--workers', type = int, default = 1, help = "processes for the feature stages")
+    parser.add_argument('--profile', action = 'store_true',
+                        help = "time and memory profile the dataset stages into .build/profile (runs one stage at a time)")
+    args = parser.parse_args(argv)
+
+    build = stages(yrs = args.yrs, target_variables = args.target_variables, base_year = args.base_year,
+                   workers = args.workers, profile = args.profile)
+    if args.list:
+        for stage in build:
+            print("%-20s <- %s" % (stage.name, ", ".join(stage.deps)))
+        return
+    # Stages running side by side would share the memory measurements
+    jobs = 1 if args.profile else args.jobs
+    run(build, targets = args.targets, force = set(args.force), jobs = jobs, dry_run = args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,632 @@
+import functools, hashlib, os, warnings, zipfile
+import numpy as np
+import pandas as pd
+from functions.functions import fixTOP_column, removeSlashes_column, teamhistory_table, coach_ledger, \
+coach_history_table, parse_opponent, parse_games, previous_yrs_table, opponent_stats_table, gamestats_features
+from functions.schema import apply_schemas
+from functions.profiling import NO_PROFILER
+from functions.parallel import teamhistory_parallel, coach_history_parallel, previous_yrs_parallel, \
+gamestats_features_parallel
+
+# Columns kept ahead of the stat columns in the merged game-by-game data
+ID_COLUMNS = ['Team', 'season_id', 'opponent_org_id']
+# Years of program history
+YRS = [1, 2, 3, 5, 10]
+COACH_VARIABLES = ['Coach_wins', 'Coach_losses', 'Coach_WL', 'Coach_years']
+RESULT_VARIABLES = ['HomeAway', 'WinLoss', 'TeamScore', 'OpponentScore', 'OT']
+GAME_KEYS = ['org_id', 'Date', 'OffenseDefense']
+SEASON_KEYS = ['org_id', 'year']
+# Columns of a coach page's rows naming the team and season it was crawled for
+CONTEXT_COLUMNS = ['Team', 'org_id', 'season_id']
+
+
+def read_history(zf):
+    """ Read the program history with a four digit year
+
+        Keyword arguments:
+
+        zf : scraped data zip file
+    """
+    history = pd.read_csv(zf.open('history.csv'))
+    # A history page crawled for several team names (links differing only in the name) gives its rows once per name
+    history = history.drop_duplicates([col for col in history.columns if col != 'Team'])
+    history['year'] = history['Year'].str[:4].astype(int)
+    return history
+
+
+def read_coach_links(links_dir):
+    """ Read the head coach links for each team and year
+
+        Keyword arguments:
+
+        links_dir : scrapy Links directory
+    """
+    path = os.path.join(links_dir, "links_teaminfo.csv")
+    coach_links = pd.read_csv(path)
+    if 'org_id' not in coach_links.columns:
+        raise ValueError("%s has no org_id column, rerun the PeopleHistoryRosterStats spider" % path)
+    coach_links = coach_links.rename(columns={"txt":"coach", 'team':"Team"})
+    coach_links = coach_links[coach_links.key == 'people'][['org_id', 'Team', 'coach', 'year']]
+    coach_links['year'] = coach_links.year - 1
+    return coach_links
+
+
+def coaches_by_team(coach_links):
+    """ Returns the list of coaches for each org_id and year (coaches fired in the season give more than one)
+
+        Keyword arguments:
+
+        coach_links : output of read_coach_links
+    """
+    return coach_links.groupby(['year', 'org_id'], sort = False)['coach'].apply(list).reset_index()
+
+
+def read_coaches(zf):
+    """ Read the coach records
+
+        Keyword arguments:
+
+        zf : scraped data zip file
+    """
+    coaches = pd.read_csv(zf.open('coaches.csv'))
+    # A coach page is crawled for every team and season linking to it, keep its rows once
+    coaches = coaches.drop_duplicates([col for col in coaches.columns if col not in CONTEXT_COLUMNS])
+    coaches['year'] = coaches['Year'].str[:4].astype(int) - 1
+    coaches.rename(columns = {'Name':'coach'}, inplace = True)
+    return coaches
+
+
+def roster_table(roster):
+    """ Returns the games played/started means by class for each org_id and year
+
+        Keyword arguments:
+
+        roster : roster data frame
+    """
+    roster = roster.copy()
+    roster['year'] = roster['Year'].str[:4].astype(int) - 1
+    roster_games_started = roster[['org_id', 'year', 'Yr', 'GS']].groupby(['org_id', 'year', "Yr"]).mean().reset_index()
+    roster_games_played = roster[['org_id', 'year', 'Yr', 'GP']].groupby(['org_id', 'year', "Yr"]).mean().reset_index()
+    roster_final = pd.merge(roster_games_played,
+                            roster_games_started,
+                            on = ['org_id', 'year', 'Yr'],
+                            how = 'left'
+                           )
+    roster_df = roster_final.set_index(['org_id', 'year', 'Yr']).unstack().reset_index()
+    roster_df.columns = [x[0] if x[0] in ['org_id', 'year'] else x[0] + "_" + x[1] for x in roster_df.columns.values]
+    return roster_df
+
+
+def read_zip_csv(zf, file, columns = None):
+    """ Read a CSV file from the scraped data zip
+
+        Keyword arguments:
+
+        zf : scraped data zip file
+        file : file name in the zip
+        columns : columns to read (default all)
+    """
+    return pd.read_csv(zf.open(file), usecols = columns)
+
+
+def read_parquet_dir(path, columns = None):
+    """ Read an item directory written by the scrapy ParquetPipeline
+
+        Keyword arguments:
+
+        path : item directory (Data/<item>)
+        columns : columns to read (default all)
+    """
+    table = pd.read_parquet(path, columns = columns)
+    if 'season' in table.columns and (columns is None or 'season' not in columns):
+        table = table.drop('season', axis = 1)
+    # Partition columns come back as categoricals
+    if 'org_id' in table.columns and pd.api.types.is_categorical_dtype(table['org_id']):
+        table['org_id'] = table['org_id'].astype(int)
+    return table
+
+
+def gamebygame_readers(source):
+    """ Returns (name, read) for each game-by-game stat file, read(columns = None) loads it as a DF
+
+        Keyword arguments:
+
+        source : scraped data zip file or a ParquetPipeline Data directory
+    """
+    if isinstance(source, zipfile.ZipFile):
+        return [(file.split(".")[0], functools.partial(read_zip_csv, source, file))
+                for file in source.namelist() if 'gamebygame' in file]
+    return [(name, functools.partial(read_parquet_dir, os.path.join(source, name)))
+            for name in sorted(os.listdir(source)) if name.startswith('gamebygame')]
+
+
+def game_keys(table):
+    """ Returns the (org_id, Date, OffenseDefense) MultiIndex of a game-by-game table
+
+        Keyword arguments:
+
+        table : game-by-game table with the GAME_KEYS columns
+    """
+    keys = table[GAME_KEYS].copy()
+    keys['Date'] = pd.to_datetime(keys['Date'])
+    return pd.MultiIndex.from_frame(keys)
+
+
+def combine_gamebygame(readers, profiler = None):
+    """ Merge the game-by-game stat files side by side on (org_id, Date, OffenseDefense)
+
+        Streams the files: the first pass reads only the key columns to build
+        the sorted union of the keys, the second reads one file at a time and
+        folds in the columns not seen in an earlier file, aligned to the keys.
+        Only the final frame and one file are in memory at once.  Rows whose
+        key appears more than once in a file are collisions: the first row is
+        kept and the rest are reported.
+
+        Returns the master DF (ids ahead of the stat columns) and a DF of the
+        colliding rows' file and keys.
+
+        Keyword arguments:
+
+        readers : output of gamebygame_readers
+        profiler : functions.profiling.Profiler to run the steps under
+    """
+    profiler = profiler or NO_PROFILER
+    keys = None
+    with profiler.stage('read_keys') as stage:
+        for name, read in readers:
+            file_keys = game_keys(read(columns = GAME_KEYS))
+            keys = file_keys.unique() if keys is None else keys.union(file_keys)
+        keys = stage.output(keys.unique().sort_values())
+
+    columns, collisions = {}, []
+    for name, read in readers:
+        with profiler.stage('read_file') as stage:
+            table = stage.output(read())
+        with profiler.stage('index_file', table) as stage:
+            table.index = game_keys(table)
+            table = table.drop(GAME_KEYS, axis = 1)
+            duplicated = table.index.duplicated(keep = 'first')
+            if duplicated.any():
+                collided = table.index[table.index.isin(table.index[duplicated])]
+                collisions.append(collided.to_frame(index = False).assign(file = name))
+                warnings.warn("%s: %d rows share a key with another row, keeping the first" % (name, duplicated.sum()))
+                table = table[~duplicated]
+            stage.output(table)
+
+        with profiler.stage('align_columns', table) as stage:
+            new_columns = [col for col in table.columns if col not in columns]
+            aligned = stage.output(table[new_columns].reindex(keys))
+            for col in new_columns:
+                columns[col] = aligned[col].to_numpy()
+        del table, aligned
+
+    # Keep the team name and ids ahead of the stat columns
+    with profiler.stage('wide_concat') as stage:
+        order = ID_COLUMNS + [x for x in columns if x not in ID_COLUMNS]
+        master = pd.DataFrame({col: columns[col] for col in order}, index = keys, copy = False)
+        master.index.names = GAME_KEYS
+        stage.output(master)
+    if collisions:
+        collisions = pd.concat(collisions, ignore_index = True)
+    else:
+        collisions = pd.DataFrame(columns = GAME_KEYS + ['file'])
+    return master, collisions
+
+
+def clean_master(master, profiler = None):
+    """ Standardize time of possession and remove the slashes in the stat columns
+
+        Keyword arguments:
+
+        master : output of combine_gamebygame
+        profiler : functions.profiling.Profiler to run the steps under
+    """
+    profiler = profiler or NO_PROFILER
+    master = master.copy()
+    with profiler.stage('fixTOP', master['TOP']) as stage:
+        master['TOP'] = stage.output(pd.to_timedelta(fixTOP_column(master['TOP']), unit = 's'))
+
+    cols = [x for x in master.columns if x not in ID_COLUMNS]
+    cols.pop(list(cols).index('TOP'))
+    with profiler.stage('removeSlashes', master[cols[3:]]) as stage:
+        master[cols[3:]] = stage.output(master[cols[3:]].apply(removeSlashes_column))
+    return master
+
+
+def game_numbers(data, start = None):
+    """ Number the games of each org_id and year in order
+
+        Keyword arguments:
+
+        data : games sorted by org_id and Date
+        start : DF of org_id, year, games already numbered (numbering continues after them)
+    """
+    numbers = data.groupby(SEASON_KEYS).cumcount() + 1
+    if start is not None:
+        offset = data[SEASON_KEYS].merge(start[SEASON_KEYS + ['games']], on = SEASON_KEYS, how = 'left')['games']
+        numbers = numbers + offset.fillna(0).astype(int).values
+    return numbers
+
+
+def build_gamestats(master, start = None, profiler = None):
+    """ Merge the offense and defense rows of each game into one row of game stats
+
+        Keyword arguments:
+
+        master : output of clean_master
+        start : passed to game_numbers
+        profiler : functions.profiling.Profiler to run the steps under
+    """
+    profiler = profiler or NO_PROFILER
+    with profiler.stage('offense_defense_split', master) as stage:
+        defense = master[master.index.get_level_values('OffenseDefense') == 'Defense'].copy()
+        offense = master[master.index.get_level_values('OffenseDefense') == 'Offense'].copy()
+        assert len(defense) == len(offense),  "Offense/Defense datasets different sizes"
+
+        offense.reset_index(inplace = True)
+        offense['year'] = offense['Date'].dt.year
+        offense.drop(['OffenseDefense', 'G', 'Result'], axis = 1, inplace = True)
+
+        # Relabel defense columns to defense
+        defense.columns = ['def_' + x for x in defense.columns]
+        defense.reset_index(inplace = True)
+        defense['year'] = defense['Date'].dt.year
+        defense.drop(['OffenseDefense', 'def_G', 'def_Result'] + ['def_' + x for x in ID_COLUMNS], axis = 1, inplace = True)
+        stage.output((offense, defense))
+
+    with profiler.stage('offense_defense_merge', offense, defense) as stage:
+        gamestats = stage.output(pd.merge(offense,
+                                          defense,
+                                          on = ['org_id', 'Date', 'year'],
+                                          how = 'left'
+                                         ))
+    assert len(gamestats) == len(offense), "Size change during merging"
+
+    gamestats = gamestats.sort_values(['org_id', 'Date'], kind = 'mergesort').reset_index(drop = True)
+    gamestats['gamenumber'] = game_numbers(gamestats, start)
+    return gamestats
+
+
+def team_names(participation):
+    """ Returns the team name of each org_id
+
+        Keyword arguments:
+
+        participation : game-by-game participation data frame
+    """
+    return participation.drop_duplicates('org_id').set_index('org_id')['Team']
+
+
+def build_gamelist(participation, history, coaches_list, coaches, yrs = YRS, teamnames = None, start = None,
+                   workers = 1, profiler = None):
+    """ Build the game list with the opponent, program history, coach history and result variables
+
+        Keyword arguments:
+
+        participation : game-by-game participation data frame
+        history : output of read_history
+        coaches_list : output of coaches_by_team
+        coaches : output of read_coaches
+        yrs : years of program history
+        teamnames : org_id -> team name for the opponents (default: the teams in participation)
+        start : passed to game_numbers
+        workers : processes for the history and coach features (see functions.parallel)
+        profiler : functions.profiling.Profiler to run the steps under
+    """
+    profiler = profiler or NO_PROFILER
+    gamelist = participation.copy()
+    gamelist['Date'] = pd.to_datetime(gamelist['Date'])
+    gamelist['year'] = gamelist['Date'].dt.year
+    gamelist = gamelist[gamelist.OffenseDefense == 'Offense']
+    gamelist = gamelist.sort_values(['org_id', 'Date'], kind = 'mergesort').reset_index(drop = True)
+    gamelist['gamenumber'] = game_numbers(gamelist, start)
+
+    # Opponent
+    gamelist['Opponent2'] = parse_opponent(gamelist['Opponent'])
+    if teamnames is None:
+        teamnames = team_names(gamelist)
+    gamelist['opponentName'] = gamelist['opponent_org_id'].map(teamnames).fillna('Missing')
+
+    # Program history
+    with profiler.stage('teamhistory', history, gamelist) as stage:
+        if workers > 1:
+            history_table = teamhistory_parallel(history, yrs, gamelist[['org_id', 'year']], team = 'org_id', workers = workers)
+        else:
+            history_table = teamhistory_table(history, yrs, gamelist[['org_id', 'year']], team = 'org_id')
+        gamelist = stage.output(gamelist.merge(history_table, on = ['org_id', 'year'], how = 'left'))
+
+    # Coaching history
+    with profiler.stage('coach_history', coaches, gamelist) as stage:
+        gamelist = gamelist.merge(coaches_list, on = ['org_id', 'year'], how = 'left')
+        gamelistOut = gamelist.copy()
+        if workers > 1:
+            gamelistOut[COACH_VARIABLES] = coach_history_parallel(gamelist, coach_ledger(coaches), team = 'org_id', workers = workers)
+        else:
+            gamelistOut[COACH_VARIABLES] = coach_history_table(gamelist, coach_ledger(coaches))
+        stage.output(gamelistOut[COACH_VARIABLES])
+
+    # HomeAway and Win/Loss
+    with profiler.stage('parse_games', gamelistOut) as stage:
+        gamelistOut[RESULT_VARIABLES] = stage.output(parse_games(gamelistOut)[RESULT_VARIABLES])
+    gamelistOut.drop(['G', 'OffenseDefense', 'Opponent2'], axis = 1, inplace = True)
+    return gamelistOut
+
+
+def frame_hash(data):
+    """ Returns an int64 hash of a data frame's columns and values
+
+        Keyword arguments:
+
+        data : data frame
+    """
+    digest = hashlib.sha1(repr(list(data.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(data.astype(str), index = False).values.tobytes())
+    return np.frombuffer(digest.digest()[:8], dtype = 'int64')[0]
+
+
+def row_hashes(master):
+    """ Returns an int64 hash of every raw game-by-game row keyed on (org_id, Date, OffenseDefense)
+
+        Keyword arguments:
+
+        master : output of combine_gamebygame
+    """
+    hashes = pd.util.hash_pandas_object(master, index = False)
+    out = master.index.to_frame(index = False)
+    out['hash'] = hashes.values.view('int64')
+    return out
+
+
+def dataset_tables(gamelist, gamestats, rowhash, inputs):
+    """ Collect the feature store tables of a build
+
+        Returns the game list and stats cast to their schema (functions.schema)
+        plus the state update_dataset compares the next build with: the row
+        hashes, the input hashes and aggregates, the number of games and last
+        game Date of every org_id and year.
+
+        Keyword arguments:
+
+        gamelist : output of build_gamelist
+        gamestats : output of build_gamestats
+        rowhash : output of row_hashes
+        inputs : output of input_hashes
+    """
+    typed = apply_schemas({'gameslist': gamelist, 'gamestats': gamestats})
+    gamelist, gamestats = typed['gameslist'], typed['gamestats']
+    aggregates = gamestats.groupby(SEASON_KEYS).agg(games = ('Date', 'size'), last_Date = ('Date', 'max')).reset_index()
+    return {'gameslist': gamelist,
+            'gamestats': gamestats,
+            'rowhash': rowhash,
+            'aggregates': aggregates,
+            'inputs': inputs,
+           }
+
+
+def load_inputs(zip_file, links_dir):
+    """ Read the scraped data needed to build the dataset
+
+        Keyword arguments:
+
+        zip_file : scraped data zip file path
+        links_dir : scrapy Links directory
+    """
+    zf = zipfile.ZipFile(zip_file)
+    return {'history': read_history(zf),
+            'coach_links': read_coach_links(links_dir),
+            'coaches': read_coaches(zf),
+            'participation': pd.read_csv(zf.open('gamebygame_participation.csv')),
+            'gamebygame': gamebygame_readers(zf),
+           }
+
+
+def input_hashes(inputs):
+    """ Returns a DF of name, hash for the inputs every game's features depend on """
+    names = ['history', 'coach_links', 'coaches']
+    return pd.DataFrame({'name': names, 'hash': [frame_hash(inputs[name]) for name in names]})
+
+
+def build_dataset(inputs, profiler = None):
+    """ Build every table of the dataset from scratch
+
+        Keyword arguments:
+
+        inputs : output of load_inputs
+        profiler : functions.profiling.Profiler to run the stages under
+    """
+    profiler = profiler or NO_PROFILER
+    with profiler.stage('combine_gamebygame') as stage:
+        master, collisions = stage.output(combine_gamebygame(inputs['gamebygame'], profiler = profiler))
+    with profiler.stage('clean_master', master) as stage:
+        clean = stage.output(clean_master(master, profiler = profiler))
+    with profiler.stage('build_gamestats', clean) as stage:
+        gamestats = stage.output(build_gamestats(clean, profiler = profiler))
+    del clean
+    with profiler.stage('build_gamelist', inputs['participation']) as stage:
+        gamelist = stage.output(build_gamelist(inputs['participation'],
+                                               inputs['history'],
+                                               coaches_by_team(inputs['coach_links']),
+                                               inputs['coaches'],
+                                               profiler = profiler
+                                              ))
+    with profiler.stage('row_hashes', master) as stage:
+        rowhash = stage.output(row_hashes(master))
+    with profiler.stage('dataset_tables', gamelist, gamestats) as stage:
+        return stage.output(dataset_tables(gamelist, gamestats, rowhash, input_hashes(inputs)))
+
+
+def changed_seasons(rowhash, previous):
+    """ Compare the raw row hashes with the previous build
+
+        Returns the changed (org_id, Date) games and a DF of the org_id, year
+        seasons they fall in.  append is True for seasons whose only changes
+        are new games after the last game of the previous build, which can be
+        numbered on from the stored game count; the other seasons are rebuilt.
+
+        Keyword arguments:
+
+        rowhash : output of row_hashes for the new data
+        previous : tables from the previous build (rowhash, aggregates)
+    """
+    compare = rowhash.merge(previous['rowhash'], on = GAME_KEYS, how = 'outer', suffixes = ('', '_old'), indicator = True)
+    changed = compare[(compare['_merge'] != 'both') | (compare['hash'] != compare['hash_old'])].copy()
+    changed['year'] = changed['Date'].dt.year
+    changed['new'] = changed['_merge'] == 'left_only'
+
+    seasons = changed.groupby(SEASON_KEYS).agg(new = ('new', 'all'), first_Date = ('Date', 'min')).reset_index()
+    seasons = seasons.merge(previous['aggregates'], on = SEASON_KEYS, how = 'left')
+    seasons['append'] = seasons['new'] & (seasons['first_Date'] > seasons['last_Date'])
+    return changed[['org_id', 'Date']].drop_duplicates(), seasons
+
+
+def select_games(data, games, seasons):
+    """ Returns a mask of the rows in rebuilt seasons or in appended games
+
+        Keyword arguments:
+
+        data : DF with org_id, Date and year
+        games : changed (org_id, Date) games
+        seasons : output of changed_seasons
+    """
+    keys = pd.MultiIndex.from_frame(data[SEASON_KEYS])
+    rebuild = keys.isin(pd.MultiIndex.from_frame(seasons.loc[~seasons['append'], SEASON_KEYS]))
+    append = keys.isin(pd.MultiIndex.from_frame(seasons.loc[seasons['append'], SEASON_KEYS]))
+    new = pd.MultiIndex.from_frame(data[['org_id', 'Date']]).isin(pd.MultiIndex.from_frame(games))
+    return rebuild | (append & new)
+
+
+def update_dataset(inputs, previous, profiler = None):
+    """ Update a previous build, computing features only for new or changed games
+
+        Raw game-by-game rows are hashed and compared with the hashes stored
+        with the previous build.  New games after the end of a stored season
+        are numbered on from the stored game count and only those rows are
+        built; seasons with edited, removed or back-filled games are rebuilt
+        whole.  Opponent names are remapped for every row since new teams can
+        appear.  A change to the history or coach inputs rebuilds everything.
+
+        Returns the same tables as build_dataset.  Unchanged rows keep the
+        types they were loaded with from the feature store, so new rows have
+        their time of possession converted to seconds to match.
+
+        Keyword arguments:
+
+        inputs : output of load_inputs
+        previous : tables of the previous build (e.g. read back with featurestore.read_store)
+        profiler : functions.profiling.Profiler to run the stages under
+    """
+    inputs_hash = input_hashes(inputs)
+    if not inputs_hash['hash'].equals(previous['inputs']['hash']):
+        return build_dataset(inputs, profiler = profiler)
+
+    master, collisions = combine_gamebygame(inputs['gamebygame'], profiler = profiler)
+    rowhash = row_hashes(master)
+    games, seasons = changed_seasons(rowhash, previous)
+    if games.empty:
+        return dataset_tables(previous['gameslist'], previous['gamestats'], rowhash, inputs_hash)
+    start = seasons.loc[seasons['append'], SEASON_KEYS + ['games']]
+    rebuild = seasons.loc[~seasons['append'], SEASON_KEYS]
+
+    # Game stats
+    master_keys = master.index.to_frame(index = False)
+    master_keys['year'] = master_keys['Date'].dt.year
+    new_stats = build_gamestats(clean_master(master[select_games(master_keys, games, seasons)], profiler = profiler),
+                                start = start, profiler = profiler)
+
+    # Game list
+    participation = inputs['participation'].copy()
+    participation['Date'] = pd.to_datetime(participation['Date'])
+    participation['year'] = participation['Date'].dt.year
+    teamnames = team_names(participation[participation.OffenseDefense == 'Offense'])
+    new_list = build_gamelist(participation[select_games(participation, games, seasons)].drop('year', axis = 1),
+                              inputs['history'],
+                              coaches_by_team(inputs['coach_links']),
+                              inputs['coaches'],
+                              teamnames = teamnames,
+                              start = start,
+                              profiler = profiler
+                             )
+
+    tables = {}
+    for name, new in [('gameslist', new_list), ('gamestats', new_stats)]:
+        old = previous[name]
+        keep = ~pd.MultiIndex.from_frame(old[SEASON_KEYS]).isin(pd.MultiIndex.from_frame(rebuild))
+        out = pd.concat([old[keep], new], ignore_index = True, sort = False)
+        tables[name] = out.sort_values(['org_id', 'Date'], kind = 'mergesort').reset_index(drop = True)
+
+    tables['gameslist']['opponentName'] = tables['gameslist']['opponent_org_id'].map(teamnames).fillna('Missing')
+    return dataset_tables(tables['gameslist'], tables['gamestats'], rowhash, inputs_hash)
+
+
+def target_columns(gamestats):
+    """ Returns the game stat columns used as model targets (RushNetYards onward)
+
+        Keyword arguments:
+
+        gamestats : gamestats dataframe
+    """
+    cols = list(gamestats.columns)
+    target_variables = cols[cols.index('RushNetYards'):]
+    return [x for x in target_variables if x not in ['def_Opponent', 'gamenumber', 'year']]
+
+
+def model_matrix(gamelist, gamestats, target_variables = None, base_year = 2013, workers = 1, profiler = None):
+    """ Build the modelling dataset: each game with the team's and opponent's previous stats
+
+        Follows the data preparation in Models.ipynb.  The first game of
+        base_year has no previous season and is left out.
+
+        Keyword arguments:
+
+        gamelist : game list from the feature store
+        gamestats : game stats from the feature store
+        target_variables : game stat columns to average (default target_columns)
+        base_year : first year in the data
+        workers : processes for the previous year features (see functions.parallel)
+        profiler : functions.profiling.Profiler to run the steps under
+    """
+    profiler = profiler or NO_PROFILER
+    if target_variables is None:
+        target_variables = target_columns(gamestats)
+    teamlist = list(gamelist['org_id'].unique())
+
+    # The opponent's game list data, relabeled
+    opponent_game_list_data = gamelist.drop(['Opponent', 'Result', 'year', 'opponentName', 'opponent_org_id'], axis = 1)
+    opponent_game_list_data = opponent_game_list_data.rename(columns = {'org_id':'opponent_org_id'})
+    opponent_game_list_data.columns = ['opp_'+ x if x not in ['Date', 'opponent_org_id'] else x
+                                       for x in list(opponent_game_list_data.columns)]
+    gamelist = gamelist.merge(opponent_game_list_data, on = ['opponent_org_id', 'Date'], how = 'left')
+
+    # Fill in game stats missing variables with zeros
+    gamestats = gamestats.copy()
+    gamestats[target_variables] = gamestats[target_variables].fillna(value = 0, axis = 'columns')
+
+    base_year_mask = ~((gamelist.year == base_year) & (gamelist['gamenumber'] == 1))
+    with profiler.stage('previous_yrs', gamelist, gamestats) as stage:
+        if workers > 1:
+            gamelist[target_variables] = previous_yrs_parallel(gamelist[base_year_mask], target_variables, gamestats,
+                                                               team = 'org_id', workers = workers)
+        else:
+            gamelist[target_variables] = previous_yrs_table(gamelist[base_year_mask],
+                                                            cols = target_variables,
+                                                            gamestats = gamestats,
+                                                            team = 'org_id'
+                                                           )
+        stage.output(gamelist[target_variables])
+    with profiler.stage('gamestats_features', gamestats) as stage:
+        if workers > 1:
+            features = gamestats_features_parallel(target_variables, gamestats, team = 'org_id', workers = workers)
+        else:
+            features = gamestats_features(target_variables, gamestats, team = 'org_id')
+        stage.output(features)
+    games = gamelist[base_year_mask].copy()
+    with profiler.stage('opponent_stats', games) as stage:
+        games[['opp_' + x for x in target_variables]] = stage.output(opponent_stats_table(gamelist,
+                                                                                          cols = target_variables,
+                                                                                          gamestats = gamestats,
+                                                                                          teamlist = teamlist,
+                                                                                          features = features,
+                                                                                          opponent = 'opponent_org_id',
+                                                                                          team = 'org_id'
+                                                                                         ))
+    return games
@@ -0,0 +1,174 @@
+import json, os, shutil
+import numpy as np
+import pandas as pd
+
+# Feature store layout
+#
+#   <path>/manifest.json              tables -> rows and column specs
+#   <path>/<table>/<n>.npy            one contiguous array per column
+#
+# Column kinds
+#
+#   numeric : the values (integers downcast to the smallest type, float32 kept, other numbers and
+#             nullable integers as float64)
+#   datetime : int64 nanoseconds
+#   seconds : timedeltas as float64 seconds
+#   categorical : integer codes (-1 for missing), the categories are kept in the manifest and
+#                 shared by every table with a column of the same name so the codes line up
+#                 in merges between tables
+#   json : lists (e.g. the coaches of a game) as codes of their JSON encodings, kept in the
+#          manifest like the categories and decoded back to lists by read_store
+
+MANIFEST = 'manifest.json'
+
+
+def is_categorical(column):
+    """Return True if the column is stored as categorical codes"""
+    return not (pd.api.types.is_numeric_dtype(column) or pd.api.types.is_bool_dtype(column) or 
+                pd.api.types.is_datetime64_dtype(column) or pd.api.types.is_timedelta64_dtype(column))
+
+
+def is_json(column):
+    """Return True if the column holds lists (or dicts) stored as JSON"""
+    return column.dtype == object and column.map(lambda x: isinstance(x, (list, tuple, dict))).any()
+
+
+def json_encoded(column):
+    """Return the JSON encodings of the values of a column (missing values stay missing)"""
+    return column.map(json.dumps, na_action = 'ignore')
+
+
+def shared_categories(tables):
+    """Return the sorted union of the categories of each categorical column name across tables"""
+    categories = {}
+    for table in tables.values():
+        for col in table.columns:
+            if is_json(table[col]):
+                categories.setdefault(col, set()).update(json_encoded(table[col]).dropna().unique())
+            elif is_categorical(table[col]):
+                categories.setdefault(col, set()).update(table[col].dropna().astype(str).unique())
+    return {col: sorted(values) for col, values in categories.items()}
+
+
+def json_values(codes, categories):
+    """Return the decoded values of a json column's codes (None for -1)"""
+    decoded = np.empty(len(categories) + 1, dtype = object)
+    for idx, category in enumerate(categories):
+        decoded[idx] = json.loads(category)
+    return decoded[codes]
+
+
+def column_spec(column, categories = None):
+    """Return the manifest entry and array for a column
+
+    Keyword arguments:
+
+    column : pandas series
+    categories : categories for a categorical column (default the column's own)
+    """
+    if pd.api.types.is_bool_dtype(column) and not column.isnull().any():
+        return {'kind': 'numeric'}, column.to_numpy(dtype = bool)
+    if pd.api.types.is_integer_dtype(column) and not column.isnull().any():
+        values = pd.to_numeric(column.astype('int64'), downcast = 'integer')
+        return {'kind': 'numeric'}, values.to_numpy()
+    if column.dtype == np.float32:
+        return {'kind': 'numeric'}, column.to_numpy()
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        return {'kind': 'numeric'}, column.to_numpy(dtype = 'float64', na_value = np.nan)
+    if pd.api.types.is_datetime64_dtype(column):
+        return {'kind': 'datetime'}, column.to_numpy().view('int64')
+    if pd.api.types.is_timedelta64_dtype(column):
+        return {'kind': 'seconds'}, column.dt.total_seconds().to_numpy()
+
+    if is_json(column):
+        column = json_encoded(column)
+        kind = 'json'
+    else:
+        if column.dtype == object:
+            # Read back as strings, so only strings round-trip
+            types = set(column.dropna().map(type)) - {str}
+            if types:
+                raise TypeError("%s: %s values would be read back as strings" %
+                                (column.name, ', '.join(sorted(t.__name__ for t in types))))
+        column = column.astype(object)
+        column = column.where(column.isnull(), column.astype(str))
+        kind = 'categorical'
+    if categories is None:
+        categories = sorted(column.dropna().unique())
+    codes = pd.Categorical(column, categories = categories).codes
+    return {'kind': kind}, codes
+
+
+def write_store(path, tables):
+    """Write DataFrames to a memory mappable feature store, replacing any store already at path
+
+    Keyword arguments:
+
+    path : store directory
+    tables : dict of table name -> DataFrame
+    """
+    tmp = path.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp, ignore_errors = True)
+    categories = shared_categories(tables)
+    manifest = {'tables': {}, 'categories': categories}
+    for name, table in tables.items():
+        os.makedirs(os.path.join(tmp, name))
+        columns = []
+        for idx, col in enumerate(table.columns):
+            spec, values = column_spec(table[col], categories.get(col))
+            spec.update({'name': col, 'file': os.path.join(name, '%d.npy' % idx), 'dtype': str(values.dtype)})
+            np.save(os.path.join(tmp, spec['file']), np.ascontiguousarray(values))
+            columns.append(spec)
+        manifest['tables'][name] = {'rows': len(table), 'columns': columns}
+
+    with open(os.path.join(tmp, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent = 1)
+
+    # Swap the new store in only once it is complete
+    shutil.rmtree(path, ignore_errors = True)
+    os.rename(tmp, path)
+
+
+def read_manifest(path):
+    """Return the manifest of the feature store at path"""
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def read_store(path, name, columns = None, mmap = True):
+    """Load a table from the feature store
+
+    Numeric, datetime and categorical code arrays are memory mapped read only
+    and wrapped without copying, so several processes loading the same store
+    share one copy of the data through the page cache. Timedeltas come back as
+    float seconds, json columns as the decoded lists.
+
+    Keyword arguments:
+
+    path : store directory
+    name : table name
+    columns : list of columns to load (default all)
+    mmap : memory map the arrays (False reads them into memory)
+    """
+    manifest = read_manifest(path)
+    table = manifest['tables'][name]
+    specs = table['columns']
+    if columns is not None:
+        lookup = {spec['name']: spec for spec in specs}
+        missing = [col for col in columns if col not in lookup]
+        if missing:
+            raise KeyError("Columns not in %s: %s" % (name, missing))
+        specs = [lookup[col] for col in columns]
+
+    data = {}
+    for spec in specs:
+        values = np.load(os.path.join(path, spec['file']), mmap_mode = 'r' if mmap else None)
+        if spec['kind'] == 'datetime':
+            values = values.view('datetime64[ns]')
+        elif spec['kind'] == 'categorical':
+            values = pd.Categorical.from_codes(values, categories = manifest['categories'][spec['name']])
+        elif spec['kind'] == 'json':
+            values = json_values(values, manifest['categories'][spec['name']])
+        data[spec['name']] = values
+
+    return pd.DataFrame(data, index = pd.RangeIndex(table['rows']), copy = False)
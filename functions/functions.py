@@ -1,6 +1,19 @@
 import datetime, re
+import numpy as np
 import pandas as pd
 
+# Patterns for the game-by-game Opponent and Result columns
+REGEXS = {'WL': re.compile(r"[WL]"),
+          'team': re.compile(r"(\d+)\s\-"),
+          'opponent_score': re.compile(r"\-\s(\d+)"),
+          'OT': re.compile(r"\((\d+)OT\)"),
+          'opponent': re.compile(r"[\w\s]+\.?\s\@\s\w+"),
+         }
+RESULT_REGEX = re.compile(r"(?P<WinLoss>[WL])"
+                          r"(?:.*?(?P<TeamScore>\d+)\s\-\s(?P<OpponentScore>\d+))?"
+                          r"(?:.*?\((?P<OT>\d+)OT\))?"
+                         )
+
 def yrRecode(data): 
     """ Returns a numeric value for Fr, So, Jr, Sr
 
@@ -40,6 +53,72 @@ def teamhistory(team, year, duration, history):
     return pd.Series(out)
 
 
+def teamhistory_columns(duration):
+    """ Returns the column names created by teamhistory/teamhistory_table
+
+        Keyword arguments:
+
+        duration : how many years of history to look at
+    """
+    variables = ['history_wins_{yr}yrs', 'history_losses_{yr}yrs', 'history_WL_{yr}yrs']
+    columns = [v.format(yr = yr) for yr in duration for v in variables]
+    columns.extend([v.format(yr = 'max') for v in variables])
+    return columns
+
+
+def teamhistory_table(history, duration, targets = None, team = 'Team'):
+    """ Calculates teamhistory for every (Team, year) at once using cumulative sums
+
+        Returns a DF with Team, year and the teamhistory_columns that can be
+        merged back onto the game list.  Values match teamhistory, except a
+        window with no games gives a WL of NaN instead of raising.
+
+        Keyword arguments:
+
+        history : history data frame
+        duration : how many years of history to look at
+        targets : DF with team and year columns to calculate (default: every
+                  team, year in history)
+        team : team key column (Team or org_id)
+    """
+    if targets is None:
+        targets = history[[team, 'year']]
+    out = targets[[team, 'year']].drop_duplicates().reset_index(drop = True)
+
+    # Running totals per team in year order
+    totals = history.groupby([team, 'year'])[['Wins', 'Losses']].sum().sort_index()
+    running = totals.groupby(level = team).cumsum().reset_index()
+    running['year'] = running['year'].astype('int64')
+    running[team] = running[team].astype(object)
+    running = running.sort_values('year')
+
+    def running_total(bound):
+        # Wins/losses from the first season up to and including bound
+        left = pd.DataFrame({team: out[team].astype(object),
+                             'year': bound.astype('int64'),
+                             'row': out.index
+                            }).sort_values('year')
+        found = pd.merge_asof(left, running, on = 'year', by = team, direction = 'backward')
+        found = found.set_index('row').sort_index()[['Wins', 'Losses']]
+        return found.fillna(0).astype(float)
+
+    upper = running_total(out['year'])
+    columns = iter(teamhistory_columns(duration))
+    for yr in duration:
+        window = upper - running_total(out['year'] - yr - 1)
+        out[next(columns)] = window['Wins']
+        out[next(columns)] = window['Losses']
+        out[next(columns)] = window['Wins'] / (window['Wins'] + window['Losses'])
+
+    # Max
+    overall = totals.groupby(level = team).sum().astype(float)
+    overall = overall.reindex(out[team]).fillna(0).reset_index(drop = True)
+    out[next(columns)] = overall['Wins']
+    out[next(columns)] = overall['Losses']
+    out[next(columns)] = overall['Wins'] / (overall['Wins'] + overall['Losses'])
+    return out
+
+
 def fixTOP(row):
     """ Standardize the time of possession so it's all hh:mm:ss time delta format 
         
@@ -47,17 +126,28 @@ def fixTOP(row):
 
         row : row data 
     """
-    if isinstance(row, str) == True and ":" in row: 
-        _all = row.split(":")
-        _min = int(_all[0]) * 60 
-        _sec = int(_all[1]) 
-        total_seconds = _min + _sec
-    else: 
-        total_seconds = int(row)
+    total_seconds = int(fixTOP_column(pd.Series([row], dtype = object))[0])
     val = "{}".format(datetime.timedelta(seconds=total_seconds))
     return pd.Series([val])
 
 
+def fixTOP_column(column):
+    """ Convert a time of possession column (mm:ss or seconds) to integer seconds
+
+        Keyword arguments:
+
+        column : TOP series
+    """
+    text = column.astype(str)
+    clock = text.str.contains(":", regex = False) & column.notnull()
+    seconds = np.trunc(pd.to_numeric(column.where(~clock)))
+    if clock.any():
+        parts = text.where(clock).str.split(":", expand = True)
+        clock_seconds = pd.to_numeric(parts[0]) * 60 + pd.to_numeric(parts[1])
+        seconds = seconds.where(~clock, clock_seconds)
+    return seconds.astype('Int64')
+
+
 
 def removeSlashes(row, cols):
     """ Remove slashes from variables
@@ -72,13 +162,30 @@ def removeSlashes(row, cols):
     for cell in cols[3:]:
         if cell == 'TOP': 
             out.append(row[cell])
-        elif isinstance(row[cell], str) and '/' in row[cell]:
-            tmp = row[cell].replace("/", "")
-            out.append(float(tmp))
         else: 
-            out.append(row[cell])
+            out.append(removeSlashes_column(pd.Series([row[cell]], dtype = object), numeric = False)[0])
     return pd.Series(out)
 
+
+def removeSlashes_column(column, numeric = True):
+    """ Remove slashes from a column and convert it to numeric
+
+        Keyword arguments:
+
+        column : series to remove slashes from
+        numeric : if True convert the column with pd.to_numeric, if False only
+                  the values that had slashes are converted
+    """
+    if column.dtype == object:
+        text = column.astype(str)
+        slashes = text.str.contains("/", regex = False) & column.notnull()
+        if slashes.any():
+            fixed = text.where(slashes).str.replace("/", "", regex = False).astype(float)
+            column = column.where(~slashes, fixed)
+    if numeric:
+        column = pd.to_numeric(column)
+    return column
+
 def coach_history(data, year, coaches): 
     """ Create coach history  
  
@@ -117,6 +224,64 @@ def coach_history(data, year, coaches):
                         })
     return out
 
+
+def coach_ledger(coaches):
+    """ Create a running career record for every coach and year
+
+        Each row holds the coach's record up to and including that year so
+        the record before a year is a single lookup.
+
+        Keyword arguments:
+
+        coaches : coaches dataframe
+
+    """
+    ledger = coaches[['coach', 'year']].copy()
+    ledger['Wins'] = coaches['Wins'].fillna(0)
+    ledger['Losses'] = coaches['Losses'].fillna(0)
+    ledger['WL_sum'] = coaches['WL'].fillna(0)
+    ledger['WL_count'] = coaches['WL'].notnull().astype('int64')
+    ledger['Coach_years'] = 1
+    ledger = ledger.groupby(['coach', 'year']).sum().sort_index()
+    ledger = ledger.groupby(level = 'coach').cumsum().reset_index()
+
+    ledger['Coach_WL'] = ledger['WL_sum'] / ledger['WL_count'].where(ledger['WL_count'] > 0)
+    ledger.rename(columns = {'Wins':'Coach_wins', 'Losses':'Coach_losses'}, inplace = True)
+    return ledger[['coach', 'year', 'Coach_wins', 'Coach_losses', 'Coach_WL', 'Coach_years']]
+
+
+def coach_history_table(gamelist, ledger):
+    """ Calculate coach_history for every game at once
+
+        Returns a DF with the coach variables aligned to the gamelist index.
+
+        Keyword arguments:
+
+        gamelist : games of interest (coach list, year)
+        ledger : output of coach_ledger
+
+    """
+    coach_variables = ['Coach_wins', 'Coach_losses', 'Coach_WL', 'Coach_years']
+    games = pd.DataFrame({'coach': gamelist['coach'].values,
+                          'year': gamelist['year'].values,
+                          'row': range(len(gamelist))
+                         }).explode('coach').dropna(subset = ['coach'])
+    games['year'] = games['year'].astype('int64')
+
+    ledger = ledger.copy()
+    ledger['year'] = ledger['year'].astype('int64')
+    records = pd.merge_asof(games.sort_values('year'),
+                            ledger.sort_values('year'),
+                            on = 'year',
+                            by = 'coach',
+                            allow_exact_matches = False,
+                            direction = 'backward'
+                           )
+    out = records.groupby('row')[coach_variables].mean()
+    out = out.reindex(range(len(gamelist)))
+    out.index = gamelist.index
+    return out
+
 def previous_yrs(team, year, game, cols, gamestats, debug = False): 
     """ Calculate the previous years 
 
@@ -154,6 +319,72 @@ def previous_yrs(team, year, game, cols, gamestats, debug = False):
         return mean
 
 
+def previous_yrs_table(gamelist, cols, gamestats, debug = None, team = 'Team'):
+    """ Calculate previous_yrs for every game in the game list at once
+
+        Uses running sums/counts per team and year instead of filtering
+        gamestats for each game.  Returns a DF with cols aligned to the
+        gamelist index.
+
+        Keyword arguments:
+
+        gamelist : games of interest (team, year, gamenumber)
+        cols : columns of interest
+        gamestats : gamestats dataframe
+        debug : gamelist index label; if set return the DF of rows used for that game (looked up by Team)
+        team : team key column (Team or org_id, which follows a program through a rename)
+
+    """
+    if debug is not None:
+        game = gamelist.loc[debug]
+        return previous_yrs(team = game['Team'],
+                            year = game['year'],
+                            game = game['gamenumber'],
+                            cols = cols,
+                            gamestats = gamestats,
+                            debug = True
+                           )
+
+    keys = [team, 'year']
+    stats = gamestats[keys + ['gamenumber'] + cols].copy()
+    stats['year'] = stats['year'].astype('int64')
+    sums = ['sum_' + col for col in cols]
+    counts = ['count_' + col for col in cols]
+    stats[counts] = stats[cols].notnull().astype('int64').values
+    stats[sums] = stats[cols].fillna(0).astype(float).values
+    stats.sort_values(keys + ['gamenumber'], inplace = True)
+
+    # Current season running totals up to and including each game
+    running = stats[keys + ['gamenumber']].copy()
+    running[sums + counts] = stats.groupby(keys, observed = True)[sums + counts].cumsum()
+    running['gamenumber'] = running['gamenumber'].astype('int64')
+    running.sort_values('gamenumber', inplace = True)
+
+    games = gamelist[keys + ['gamenumber']].copy()
+    games['year'] = games['year'].astype('int64')
+    games['gamenumber'] = games['gamenumber'].astype('int64')
+    games['row'] = range(len(games))
+    current = pd.merge_asof(games.sort_values('gamenumber'),
+                            running,
+                            on = 'gamenumber',
+                            by = keys,
+                            direction = 'backward'
+                           ).set_index('row').sort_index()
+    current.loc[current['gamenumber'] == 1, sums + counts] = 0
+
+    # Previous season totals for the first three games
+    season = stats.groupby(keys, observed = True)[sums + counts].sum().reset_index()
+    season['year'] = season['year'] + 1
+    previous = games.merge(season, on = keys, how = 'left').set_index('row').sort_index()
+    previous.loc[previous['gamenumber'] > 3, sums + counts] = 0
+
+    total_sums = current[sums].fillna(0).values + previous[sums].fillna(0).values
+    total_counts = current[counts].fillna(0).values + previous[counts].fillna(0).values
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        means = total_sums / total_counts
+    return pd.DataFrame(means, index = gamelist.index, columns = cols)
+
+
 
 def extract_name(data, varname):
     """ Extract team name from variable 
@@ -163,12 +394,10 @@ def extract_name(data, varname):
         varname : variable name of interest
         
     """
-  
-    regex = '[\w\s]+\.?\s\@\s\w+'
 
     # Opponent 
     if '@' in data[varname]: 
-        search = re.search(regex, data[varname]) 
+        search = REGEXS['opponent'].search(data[varname]) 
         if search: 
             opponent = data[varname].split("@")[0].strip()
         else: 
@@ -200,6 +429,55 @@ def opponent_stats(team, date, year, cols, gamestats, debug = False):
                        )
 
 
+def gamestats_features(cols, gamestats, team = 'Team'):
+    """ Calculate previous_yrs for every game in gamestats, keyed by team and Date
+
+        Keyword arguments:
+
+        cols : columns of interest
+        gamestats : gamestats dataframe
+        team : team key column for the index (Team or org_id)
+
+    """
+    features = previous_yrs_table(gamestats, cols = cols, gamestats = gamestats)
+    features.index = pd.MultiIndex.from_arrays([gamestats[team], gamestats['Date']])
+    return features[~features.index.duplicated()]
+
+
+def opponent_stats_table(gamelist, cols, gamestats, teamlist = None, features = None, prefix = 'opp_',
+                         opponent = 'opponentName', team = 'Team'):
+    """ Attach the opponent's game-by-game stats to every game with one merge
+
+        Returns a DF of prefixed cols aligned to the gamelist index.  Games
+        whose opponent is not in teamlist are left as NaN.
+
+        Keyword arguments:
+
+        gamelist : games of interest (opponent, Date)
+        cols : columns of interest
+        gamestats : gamestats dataframe
+        teamlist : teams with stats (default: every team in gamestats)
+        features : output of gamestats_features, built if not passed in
+        prefix : prefix added to the column names
+        opponent : opponent key column in gamelist (opponentName or opponent_org_id)
+        team : matching team key column in gamestats (Team or org_id)
+
+    """
+    if features is None:
+        features = gamestats_features(cols, gamestats, team = team)
+    if teamlist is None:
+        teamlist = gamestats[team].unique()
+
+    features = features[cols].rename_axis([opponent, 'Date']).reset_index()
+    out = gamelist[[opponent, 'Date']].merge(features,
+                                             on = [opponent, 'Date'],
+                                             how = 'left'
+                                            )
+    out.index = gamelist.index
+    out.loc[~gamelist[opponent].isin(teamlist), cols] = np.nan
+    return out[cols].add_prefix(prefix)
+
+
 def create_variables(data):
     """Create Home, Win/Loss variables 
 
@@ -208,16 +486,10 @@ def create_variables(data):
        data : target variable 
     
     """
-    regexs = {'WL': "[WL]",
-              'team': ["\d+\s\-", "\d+"],
-              'opponent_score':["\-\s\d+", '\d+'],
-              'OT':["\(\d+OT\)", "\d+"], 
-              'opponent':['[\w\s]+\.?\s\@\s\w+']
-             }
     
     # Opponent 
     if '@' in data['Opponent']: 
-        search = re.search(regexs['opponent'][0], data['Opponent']) 
+        search = REGEXS['opponent'].search(data['Opponent']) 
         if search: 
             home = 0
         else: 
@@ -227,10 +499,51 @@ def create_variables(data):
     
     
     # Win/Loss
-    WinLoss = re.search(regexs['WL'], data['Result']).group()
+    WinLoss = REGEXS['WL'].search(data['Result']).group()
     if WinLoss == 'W': 
         WinLoss = 1
     else: 
         WinLoss = 0
         
     return pd.Series([home, WinLoss])    
+
+
+def parse_opponent(column):
+    """ Extract the team name from every value of an Opponent column
+
+        Vectorized version of extract_name.
+
+        Keyword arguments:
+
+        column : Opponent series
+    """
+    away = column.str.contains("@", regex = False)
+    neutral = column.str.contains(REGEXS['opponent'])
+    opponent = column.where(~away, column.str.replace("@", "", regex = False))
+    opponent = opponent.where(~(away & neutral), column.str.split("@").str[0])
+    return opponent.str.strip()
+
+
+def parse_games(data, opponent = 'Opponent', result = 'Result'):
+    """ Parse the Opponent and Result columns for every game at once
+
+        Returns a DF with Opponent2, HomeAway, WinLoss, TeamScore,
+        OpponentScore and OT (number of overtimes) aligned to data.
+
+        Keyword arguments:
+
+        data : df
+        opponent : opponent variable name
+        result : result variable name
+    """
+    out = pd.DataFrame(index = data.index)
+    out['Opponent2'] = parse_opponent(data[opponent])
+    out['HomeAway'] = (~data[opponent].str.contains("@", regex = False)).astype('int64')
+
+    results = data[result].str.extract(RESULT_REGEX)
+    out['WinLoss'] = (results['WinLoss'] == 'W').astype('int64').where(results['WinLoss'].notnull())
+    out['WinLoss'] = out['WinLoss'].astype('Int64')
+    out['TeamScore'] = pd.to_numeric(results['TeamScore']).astype('Int64')
+    out['OpponentScore'] = pd.to_numeric(results['OpponentScore']).astype('Int64')
+    out['OT'] = pd.to_numeric(results['OT']).fillna(0).astype('int64')
+    return out
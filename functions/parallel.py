@@ -0,0 +1,150 @@
+""" Team-partitioned process pool versions of the feature tables
+
+    Every feature is computed from the team's own rows (and, for the coach
+    records, a small shared ledger), so the teams are split into one
+    partition per worker, each partition is sent to a process pool with the
+    rows it needs and the results are put back in the original row order.
+    Partitions are balanced on row counts with ties broken on the team key,
+    so for a given worker count the work split is always the same, and each
+    team's values are computed exactly as in the serial functions.
+"""
+import concurrent.futures, os
+import pandas as pd
+from functions.functions import teamhistory_table, coach_history_table, previous_yrs_table, gamestats_features
+
+
+def team_partitions(teams, workers):
+    """ Split teams into at most `workers` groups with about the same number of rows
+
+        Returns a list of lists of team keys.
+
+        Keyword arguments:
+
+        teams : series of the team key of every row
+        workers : number of partitions
+    """
+    counts = teams.value_counts()
+    counts = counts[counts > 0]
+    counts = sorted(counts.items(), key = lambda x: (-x[1], str(x[0])))
+    parts = [[] for _ in range(max(1, min(workers, len(counts))))]
+    loads = [0] * len(parts)
+    for key, count in counts:
+        idx = loads.index(min(loads))
+        parts[idx].append(key)
+        loads[idx] += count
+    return [part for part in parts if part]
+
+
+def run_partitions(func, jobs, workers):
+    """ Call func(*job) for every job, in a process pool if workers > 1
+
+        Returns the results in job order.
+
+        Keyword arguments:
+
+        func : module level function
+        jobs : list of argument tuples
+        workers : number of processes
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        return [func(*job) for job in jobs]
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as pool:
+        return list(pool.map(func, *zip(*jobs)))
+
+
+def default_workers(workers):
+    """Returns the worker count, one per core if workers is None"""
+    return os.cpu_count() if workers is None else workers
+
+
+def previous_yrs_parallel(gamelist, cols, gamestats, team = 'Team', workers = None):
+    """ previous_yrs_table computed per partition of teams
+
+        Each partition gets its teams' game stats for the seasons of its
+        games and the season before.
+
+        Keyword arguments:
+
+        gamelist : games of interest (team, year, gamenumber)
+        cols : columns of interest
+        gamestats : gamestats dataframe
+        team : team key column (Team or org_id)
+        workers : number of processes (default: one per core)
+    """
+    workers = default_workers(workers)
+    games = gamelist.reset_index(drop = True)
+    jobs = []
+    for teams in team_partitions(games[team], workers):
+        part = games[games[team].isin(teams)]
+        years = set(part['year']) | set(part['year'] - 1)
+        stats = gamestats[gamestats[team].isin(teams) & gamestats['year'].isin(years)]
+        jobs.append((part, cols, stats, None, team))
+
+    out = pd.concat(run_partitions(previous_yrs_table, jobs, workers)).reindex(games.index)
+    out.index = gamelist.index
+    return out
+
+
+def gamestats_features_parallel(cols, gamestats, team = 'Team', workers = None):
+    """ gamestats_features computed per partition of teams, for opponent_stats_table(features = ...)
+
+        Keyword arguments:
+
+        cols : columns of interest
+        gamestats : gamestats dataframe
+        team : team key column for the index (Team or org_id)
+        workers : number of processes (default: one per core)
+    """
+    workers = default_workers(workers)
+    stats = gamestats.reset_index(drop = True)
+    jobs = []
+    for teams in team_partitions(stats[team], workers):
+        jobs.append((cols, stats[stats[team].isin(teams)], team))
+    features = pd.concat(run_partitions(gamestats_features, jobs, workers))
+
+    # Same order and duplicate handling as the serial version
+    serial_index = pd.MultiIndex.from_arrays([stats[team], stats['Date']])
+    serial_index = serial_index[~serial_index.duplicated()]
+    return features.reindex(serial_index)
+
+
+def teamhistory_parallel(history, duration, targets = None, team = 'Team', workers = None):
+    """ teamhistory_table computed per partition of teams
+
+        Keyword arguments:
+
+        history : history data frame
+        duration : how many years of history to look at
+        targets : DF with team and year columns to calculate (default: every team, year in history)
+        team : team key column (Team or org_id)
+        workers : number of processes (default: one per core)
+    """
+    workers = default_workers(workers)
+    if targets is None:
+        targets = history[[team, 'year']]
+    targets = targets[[team, 'year']].drop_duplicates().reset_index(drop = True)
+    jobs = []
+    for teams in team_partitions(targets[team], workers):
+        jobs.append((history[history[team].isin(teams)], duration, targets[targets[team].isin(teams)], team))
+    out = pd.concat(run_partitions(teamhistory_table, jobs, workers))
+    return targets.merge(out, on = [team, 'year'], how = 'left')
+
+
+def coach_history_parallel(gamelist, ledger, team = 'Team', workers = None):
+    """ coach_history_table computed per partition of teams, each with the whole ledger
+
+        Keyword arguments:
+
+        gamelist : games of interest (team, coach list, year)
+        ledger : output of coach_ledger
+        team : team key column to partition on
+        workers : number of processes (default: one per core)
+    """
+    workers = default_workers(workers)
+    games = gamelist.reset_index(drop = True)
+    jobs = []
+    for teams in team_partitions(games[team], workers):
+        jobs.append((games[games[team].isin(teams)], ledger))
+    out = pd.concat(run_partitions(coach_history_table, jobs, workers)).reindex(games.index)
+    out.index = gamelist.index
+    return out
@@ -0,0 +1,189 @@
+""" Stage timing and memory profiling for the dataset build
+
+    The build functions (functions.dataset, functions.build) run their steps
+    as named stages of a Profiler:
+
+        with profiler.stage('fixTOP', master) as stage:
+            top = fixTOP_column(master['TOP'])
+            stage.output(top)
+
+    and each stage records its wall time, the peak of the Python allocations
+    (tracemalloc) over what was allocated when it started, how much it raised
+    the process's peak RSS, and the rows and columns of its input and output
+    frames (summed over the frames of a tuple, list or dict).  Stages nest,
+    a stage run more than once (e.g. once per file) is added up in one record
+    with its number of calls.  A Profiler(enabled = False), what the build
+    functions use when they aren't given one, runs the stages unmeasured.
+
+        profiler = Profiler()
+        tables = build_dataset(load_inputs('scrapy/Data/Data.zip', 'scrapy/Links'), profiler = profiler)
+        print(profiler.report())
+        profiler.write('profile.json')
+"""
+import contextlib, json, resource, sys, time, tracemalloc
+import pandas as pd
+
+MB = 1024.0 ** 2
+
+
+def frame_shape(value):
+    """ Returns (rows, columns) of a DataFrame, Series or Index, summed over a tuple, list or dict of them
+        (None if there are no frames)
+    """
+    if isinstance(value, pd.DataFrame):
+        return value.shape
+    if isinstance(value, pd.Series):
+        return len(value), 1
+    if isinstance(value, pd.Index):
+        return len(value), value.nlevels
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (tuple, list)):
+        shapes = [shape for shape in map(frame_shape, value) if shape is not None]
+        if shapes:
+            return sum(x[0] for x in shapes), sum(x[1] for x in shapes)
+    return None
+
+
+def peak_rss():
+    """ Peak resident set size of this process in bytes """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageRecord(object):
+    """ Measurements of a stage, added up over its calls
+
+        name : stage path ('build_dataset/clean_master/fixTOP')
+        depth : nesting depth
+    """
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.peak_mb = None
+        self.rss_growth_mb = 0.0
+        self.rss_peak_mb = 0.0
+        self.rows_in = self.cols_in = None
+        self.rows_out = self.cols_out = None
+
+    def add_shape(self, which, shape):
+        if shape is None:
+            return
+        rows, cols = getattr(self, 'rows_' + which), getattr(self, 'cols_' + which)
+        setattr(self, 'rows_' + which, shape[0] + (rows or 0))
+        setattr(self, 'cols_' + which, max(shape[1], cols or 0))
+
+    def to_dict(self):
+        return {'stage': self.name, 'depth': self.depth, 'calls': self.calls,
+                'wall_seconds': round(self.wall_seconds, 4),
+                'peak_mb': None if self.peak_mb is None else round(self.peak_mb, 2),
+                'rss_growth_mb': round(self.rss_growth_mb, 2), 'rss_peak_mb': round(self.rss_peak_mb, 2),
+                'rows_in': self.rows_in, 'cols_in': self.cols_in, 'rows_out': self.rows_out, 'cols_out': self.cols_out}
+
+
+class RunningStage(object):
+    """ Handle of a running stage, output(value) records the rows and columns it made """
+
+    def __init__(self, record):
+        self.record = record
+
+    def output(self, value):
+        if self.record is not None:
+            self.record.add_shape('out', frame_shape(value))
+        return value
+
+
+class Profiler(object):
+    """ Runs and measures the named stages of a build
+
+        enabled : measure the stages (False runs them unmeasured)
+        memory : trace the Python allocations for peak_mb (tracemalloc slows the stages down)
+    """
+
+    def __init__(self, enabled = True, memory = True):
+        self.enabled = enabled
+        self.memory = memory
+        self.records = {}
+        # Running stages: (record, traced bytes at the start, highest traced peak seen so far)
+        self.stack = []
+        self.started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name, *inputs):
+        """ Run the body of the with statement as stage name, inputs are the frames it reads """
+        if not self.enabled:
+            yield RunningStage(None)
+            return
+
+        path = '/'.join([frame[0].name for frame in self.stack[-1:]] + [name])
+        record = self.records.get(path)
+        if record is None:
+            record = self.records[path] = StageRecord(path, len(self.stack))
+        record.calls += 1
+        record.add_shape('in', frame_shape(list(inputs)))
+
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        traced = tracemalloc.get_traced_memory()[0] if self.memory else 0
+        if self.memory:
+            if self.stack:
+                # Keep the enclosing stage's peak so far, reset_peak drops it
+                self.stack[-1][2] = max(self.stack[-1][2], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        frame = [record, traced, traced]
+        self.stack.append(frame)
+        rss = peak_rss()
+        started = time.perf_counter()
+        try:
+            yield RunningStage(record)
+        finally:
+            record.wall_seconds += time.perf_counter() - started
+            self.stack.pop()
+            record.rss_peak_mb = peak_rss() / MB
+            record.rss_growth_mb += (peak_rss() - rss) / MB
+            if self.memory:
+                peak = max(tracemalloc.get_traced_memory()[1], frame[2])
+                record.peak_mb = max(record.peak_mb or 0.0, (peak - traced) / MB)
+                if self.stack:
+                    # The enclosing stage's peak includes this one's
+                    self.stack[-1][2] = max(self.stack[-1][2], peak)
+                    tracemalloc.reset_peak()
+                elif self.started_tracing:
+                    tracemalloc.stop()
+                    self.started_tracing = False
+
+    def run(self, name, func, *args, **kwargs):
+        """ Returns func(*args, **kwargs) run as stage name, the frames in args are its inputs """
+        with self.stage(name, *args) as stage:
+            return stage.output(func(*args, **kwargs))
+
+    def summary(self):
+        """ Returns the stage records as dicts, in the order the stages started """
+        return [record.to_dict() for record in self.records.values()]
+
+    def report(self):
+        """ Returns the stage records as a text table """
+        def count(value):
+            return '' if value is None else '{:,}'.format(value)
+        lines = ["%-44s %5s %9s %9s %9s %12s %6s %12s %6s" %
+                 ('stage', 'calls', 'wall s', 'peak MB', '+rss MB', 'rows in', 'cols', 'rows out', 'cols')]
+        for record in self.records.values():
+            lines.append("%-44s %5d %9.3f %9s %9.1f %12s %6s %12s %6s" %
+                         ('  ' * record.depth + record.name.rsplit('/', 1)[-1], record.calls, record.wall_seconds,
+                          '' if record.peak_mb is None else '%.1f' % record.peak_mb, record.rss_growth_mb,
+                          count(record.rows_in), count(record.cols_in), count(record.rows_out), count(record.cols_out)))
+        return "\n".join(lines)
+
+    def write(self, path):
+        """ Write the summary as JSON """
+        with open(path, 'w') as f:
+            json.dump({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'memory': self.memory, 'stages': self.summary()},
+                      f, indent = 2)
+
+
+# Used by the build functions when they aren't given a profiler
+NO_PROFILER = Profiler(enabled = False)
@@ -0,0 +1,215 @@
+""" Column types for the dataset tables
+
+    Each table declares its columns as (pattern, kind) rules, the first rule
+    whose pattern matches the whole column name wins.  apply_schemas casts
+    every column to its compact type and raises SchemaError instead of
+    silently changing values: a missing required column, a value that does
+    not fit the declared type or a column no rule covers all fail the load.
+    A new or renamed stat column on stats.ncaa.org has to be added to
+    STAT_COLUMNS (or loaded with an explicit fallback kind).
+
+    Kinds
+
+        team : categorical shared by every team name column (Team, opponentName) of every table
+        category : categorical of the column's own values
+        datetime : datetime64
+        seconds : float32 seconds (timedeltas are converted)
+        int8/int16/int32 : integers, no missing values
+        float32 : numbers, missing values as NaN
+        object : left as is (e.g. the list of coaches)
+"""
+import re
+import numpy as np
+import pandas as pd
+from functions.featurestore import read_store
+
+# Ids that can be missing are float32 (exact for ids below 2**24): nullable integer
+# merge keys with missing values fail in pandas merges
+# The game-by-game stat columns of stats.ncaa.org, named as the spiders write them
+# (spaces, /'s and .'s taken out: 'Rush Net Yards' -> RushNetYards, '3rd Down Conv/Att' -> 3rdDownConvAtt)
+STAT_COLUMNS = ['Plays',
+                'RushAtt', 'RushNetYards', 'RushTD', 'RushLong',
+                'PassAtt', 'PassComp', 'PassYards', 'PassTD', 'PassInt', 'PassLong',
+                'Receptions', 'ReceivingYards', 'ReceivingTD', 'RecLong',
+                'TotalPlays', 'TotalYards', 'YdsPlay', 'TOP', 'FirstDowns', '3rdDownConvAtt', '4thDownConvAtt',
+                'Penalties', 'PenaltyYards',
+                'Fumbles', 'FumblesLost',
+                'Punts', 'PuntYds', 'PuntAvg',
+                'PuntRet', 'PuntRetYds', 'PuntRetTD',
+                'KORet', 'KORetYds', 'KORetTD',
+                'FGM', 'FGA', 'PATM', 'PATA',
+                'TacklesSolo', 'TacklesAst', 'Sacks', 'Int', 'IntRYds', 'FR', 'FRetYds', 'PassDef',
+                'RZAtt', 'RZScores', 'RZTD',
+               ]
+STAT_PATTERN = '(def_)?(%s)' % '|'.join(re.escape(col) for col in STAT_COLUMNS)
+
+ID_RULES = [('org_id', 'int32'),
+            ('season_id|opponent_org_id', 'float32'),
+            ('Team|opponentName', 'team'),
+            ('Date', 'datetime'),
+            ('year', 'int16'),
+            ('gamenumber', 'int16'),
+           ]
+
+SCHEMAS = {'gamestats': {'required': ['org_id', 'Date', 'year', 'gamenumber', 'Team'],
+                         'rules': ID_RULES + [('(def_)?Opponent', 'category'),
+                                              ('(def_)?TOP', 'seconds'),
+                                              (STAT_PATTERN, 'float32'),
+                                             ],
+                        },
+           'gameslist': {'required': ['org_id', 'Date', 'year', 'gamenumber', 'Team', 'opponent_org_id',
+                                      'opponentName', 'WinLoss', 'HomeAway'],
+                         'rules': ID_RULES + [('Opponent|Result', 'category'),
+                                              ('coach', 'object'),
+                                              ('HomeAway|WinLoss', 'int8'),
+                                              ('history_(wins|losses|WL)_(\\d+|max)yrs', 'float32'),
+                                              ('Coach_(wins|losses|WL|years)', 'float32'),
+                                              ('TeamScore|OpponentScore|OT', 'float32'),
+                                              (STAT_PATTERN, 'float32'),
+                                             ],
+                        },
+          }
+
+TEAM_COLUMNS = ['Team', 'opponentName']
+
+
+class SchemaError(ValueError):
+    """A table does not match its declared schema"""
+
+
+def column_kind(schema, col):
+    """Returns the kind of the first rule matching the column name (None if no rule does)"""
+    for pattern, kind in schema['rules']:
+        if re.fullmatch(pattern, col):
+            return kind
+    return None
+
+
+def team_dtype(tables):
+    """ Returns one CategoricalDtype for the team name columns of all the tables
+
+        Keyword arguments:
+
+        tables : dict of table name -> DataFrame
+    """
+    names = set()
+    for table in tables.values():
+        for col in TEAM_COLUMNS:
+            if col in table.columns:
+                names.update(table[col].dropna().astype(str).unique())
+    return pd.CategoricalDtype(sorted(names))
+
+
+def cast_numeric(column, name, dtype):
+    """Cast to a numeric dtype, raising SchemaError if any value would change
+    (a column that already has the dtype is returned as is, not copied)"""
+    if column.dtype == np.dtype(dtype):
+        return column
+    try:
+        values = pd.to_numeric(column.astype(object) if pd.api.types.is_categorical_dtype(column) else column)
+    except (ValueError, TypeError) as e:
+        raise SchemaError("%s: not numeric (%s)" % (name, e))
+    if dtype == 'float32':
+        wide = values.astype('float64')
+        out = wide.astype('float32')
+        if (np.isinf(out) & np.isfinite(wide)).any():
+            raise SchemaError("%s: values outside the float32 range" % name)
+        return out
+
+    if values.isnull().any():
+        raise SchemaError("%s: missing values in a %s column" % (name, dtype))
+    if not pd.api.types.is_integer_dtype(values) and not (values == np.floor(values)).all():
+        raise SchemaError("%s: non-integer values in a %s column" % (name, dtype))
+    info = np.iinfo(dtype)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        raise SchemaError("%s: values outside the %s range" % (name, dtype))
+    return values.astype(dtype)
+
+
+def cast_column(column, name, kind, teams):
+    """Cast one column to its kind (columns already of their kind are returned as they are)"""
+    if kind == 'object':
+        return column
+    if kind == 'team':
+        if pd.api.types.is_categorical_dtype(column) and column.cat.categories.equals(teams.categories):
+            return column
+        unknown = set(column.dropna().astype(str).unique()) - set(teams.categories)
+        if unknown:
+            raise SchemaError("%s: teams missing from the shared categories %s" % (name, sorted(unknown)[:5]))
+        return column.astype(object).where(column.isnull(), column.astype(str)).astype(teams)
+    if kind == 'category':
+        if pd.api.types.is_categorical_dtype(column) and column.cat.categories.dtype == object:
+            return column
+        return column.astype(object).where(column.isnull(), column.astype(str)).astype('category')
+    if kind == 'datetime':
+        if pd.api.types.is_datetime64_dtype(column):
+            return column
+        try:
+            return pd.to_datetime(column)
+        except (ValueError, TypeError) as e:
+            raise SchemaError("%s: not dates (%s)" % (name, e))
+    if kind == 'seconds':
+        if pd.api.types.is_timedelta64_dtype(column):
+            column = column.dt.total_seconds()
+        elif column.dtype == object:
+            column = column.map(lambda x: x.total_seconds() if isinstance(x, pd.Timedelta) else x)
+        return cast_numeric(column, name, 'float32')
+    return cast_numeric(column, name, kind)
+
+
+def apply_schema(table, name, teams = None, fallback = None):
+    """ Cast a table to its declared column types
+
+        Keyword arguments:
+
+        table : DataFrame
+        name : table name in SCHEMAS
+        teams : shared team CategoricalDtype (default: built from this table)
+        fallback : kind for the columns no rule covers (default: they raise SchemaError)
+    """
+    if name not in SCHEMAS:
+        raise SchemaError("No schema for table %s" % name)
+    schema = SCHEMAS[name]
+    missing = [col for col in schema['required'] if col not in table.columns]
+    if missing:
+        raise SchemaError("%s: missing columns %s" % (name, missing))
+    if teams is None:
+        teams = team_dtype({name: table})
+
+    out = {}
+    for col in table.columns:
+        kind = column_kind(schema, col) or fallback
+        if kind is None:
+            raise SchemaError("%s: no schema rule for column %s (add it to STAT_COLUMNS or pass a fallback kind)" % (name, col))
+        out[col] = cast_column(table[col], "%s.%s" % (name, col), kind, teams)
+    # copy = False keeps the columns as they are (e.g. the memory mapped arrays of read_store)
+    # instead of merging them into new blocks
+    return pd.DataFrame(out, index = table.index, copy = False)
+
+
+def apply_schemas(tables, fallback = None):
+    """ Cast every table that has a schema, sharing the team categories between them
+
+        Tables without a schema are returned unchanged.
+
+        Keyword arguments:
+
+        tables : dict of table name -> DataFrame
+        fallback : passed to apply_schema
+    """
+    typed = {name: table for name, table in tables.items() if name in SCHEMAS}
+    teams = team_dtype(typed)
+    return {name: apply_schema(table, name, teams, fallback) if name in SCHEMAS else table
+            for name, table in tables.items()}
+
+
+def read_dataset(path, names = ('gameslist', 'gamestats'), fallback = None):
+    """ Load tables from the feature store with the schema applied
+
+        Keyword arguments:
+
+        path : feature store directory
+        names : tables to load
+        fallback : passed to apply_schema
+    """
+    return apply_schemas({name: read_store(path, name) for name in names}, fallback)
@@ -0,0 +1,237 @@
+""" Synthetic scraped data for benchmarks
+
+    Generates the dataset inputs (load_inputs format) for a league of any
+    size: every week the teams are paired off, some games are against teams
+    outside the league (no opponent_org_id), some at neutral sites, and each
+    game has an offense and a defense row in every game-by-game file.
+    Program histories go back ten years before the first season and head
+    coaches change every few years and move between teams, so the history
+    and coach tables grow with the league the way the scraped ones do.
+    Values are drawn from a seeded generator, the same arguments give the
+    same frames.
+"""
+import functools
+import numpy as np
+import pandas as pd
+from functions.schema import STAT_COLUMNS
+
+OUTSIDE_TEAM = 'Some College'
+HISTORY_YEARS = 10
+# Years a head coach stays at a team
+COACH_TENURE = 5
+CLASSES = ['Fr', 'So', 'Jr', 'Sr']
+ID_COLUMNS = ['Date', 'Opponent', 'Result', 'G', 'Team', 'OffenseDefense', 'opponent_org_id', 'org_id', 'season_id']
+
+
+def season_label(year):
+    """ Returns the academic year label of the season starting in year (2015 -> '2015-16') """
+    return '%d-%s' % (year, str(year + 1)[2:])
+
+
+def frame_reader(frame, columns = None):
+    """ Read function for an in-memory game-by-game table (see dataset.gamebygame_readers)
+
+        Keyword arguments:
+
+        frame : game-by-game table
+        columns : columns to read (default all)
+    """
+    return frame.copy() if columns is None else frame[columns].copy()
+
+
+def team_names(teams):
+    """ Returns org_id -> team name for a league of `teams` teams """
+    return {1000 + idx: 'Team %d' % idx for idx in range(teams)}
+
+
+def schedule(seasons, teams, games, first_year = 2014, outside_rate = 0.1, neutral_rate = 0.05, seed = 0):
+    """ Returns one row per team and game: year, Date, org_id, opponent_org_id (NaN outside the league),
+        Opponent, Result, TeamScore, OpponentScore
+
+        Keyword arguments:
+
+        seasons : number of seasons
+        teams : number of teams
+        games : games per season
+        first_year : year of the first season
+        outside_rate : share of games against teams outside the league
+        neutral_rate : share of games at neutral sites
+        seed : random seed
+    """
+    rng = np.random.default_rng(seed)
+    names = team_names(teams)
+    orgs = np.array(list(names))
+    rows = []
+    for year in range(first_year, first_year + seasons):
+        for week in range(games):
+            date = pd.Timestamp(year, 9, 1) + pd.Timedelta(days = 7 * week)
+            order = rng.permutation(orgs)
+            pairs = list(zip(order[0::2], order[1::2]))
+            outside = [org for org in order[len(pairs) * 2:]]
+            for home, away in pairs:
+                if rng.random() < outside_rate:
+                    outside.extend([home, away])
+                    continue
+                home_score, away_score = rng.integers(0, 56, 2)
+                if home_score == away_score:
+                    home_score += 3
+                overtime = ' (%dOT)' % rng.integers(1, 3) if rng.random() < 0.05 else ''
+                neutral = ' @ Neutral Field' if rng.random() < neutral_rate else ''
+                rows.append((year, date, home, away, names[away] + neutral, home_score, away_score, overtime))
+                # The away team's Opponent is '@ Home', at neutral sites both read 'Other @ Site'
+                away_opponent = names[home] + neutral if neutral else '@ ' + names[home]
+                rows.append((year, date, away, home, away_opponent, away_score, home_score, overtime))
+            for org in outside:
+                score, outside_score = rng.integers(0, 56, 2)
+                if score == outside_score:
+                    score += 3
+                rows.append((year, date, org, np.nan, OUTSIDE_TEAM if rng.random() < 0.5 else '@ ' + OUTSIDE_TEAM,
+                             score, outside_score, ''))
+    games = pd.DataFrame(rows, columns = ['year', 'Date', 'org_id', 'opponent_org_id', 'Opponent', 'TeamScore',
+                                          'OpponentScore', 'OT'])
+    games['Result'] = (np.where(games.TeamScore > games.OpponentScore, 'W ', 'L ') + games.TeamScore.astype(str) + ' - ' +
+                       games.OpponentScore.astype(str) + games.OT)
+    return games.drop('OT', axis = 1).sort_values(['org_id', 'Date'], kind = 'mergesort').reset_index(drop = True)
+
+
+def gamebygame_tables(games, names, stat_files = 6, stat_columns = 6, seed = 0):
+    """ Returns [(file name, table)] game-by-game tables with an offense and a defense row per game
+
+        participation (G, Plays) and rushing (RushNetYards, RushAtt, TOP as mm:ss) come first, then
+        stat_files files of stat_columns numeric columns named after the other schema.STAT_COLUMNS,
+        the last of them written with slashes (10/24).
+
+        Keyword arguments:
+
+        games : output of schedule
+        names : org_id -> team name
+        stat_files : number of extra stat files
+        stat_columns : columns in each extra file
+        seed : random seed
+    """
+    names_left = [col for col in STAT_COLUMNS if col not in ('Plays', 'RushNetYards', 'RushAtt', 'TOP')]
+    if stat_files * stat_columns > len(names_left):
+        raise ValueError("At most %d stat columns (stat_files * stat_columns)" % len(names_left))
+    rng = np.random.default_rng(seed + 1)
+    ids = pd.DataFrame({'Date': np.repeat(games['Date'].dt.strftime('%m/%d/%Y').values, 2),
+                        'Opponent': np.repeat(games['Opponent'].values, 2),
+                        'Result': np.repeat(games['Result'].values, 2),
+                        'G': 1,
+                        'Team': np.repeat(games['org_id'].map(names).values, 2),
+                        'OffenseDefense': np.tile(['Offense', 'Defense'], len(games)),
+                        'opponent_org_id': np.repeat(games['opponent_org_id'].values, 2),
+                        'org_id': np.repeat(games['org_id'].values, 2),
+                        'season_id': np.repeat(games['year'].values * 10 + 1, 2),
+                       })
+    n = len(ids)
+    tables = [('gamebygame_participation', ids.assign(Plays = rng.integers(40, 90, n))),
+              ('gamebygame_rushing', ids.assign(RushNetYards = rng.integers(-20, 400, n), RushAtt = rng.integers(15, 60, n),
+                                                TOP = ['%d:%02d' % (m, s) for m, s in zip(rng.integers(20, 40, n), rng.integers(0, 60, n))]))]
+    for idx in range(stat_files):
+        stats = {names_left[idx * stat_columns + col]: rng.integers(0, 300, n).astype(float) for col in range(stat_columns)}
+        if idx == stat_files - 1:
+            stats = {col: ['%d/%d' % (a, b) for a, b in zip(rng.integers(0, 20, n), rng.integers(20, 40, n))] for col in stats}
+        table = ids.assign(**stats)
+        # Not every stat is recorded for every game
+        for col in stats:
+            table.loc[rng.random(n) < 0.02, col] = np.nan
+        tables.append(('gamebygame_stat%d' % idx, table))
+    return tables
+
+
+def history_table(names, first_year, last_year, games, seed = 0):
+    """ Returns the program history (read_history format) from HISTORY_YEARS before first_year to last_year
+
+        Keyword arguments:
+
+        names : org_id -> team name
+        first_year, last_year : seasons of the league
+        games : games per season
+        seed : random seed
+    """
+    rng = np.random.default_rng(seed + 2)
+    years = np.arange(first_year - HISTORY_YEARS, last_year + 1)
+    history = pd.DataFrame([(name, org, year) for org, name in names.items() for year in years], columns = ['Team', 'org_id', 'year'])
+    history['Wins'] = rng.integers(0, games + 1, len(history))
+    history['Losses'] = games - history['Wins']
+    history['Year'] = history['year'].map(season_label)
+    return history[['Team', 'org_id', 'Year', 'Wins', 'Losses', 'year']]
+
+
+def coach_tables(names, first_year, last_year, games, seed = 0):
+    """ Returns the coach links (read_coach_links format) and coach records (read_coaches format)
+
+        Every team has one head coach per COACH_TENURE years, a new coach has
+        a record from an earlier job about half the time.
+
+        Keyword arguments:
+
+        names : org_id -> team name
+        first_year, last_year : seasons of the league
+        games : games per season
+        seed : random seed
+    """
+    rng = np.random.default_rng(seed + 3)
+    links, records = [], []
+    for org, name in names.items():
+        for era_start in range(first_year - HISTORY_YEARS, last_year + 1, COACH_TENURE):
+            coach = 'Coach %d-%d' % (org, era_start)
+            start = era_start - (int(rng.integers(1, COACH_TENURE)) if rng.random() < 0.5 else 0)
+            for year in range(start, min(era_start + COACH_TENURE, last_year + 1)):
+                wins = int(rng.integers(0, games + 1))
+                records.append((coach, season_label(year + 1), wins, games - wins, wins / float(games), year))
+                if year >= first_year and year >= era_start:
+                    links.append((org, name, coach, year))
+    coach_links = pd.DataFrame(links, columns = ['org_id', 'Team', 'coach', 'year'])
+    coaches = pd.DataFrame(records, columns = ['coach', 'Year', 'Wins', 'Losses', 'WL', 'year'])
+    return coach_links, coaches
+
+
+def roster_frame(names, first_year, last_year, players = 90, games = 12, seed = 0):
+    """ Returns a roster (org_id, Year, Yr, GP, GS) with `players` players per team and season
+
+        Keyword arguments:
+
+        names : org_id -> team name
+        first_year, last_year : seasons of the league
+        players : players per roster
+        games : games per season
+        seed : random seed
+    """
+    rng = np.random.default_rng(seed + 4)
+    keys = [(org, season_label(year + 1)) for org in names for year in range(first_year, last_year + 1)]
+    roster = pd.DataFrame(np.repeat(keys, players, axis = 0), columns = ['org_id', 'Year'])
+    roster['org_id'] = roster['org_id'].astype(int)
+    roster['Yr'] = rng.choice(CLASSES, len(roster))
+    roster['GP'] = rng.integers(0, games + 1, len(roster))
+    roster['GS'] = np.minimum(roster['GP'], rng.integers(0, games + 1, len(roster)))
+    return roster
+
+
+def synthetic_inputs(seasons = 4, teams = 32, games = 12, first_year = 2014, stat_files = 6, stat_columns = 6,
+                     players = 90, seed = 0):
+    """ Returns synthetic dataset inputs: the load_inputs dict plus a roster
+
+        Keyword arguments:
+
+        seasons : number of seasons
+        teams : number of teams
+        games : games per season
+        first_year : year of the first season
+        stat_files : extra game-by-game stat files (gamebygame_tables)
+        stat_columns : columns in each extra stat file
+        players : players per roster
+        seed : random seed
+    """
+    names = team_names(teams)
+    last_year = first_year + seasons - 1
+    games_table = schedule(seasons, teams, games, first_year = first_year, seed = seed)
+    tables = gamebygame_tables(games_table, names, stat_files = stat_files, stat_columns = stat_columns, seed = seed)
+    coach_links, coaches = coach_tables(names, first_year, last_year, games, seed = seed)
+    return {'history': history_table(names, first_year, last_year, games, seed = seed),
+            'coach_links': coach_links,
+            'coaches': coaches,
+            'participation': tables[0][1],
+            'gamebygame': [(name, functools.partial(frame_reader, table)) for name, table in tables],
+            'roster': roster_frame(names, first_year, last_year, players = players, games = games, seed = seed),
+           }
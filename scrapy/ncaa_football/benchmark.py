@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+# End to end crawl benchmark against the local stats.ncaa.org stand-in
+#
+# Starts a FixtureServer (ncaa_football.fixtures), then runs the spider chain
+# teamlinks -> PeopleHistoryRosterStats -> teamstats -> GameByGame (each
+# stage reads the links the one before wrote) as separate crawls through
+# it, in a scratch directory, with the project settings plus any -s
+# overrides.  Each stage reports
+#
+#   pages/s, items/s         responses and items over the stage's wall time
+#   latency p50/p90/p99      download latency (request to response, queueing in the downloader included)
+#   parse share              time parsing the pages (tables read, rows and links extracted) over wall
+#                            time; with PARSE_PROCESSES > 0 the tables are read in the pool, off the reactor
+#   peak RSS                 of the crawl process
+#
+# and the results are written as JSON so runs can be compared between commits:
+#
+#   python -m ncaa_football.benchmark run --teams 40 --years 2016-2017 --latency 0.05 --error-rate 0.01 \
+#       -s AUTOTHROTTLE_ENABLED=0 -s CONCURRENT_REQUESTS=32 --output crawl_benchmark.json
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from ncaa_football.fixtures import add_server_arguments, server_from_arguments
+
+STAGES = ['teamlinks', 'PeopleHistoryRosterStats', 'teamstats', 'GameByGame']
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class CrawlTimer(object):
+    """Spider middleware measuring a crawl for the benchmark (enabled by BENCHMARK_OUTPUT)
+
+    Sits next to the spider so the time building the callback output doesn't
+    include the other middlewares; the table parsing is timed by the spider's HtmlParser.
+    """
+
+    def __init__(self, crawler, output):
+        self.crawler = crawler
+        self.output = output
+        self.latencies = []
+        self.output_seconds = 0.0
+        self.started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        output = crawler.settings.get('BENCHMARK_OUTPUT')
+        if not output:
+            raise NotConfigured
+        timer = cls(crawler, output)
+        crawler.signals.connect(timer.spider_opened, signal = signals.spider_opened)
+        crawler.signals.connect(timer.response_received, signal = signals.response_received)
+        crawler.signals.connect(timer.spider_closed, signal = signals.spider_closed)
+        return timer
+
+    def spider_opened(self, spider):
+        self.started = time.perf_counter()
+
+    def response_received(self, response, request, spider):
+        if 'download_latency' in request.meta:
+            self.latencies.append(request.meta['download_latency'])
+
+    def process_spider_output(self, response, result, spider):
+        # The callbacks are generators, the rows and links are built as the output
+        # is iterated, so time the iteration (not what is done with the output)
+        busy = 0.0
+        result = iter(result)
+        while True:
+            started = time.perf_counter()
+            try:
+                out = next(result)
+            except StopIteration:
+                break
+            finally:
+                busy += time.perf_counter() - started
+            yield out
+        self.output_seconds += busy
+
+    def spider_closed(self, spider, reason):
+        wall = time.perf_counter() - self.started
+        stats = self.crawler.stats.get_stats()
+        pages = stats.get('response_received_count', 0)
+        items = stats.get('item_scraped_count', 0)
+        tables = spider.html_parser.parse_seconds if hasattr(spider, 'html_parser') else 0.0
+        latency = np.percentile(self.latencies, [50, 90, 99]) if self.latencies else [float('nan')] * 3
+        result = {'spider': spider.name,
+                  'finish_reason': reason,
+                  'wall_seconds': round(wall, 3),
+                  'pages': pages,
+                  'pages_per_second': round(pages / wall, 2),
+                  'items': items,
+                  'items_per_second': round(items / wall, 2),
+                  'latency_p50': round(float(latency[0]), 4),
+                  'latency_p90': round(float(latency[1]), 4),
+                  'latency_p99': round(float(latency[2]), 4),
+                  'table_seconds': round(tables, 3),
+                  'output_seconds': round(self.output_seconds, 3),
+                  'parse_seconds': round(tables + self.output_seconds, 3),
+                  'parse_share': round((tables + self.output_seconds) / wall, 3),
+                  'peak_rss_mb': round(peak_rss() / 1024.0 ** 2, 1),
+                  'retries': stats.get('retry/count', 0),
+                  'statuses': {key.rsplit('/', 1)[1]: value for key, value in stats.items()
+                               if key.startswith('downloader/response_status_count/')},
+                  'spider_errors': stats.get('log_count/ERROR', 0),
+                 }
+        with open(self.output, 'w') as f:
+            json.dump(result, f, indent = 2)
+
+
+def run_stage(spider, output, overrides, spider_args):
+    """Crawl one spider in this process with the benchmark timer on"""
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+    settings = get_project_settings()
+    settings.set('LOG_LEVEL', 'WARNING')
+    settings.setdict(overrides, priority = 'cmdline')
+    middlewares = settings.getdict('SPIDER_MIDDLEWARES')
+    middlewares['ncaa_football.benchmark.CrawlTimer'] = 990
+    settings.set('SPIDER_MIDDLEWARES', middlewares, priority = 'cmdline')
+    settings.set('BENCHMARK_OUTPUT', output, priority = 'cmdline')
+    process = CrawlerProcess(settings)
+    process.crawl(spider, **spider_args)
+    process.start()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd = PROJECT_DIR,
+                                       stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def key_values(pairs):
+    """Parse NAME=VALUE command line pairs"""
+    return dict(pair.split('=', 1) for pair in pairs)
+
+
+def run(args):
+    """Serve the fixtures and crawl the stages one after another, returns the results"""
+    server = server_from_arguments(args)
+    server.start()
+    workdir = args.workdir or tempfile.mkdtemp(prefix = 'crawl_benchmark_')
+    for _dir in ['Links', 'Data']:
+        os.makedirs(os.path.join(workdir, _dir), exist_ok = True)
+    pythonpath = os.pathsep.join(filter(None, [PROJECT_DIR, os.environ.get('PYTHONPATH')]))
+    env = dict(os.environ, http_proxy = server.url, PYTHONPATH = pythonpath, SCRAPY_SETTINGS_MODULE = 'ncaa_football.settings')
+    env.pop('no_proxy', None)
+
+    results = {'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'settings': key_values(args.set),
+               'server': {key: value for key, value in vars(args).items() if key not in ('command', 'set', 'output', 'workdir', 'keep')},
+               'stages': []}
+    try:
+        for spider in args.stages.split(','):
+            output = os.path.join(workdir, spider + '.benchmark.json')
+            command = [sys.executable, '-m', 'ncaa_football.benchmark', 'stage', spider, output]
+            command += ['-s%s' % pair for pair in args.set]
+            if spider == 'teamlinks':
+                command += ['-ayears=%s' % args.years]
+            with open(os.path.join(workdir, spider + '.log'), 'w') as log:
+                code = subprocess.call(command, cwd = workdir, env = env, stdout = log, stderr = subprocess.STDOUT)
+            if code or not os.path.exists(output):
+                raise RuntimeError("%s crawl failed (exit code %d), see %s" % (spider, code, os.path.join(workdir, spider + '.log')))
+            with open(output) as f:
+                results['stages'].append(json.load(f))
+            print(format_stage(results['stages'][-1]))
+    finally:
+        server.shutdown()
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors = True)
+
+    stages = results['stages']
+    wall = sum(stage['wall_seconds'] for stage in stages)
+    results['total'] = {'wall_seconds': round(wall, 3),
+                        'pages': sum(stage['pages'] for stage in stages),
+                        'items': sum(stage['items'] for stage in stages),
+                        'pages_per_second': round(sum(stage['pages'] for stage in stages) / wall, 2),
+                        'items_per_second': round(sum(stage['items'] for stage in stages) / wall, 2),
+                        'parse_share': round(sum(stage['parse_seconds'] for stage in stages) / wall, 3),
+                        'peak_rss_mb': max(stage['peak_rss_mb'] for stage in stages),
+                       }
+    results['server_stats'] = server.stats()
+    return results
+
+
+def format_stage(stage):
+    return ("%(spider)-26s %(wall_seconds)8.1fs %(pages)6d pages %(pages_per_second)7.1f/s %(items)8d items "
+            "%(items_per_second)8.1f/s  latency p50 %(latency_p50).3f p90 %(latency_p90).3f p99 %(latency_p99).3f  "
+            "parse %(parse_share).0f%%  rss %(peak_rss_mb).0fMB" % dict(stage, parse_share = 100 * stage['parse_share']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "End to end crawl benchmark against the local stats.ncaa.org stand-in")
+    commands = parser.add_subparsers(dest = 'command')
+    bench = commands.add_parser('run', help = "serve the fixtures and crawl the spider chain")
+    add_server_arguments(bench)
+    bench.add_argument('--stages', default = ','.join(STAGES), help = "spiders to run in order")
+    bench.add_argument('-s', '--set', action = 'append', default = [], metavar = 'NAME=VALUE', help = "scrapy setting")
+    bench.add_argument('--output', default = 'crawl_benchmark.json')
+    bench.add_argument('--workdir', default = None, help = "directory to crawl in (default: a temporary one)")
+    bench.add_argument('--keep', action = 'store_true', help = "keep the temporary directory")
+    stage = commands.add_parser('stage', help = "crawl one spider with the timer on (run uses this)")
+    stage.add_argument('spider')
+    stage.add_argument('output')
+    stage.add_argument('-s', '--set', action = 'append', default = [], metavar = 'NAME=VALUE')
+    stage.add_argument('-a', '--arg', action = 'append', default = [], metavar = 'NAME=VALUE')
+    args = parser.parse_args()
+
+    if args.command == 'stage':
+        run_stage(args.spider, args.output, key_values(args.set), key_values(args.arg))
+    elif args.command == 'run':
+        results = run(args)
+        print(format_stage(dict(results['total'], spider = 'total', latency_p50 = float('nan'),
+                                latency_p90 = float('nan'), latency_p99 = float('nan'))))
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2)
+    else:
+        parser.print_help()
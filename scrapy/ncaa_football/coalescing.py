@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# One download per page, shared by every request that wants it
+#
+# Requests are keyed by their method, canonical url (ncaa_football.urls,
+# sorted query arguments, no fragment) and body, so links that spell the same
+# page differently are one request.  The link driven spiders start from one
+# request per page and context (ShardedSpider.shard_links keeps the links to a
+# page that differ in the spider's context_keys), and while a crawl runs
+#
+#   ContextDupeFilter       drops a request for a page already requested, unless
+#                           it carries a different meta['coalesce_context'] (the
+#                           (team, year, stat) a page is parsed for), so a page
+#                           asked for under two stat names is parsed for both
+#   CoalescingMiddleware    downloads each key once: a request for a key being
+#                           downloaded waits for that download, one for a key
+#                           downloaded recently (COALESCE_CACHE_SIZE responses)
+#                           gets it at once, and each gets a copy of the response
+#                           under its own url and meta, so its callback runs
+#                           for its own context
+#
+# Counters in the stats: coalesce/downloads, coalesce/coalesced (waited for a
+# download in flight) and coalesce/reused (answered from the recent responses).
+# Across runs and spiders use SNAPSHOT_MODE = 'reuse' (ncaa_football.snapshots),
+# keyed by the same canonical url.
+#
+#   scrapy crawl GameByGame -s COALESCE_CACHE_SIZE=256
+#   scrapy crawl GameByGame -s COALESCE_ENABLED=0
+import hashlib
+from collections import OrderedDict
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer
+from ncaa_football.urls import canonical_url
+
+CONTEXT_KEY = 'coalesce_context'
+
+
+def request_key(request):
+    """Return the key of the page a request downloads (method, canonical url and body)"""
+    key = hashlib.sha1(request.method.encode('utf-8'))
+    key.update(canonical_url(request.url).encode('utf-8'))
+    key.update(request.body or b'')
+    return key.hexdigest()
+
+
+class ContextDupeFilter(RFPDupeFilter):
+    """Duplicate filter on the request key and meta['coalesce_context']
+
+    A request without a context is a duplicate of any request for the same
+    page, one with a context only of a request for the page with the same one.
+    """
+
+    def request_fingerprint(self, request):
+        context = request.meta.get(CONTEXT_KEY)
+        if context is None:
+            return request_key(request)
+        return hashlib.sha1((request_key(request) + repr(context)).encode('utf-8')).hexdigest()
+
+
+class CoalescingMiddleware(object):
+    """Downloader middleware downloading each request key once and fanning the response
+    out to every request for it (disabled by COALESCE_ENABLED = False)
+
+    Sits after the retry and redirect middlewares, ahead of the snapshot store,
+    so it shares the raw responses and each request is retried and redirected
+    on its own.
+
+    cache_size : recent responses (status 2xx) kept to answer later requests
+    """
+
+    def __init__(self, stats, cache_size = 64):
+        self.stats = stats
+        self.cache_size = cache_size
+        # key -> (request downloading it, [(deferred, request)] waiting for it)
+        self.downloading = {}
+        # key -> response, least recently used first
+        self.recent = OrderedDict()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('COALESCE_ENABLED', True):
+            raise NotConfigured
+        return cls(crawler.stats, crawler.settings.getint('COALESCE_CACHE_SIZE', 64))
+
+    def copy(self, response, request):
+        """Return the response as the answer to request"""
+        return response.replace(url = request.url, request = request, flags = response.flags + ['coalesced'])
+
+    def process_request(self, request, spider):
+        key = request_key(request)
+        if key in self.recent:
+            self.recent.move_to_end(key)
+            self.stats.inc_value('coalesce/reused', spider = spider)
+            return self.copy(self.recent[key], request)
+        if key in self.downloading:
+            self.stats.inc_value('coalesce/coalesced', spider = spider)
+            waiting = defer.Deferred()
+            self.downloading[key][1].append((waiting, request))
+            return waiting
+        self.stats.inc_value('coalesce/downloads', spider = spider)
+        self.downloading[key] = (request, [])
+        return None
+
+    def finished(self, request):
+        """Return the key of a request this middleware let through and the requests waiting for it
+        (None, [] for the requests it answered)"""
+        key = request_key(request)
+        if key in self.downloading and self.downloading[key][0] is request:
+            return key, self.downloading.pop(key)[1]
+        return None, []
+
+    def process_response(self, request, response, spider):
+        key, followers = self.finished(request)
+        for waiting, follower in followers:
+            waiting.callback(self.copy(response, follower))
+        if key is not None and self.cache_size and 200 <= response.status < 300:
+            self.recent[key] = response
+            self.recent.move_to_end(key)
+            while len(self.recent) > self.cache_size:
+                self.recent.popitem(last = False)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        # The waiting requests fail too, the retry middleware retries each on its own
+        for waiting, follower in self.finished(request)[1]:
+            waiting.errback(exception)
+        return None
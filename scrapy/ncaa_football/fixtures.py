@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+
+# Local stand-in for stats.ncaa.org
+#
+# FixtureServer answers the stats.ncaa.org URLs the spiders crawl with pages
+# shaped like the real ones (same tables, table order, links and form
+# fields), generated from a seeded synthetic league or replayed from a
+# snapshot store (ncaa_football.snapshots).  It runs as an HTTP proxy, so
+# the spiders crawl their usual http://stats.ncaa.org/... URLs unchanged:
+#
+#   python -m ncaa_football.fixtures --port 8650 --teams 40 --latency 0.05 --error-rate 0.01
+#   http_proxy=http://127.0.0.1:8650 scrapy crawl teamlinks -a years=2016-2017
+#
+# Pages
+#
+#   /team/inst_team_list?academic_year=<y>            team list
+#   /team/<org_id>/<season_id>                        team page (results, team stats, leaders)
+#   /teams/history/MFB/<org_id>                       team history
+#   /team/<org_id>/roster/<season_id>                 roster
+#   /people/<id>?sport_code=MFB                       coach record
+#   /team/<org_id>/stats/<season_id>                  team stats with the category and game-by-game links
+#   /team/<org_id>/stats?id=<season_id>&year_stat_category_id=<c>     stat category
+#   /player/game_by_game?game_sport_year_ctl_id=<season_id>&org_id=<org_id>&stats_player_seq=-100
+#   /player/index?id=<season_id>&org_id=<org_id>&stats_player_seq=-100&year_stat_category_id=<c>
+#
+# latency (plus up to jitter more) is slept before every response, and a
+# share error_rate of the requests get an error_status response instead.
+import argparse
+import datetime
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from ncaa_football.sharding import parse_years
+from ncaa_football.snapshots import SnapshotStore
+
+HOST = "http://stats.ncaa.org"
+
+# Game-by-game stat categories (year_stat_category_id, link text, stat columns) with the
+# real site's column names, the dataset build (functions.schema.STAT_COLUMNS) reads them
+CATEGORIES = [(10999, 'Participation', ['Plays']),
+              (11000, 'Rushing', ['Rush Att', 'Rush Net Yards', 'Rush TD', 'Rush Long']),
+              (11001, 'Passing', ['Pass Att', 'Pass Comp', 'Pass Yards', 'Pass TD', 'Pass Int', 'Pass Long']),
+              (11002, 'Receiving', ['Receptions', 'Receiving Yards', 'Receiving TD', 'Rec Long']),
+              (11003, 'Total Offense', ['Total Plays', 'Total Yards', 'Yds/Play', 'T.O.P', 'First Downs',
+                                        '3rd Down Conv/Att', 'Penalties', 'Penalty Yards']),
+              (11004, 'Punting', ['Punts', 'Punt Yds', 'Punt Avg']),
+              (11005, 'Kickoff Returns', ['KO Ret', 'KO Ret Yds', 'KO Ret TD']),
+              (11006, 'Defense', ['Tackles Solo', 'Tackles Ast', 'Sacks', 'Int', 'Int R Yds', 'FR', 'F Ret Yds']),
+              (11007, 'Redzone', ['RZ Att', 'RZ Scores', 'RZ TD']),
+             ]
+
+POSITIONS = ['QB', 'RB', 'WR', 'TE', 'OL', 'DL', 'LB', 'DB', 'K', 'P']
+CLASSES = ['Fr', 'So', 'Jr', 'Sr']
+
+
+def season_label(year):
+    """Academic year label, 2017 -> '2016-17'"""
+    return "%d-%02d" % (year - 1, year % 100)
+
+
+def td(value):
+    return "<td>%s</td>" % (value,)
+
+
+def table(title, columns, rows):
+    """A stats.ncaa.org style table: a title row (unless title is None), a row of column names, then the rows"""
+    head = '' if title is None else '<tr class="heading"><td colspan="%d">%s</td></tr>' % (len(columns), title)
+    names = '<tr class="grey_heading">' + ''.join("<th>%s</th>" % col for col in columns) + "</tr>"
+    body = ''.join("<tr>" + ''.join(td(value) for value in row) + "</tr>" for row in rows)
+    return '<table class="mytable" width="50%%">%s%s%s</table>' % (head, names, body)
+
+
+class FixtureSite(object):
+    """Seeded synthetic league rendered as stats.ncaa.org pages
+
+    teams : number of teams
+    years : academic years with seasons
+    players : players on a roster
+    games : games per season
+    padding : kilobytes of navigation and script boilerplate per page (the real pages carry ~30KB)
+    seed : random seed, pages are the same for the same seed
+    """
+
+    def __init__(self, teams = 20, years = (2014, 2015, 2016, 2017), players = 40, games = 12, padding = 30, seed = 0):
+        self.teams = {1000 + idx: "Team %d %s" % (idx, ["Falcons", "Bears", "Owls", "Tigers"][idx % 4]) for idx in range(teams)}
+        self.years = list(years)
+        self.seasons = {12000 + 100 * (year - 2000) + 1: year for year in self.years}
+        self.season_ids = {year: sid for sid, year in self.seasons.items()}
+        self.players = players
+        self.games = games
+        self.seed = seed
+        self.schedules = {}
+        self.boilerplate = self.make_boilerplate(padding)
+        self.routes = [(re.compile(r"/team/inst_team_list$"), self.team_list),
+                       (re.compile(r"/team/(\d+)/(\d+)$"), self.team_page),
+                       (re.compile(r"/teams/history/MFB/(\d+)$"), self.history),
+                       (re.compile(r"/team/(\d+)/roster/(\d+)$"), self.roster),
+                       (re.compile(r"/people/(\d+)$"), self.coach),
+                       (re.compile(r"/team/(\d+)/stats/(\d+)$"), self.team_stats),
+                       (re.compile(r"/team/(\d+)/stats$"), self.stat_category),
+                       (re.compile(r"/player/game_by_game$"), self.game_by_game),
+                       (re.compile(r"/player/index$"), self.game_by_game_stats),
+                      ]
+
+    def rng(self, *key):
+        """Random numbers that depend only on the seed and the key"""
+        return random.Random(zlib.crc32(repr((self.seed,) + key).encode('utf-8')))
+
+    def make_boilerplate(self, kilobytes):
+        menu = ''.join('<li><a href="/menu/%d">Menu item %d</a></li>' % (idx, idx) for idx in range(40))
+        script = "<script>var config = {%s};</script>" % ','.join('"k%d": %d' % (idx, idx) for idx in range(200))
+        block = '<ul class="nav">%s</ul>%s' % (menu, script)
+        return block * max(1, kilobytes * 1024 // len(block))
+
+    def page(self, title, content, year = None):
+        """Wrap the content like the real pages: header, navigation, the content area"""
+        form = ""
+        if year is not None:
+            options = ''.join('<option value="%d"%s>%s</option>' % (self.season_ids[y], ' selected="selected"' if y == year else '',
+                                                                   season_label(y)) for y in self.years)
+            form = ('<fieldset><div><form id="change_sport_form"><select id="year_list">%s</select></form></div></fieldset>'
+                    % options)
+        return ('<html><head><title>%s</title></head><body><div id="header">%s</div>'
+                '<div id="contentarea">%s%s</div></body></html>' % (title, self.boilerplate, form, content))
+
+    def render(self, url):
+        """Return (status, body) for a stats.ncaa.org url"""
+        parts = urlsplit(url)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        for pattern, view in self.routes:
+            match = pattern.match(parts.path)
+            if match:
+                try:
+                    return 200, view(query, *[int(group) for group in match.groups()]).encode('utf-8')
+                except (KeyError, ValueError):
+                    break
+        return 404, b"<html><body>Not found</body></html>"
+
+    def season_schedule(self, year):
+        """Return org_id -> the season's games of every team as (date, opponent org_id, points for, points against)
+
+        Every week the teams are paired off at random (one sits out if there
+        is an odd number), both teams of a game list it with the same date
+        and score.
+        """
+        rng = self.rng('schedule', year)
+        games = {org: [] for org in self.teams}
+        first = datetime.date(year - 1, 9, 1)
+        for week in range(self.games):
+            date = (first + datetime.timedelta(days = 7 * week)).strftime("%m/%d/%Y")
+            order = list(self.teams)
+            rng.shuffle(order)
+            for home, away in zip(order[0::2], order[1::2]):
+                home_points, away_points = rng.randint(0, 56), rng.randint(0, 56)
+                if home_points == away_points:
+                    home_points += 3
+                games[home].append((date, away, home_points, away_points))
+                games[away].append((date, home, away_points, home_points))
+        return games
+
+    def schedule(self, org_id, year):
+        """Return the season's games of a team as (date, opponent org_id, points for, points against)"""
+        if year not in self.schedules:
+            self.schedules[year] = self.season_schedule(year)
+        return self.schedules[year][org_id]
+
+    def team_list(self, query):
+        year = int(query['academic_year'])
+        sid = self.season_ids[year]
+        rows = [('<a href="/team/%d/%d">%s</a>' % (org, sid, name), "Conference %d" % (org % 10)) for org, name in self.teams.items()]
+        return self.page("Teams", table("Teams", ["Team", "Conference"], rows))
+
+    def team_page(self, query, org_id, sid):
+        year = self.seasons[sid]
+        name = self.teams[org_id]
+        links = ('<fieldset><legend><a href="/team/%d/%d">%s</a></legend>'
+                 '<a href="/people/%d?sport_code=MFB">Coach %d</a> '
+                 '<a href="/teams/history/MFB/%d">Team History</a> '
+                 '<a href="/team/%d/roster/%d">Roster</a> '
+                 '<a href="/team/%d/stats/%d">Team Statistics</a></fieldset>'
+                 % (org_id, sid, name, 50000 + org_id, org_id, org_id, org_id, sid, org_id, sid))
+        results = [(date, '<a href="/team/%d/%d">%s</a>' % (opp, sid, self.teams[opp]), "%s %d - %d" % ("W" if pf > pa else "L", pf, pa))
+                   for date, opp, pf, pa in self.schedule(org_id, year)]
+        rng = self.rng('teamstats', org_id, year)
+        stats = [(stat, rng.randint(100, 5000), rng.randint(100, 5000)) for stat in
+                 ["Rushing Yards", "Passing Yards", "Total Offense", "First Downs", "Penalties", "Turnovers"]] + [("Totals", "", "")]
+        leaders = [("Player %d" % rng.randint(1, self.players), stat, rng.randint(10, 1500)) for stat in
+                   ["Rushing", "Passing", "Receiving", "Tackles"]] + [("Totals", "", "")]
+        content = (links + table("Menu", ["Sport"], [("Football",)]) +
+                   table("Schedule/Results", ["Date", "Opponent", "Result"], results) +
+                   table("Team Stats", ["Stat", "Offense", "Defense"], stats) +
+                   table("Individual Leaders", ["Player", "Stat", "Value"], leaders))
+        return self.page(name, content, year)
+
+    def history(self, query, org_id):
+        rng = self.rng('history', org_id)
+        rows = []
+        for year in range(self.years[0] - 10, self.years[-1] + 1):
+            wins = rng.randint(0, self.games)
+            rows.append((season_label(year), "Coach %d" % (50000 + org_id), "FBS", "Conference %d" % (org_id % 10), wins,
+                         self.games - wins, 0, "%.3f" % (wins / float(self.games)), ""))
+        rows.append(("Totals", "", "", "", "", "", "", "", ""))
+        columns = ["Year", "Head Coaches", "Division", "Conference", "Wins", "Losses", "Ties", "WL%", "Notes"]
+        return self.page(self.teams[org_id], table(None, columns, rows))
+
+    def roster(self, query, org_id, sid):
+        year = self.seasons[sid]
+        rng = self.rng('roster', org_id, year)
+        columns = ["Jersey", "Player", "Pos", "Yr", "GP", "GS"]
+        head = ('<thead><tr><th colspan="%d">Roster</th></tr><tr>%s</tr></thead>'
+                % (len(columns), ''.join("<th>%s</th>" % col for col in columns)))
+        body = ''.join("<tr>" + ''.join(td(value) for value in (idx, "Player %d, %s" % (idx, self.teams[org_id].split()[0]),
+                                                                 rng.choice(POSITIONS), rng.choice(CLASSES),
+                                                                 rng.randint(0, self.games), rng.randint(0, self.games))) + "</tr>"
+                       for idx in range(1, self.players + 1))
+        return self.page(self.teams[org_id], '<table class="mytable">%s<tbody>%s</tbody></table>' % (head, body), year)
+
+    def coach(self, query, person):
+        org_id = person - 50000
+        rng = self.rng('coach', person)
+        rows = []
+        for year in self.years:
+            wins = rng.randint(0, self.games)
+            rows.append((season_label(year), self.teams[org_id], wins, self.games - wins, 0, "%.3f" % (wins / float(self.games)), ""))
+        rows.append(("Totals", "", "", "", "", "", ""))
+        content = (table("Coach", ["Name"], [("Coach %d" % person,)]) +
+                   table(None, ["Year", "Team", "Wins", "Losses", "Ties", "WL%", ""], rows))
+        return self.page("Coach %d" % person, content)
+
+    def stats_table(self, columns, rows, trailer):
+        # The real stats tables end with an unlabeled column and total rows
+        columns = columns + [""]
+        rows = [row + ("",) for row in rows] + [("Totals",) + ("",) * (len(columns) - 1)] * trailer
+        return table(None, columns, rows)
+
+    def team_stats(self, query, org_id, sid):
+        year = self.seasons[sid]
+        rng = self.rng('rushing', org_id, year)
+        categories = table("Categories", ["Category"], [('<a href="/team/%d/stats?id=%d&amp;year_stat_category_id=%d">%s</a>'
+                                                          % (org_id, sid, cat, text),) for cat, text, columns in CATEGORIES])
+        gamebygame = ('<a href="/player/game_by_game?game_sport_year_ctl_id=%d&amp;org_id=%d&amp;stats_player_seq=-100">'
+                      'Game By Game</a>' % (sid, org_id))
+        rows = [("Player %d" % idx, rng.choice(POSITIONS), rng.randint(0, 300), rng.randint(0, 1500), rng.randint(0, 20))
+                for idx in range(1, self.players // 2)]
+        stats = self.stats_table(["Player", "Pos", "Rush Att", "Rush Net Yards", "Rush TD"], rows, 1)
+        content = '%s%s<div id="stats_div">%s%s</div>' % (table("Menu", ["Sport"], [("Football",)]), gamebygame, categories, stats)
+        return self.page(self.teams[org_id], content, year)
+
+    def stat_category(self, query, org_id):
+        sid = int(query['id'])
+        year = self.seasons[sid]
+        cat, text, columns = [c for c in CATEGORIES if c[0] == int(query['year_stat_category_id'])][0]
+        rng = self.rng('category', org_id, year, cat)
+        rows = [("Player %d" % idx, rng.choice(POSITIONS)) + tuple(rng.randint(0, 900) for col in columns)
+                for idx in range(1, self.players // 2)]
+        stats = self.stats_table(["Player", "Pos"] + columns, rows, 3)
+        content = '%s<div id="stats_div">%s%s</div>' % (table("Menu", ["Sport"], [("Football",)]), table("Categories", ["Category"], [(text,)]), stats)
+        return self.page(self.teams[org_id], content, year)
+
+    def game_by_game(self, query):
+        sid, org_id = int(query['game_sport_year_ctl_id']), int(query['org_id'])
+        year = self.seasons[sid]
+        links = ''.join('<a href="/player/index?id=%d&amp;org_id=%d&amp;stats_player_seq=-100&amp;year_stat_category_id=%d">%s</a> '
+                        % (sid, org_id, cat, text) for cat, text, columns in CATEGORIES)
+        content = '<div>%s</div>%s' % (links, table("Game By Game", ["Team"], [(self.teams[org_id],)]))
+        return self.page(self.teams[org_id], content, year)
+
+    def game_by_game_stats(self, query):
+        sid, org_id, cat = int(query['id']), int(query['org_id']), int(query['year_stat_category_id'])
+        year = self.seasons[sid]
+        name = self.teams[org_id]
+        cat, text, columns = [c for c in CATEGORIES if c[0] == cat][0]
+        rng = self.rng('gamebygame', org_id, year, cat)
+
+        def value(col):
+            if col == 'T.O.P':
+                return "%d:%02d" % (rng.randint(20, 40), rng.randint(0, 59))
+            if '/' in col and col != 'Yds/Play':
+                return "%d/%d" % (rng.randint(0, 12), rng.randint(12, 20))
+            return "{:,}".format(rng.randint(0, 1200))
+
+        def values():
+            return tuple(value(col) for col in columns)
+
+        schedule = self.schedule(org_id, year)
+        yearly = [(season_label(year), name, len(schedule)) + values(), ("", "Defensive Totals", len(schedule)) + values()]
+        games = []
+        for date, opp, pf, pa in schedule:
+            result = "%s %d - %d" % ("W" if pf > pa else "L", pf, pa)
+            games.append((date, '<a href="/team/%d/%d">%s</a>' % (opp, sid, self.teams[opp]), result, 1) + values())
+            games.append(("", "Defensive Totals", "", 1) + values())
+        content = (table("Menu", ["Sport"], [("Football",)]) + table("Player", ["Name"], [(name,)]) +
+                   table("Career Totals", ["Year", "Team", "G"] + columns, yearly) +
+                   table("Game Notes", ["Notes"], [("Game by game",)]) +
+                   table("Game By Game", ["Date", "Opponent", "Result", "G"] + columns, games))
+        return self.page(name, content, year)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves the server's pages for proxy (absolute url) and direct requests"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        url = self.path if self.path.startswith("http") else HOST + self.path
+        delay = server.latency + (random.uniform(0, server.jitter) if server.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        if server.error_rate and random.random() < server.error_rate:
+            status, body = server.error_status, b"<html><body>Service Unavailable</body></html>"
+        else:
+            status, body = server.respond(url)
+        server.count(status, delay)
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """HTTP server answering stats.ncaa.org urls from a FixtureSite or a snapshot store
+
+    site : FixtureSite for the pages not in the snapshot store
+    snapshots : snapshot store directory to serve recorded pages from (None for synthetic pages only)
+    latency : seconds slept before every response
+    jitter : up to this many more seconds slept (uniform)
+    error_rate : share of requests answered with error_status
+    error_status : status of the injected errors
+    """
+    daemon_threads = True
+
+    def __init__(self, address = ('127.0.0.1', 0), site = None, snapshots = None, latency = 0.0, jitter = 0.0,
+                 error_rate = 0.0, error_status = 503):
+        ThreadingHTTPServer.__init__(self, address, FixtureHandler)
+        self.site = site or FixtureSite()
+        self.snapshots = snapshots
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.statuses = Counter()
+        self.served = 0
+        self.slept = 0.0
+
+    @property
+    def url(self):
+        return "http://%s:%d" % self.server_address[:2]
+
+    def respond(self, url):
+        """Return (status, body) for a url, recorded pages first"""
+        if self.snapshots is not None:
+            # sqlite connections stay on the thread that opened them
+            if not hasattr(self.local, 'store'):
+                self.local.store = SnapshotStore(self.snapshots)
+            snapshot = self.local.store.get(url)
+            if snapshot is not None:
+                return snapshot.status, snapshot.body
+        return self.site.render(url)
+
+    def count(self, status, delay):
+        with self.lock:
+            self.statuses[status] += 1
+            self.served += 1
+            self.slept += delay
+
+    def stats(self):
+        """Requests served, by status, and the latency added"""
+        with self.lock:
+            return {'requests': self.served, 'statuses': {str(k): v for k, v in sorted(self.statuses.items())},
+                    'latency_added_seconds': round(self.slept, 3)}
+
+    def start(self):
+        """Serve from a daemon thread, returns the thread"""
+        thread = threading.Thread(target = self.serve_forever, daemon = True)
+        thread.start()
+        return thread
+
+
+def add_server_arguments(parser):
+    """Command line options shared by the server and the crawl benchmark"""
+    parser.add_argument('--teams', type = int, default = 20, help = "teams in the synthetic league")
+    parser.add_argument('--years', default = '2016-2017', help = "seasons, e.g. 2014-2017")
+    parser.add_argument('--players', type = int, default = 40, help = "players per roster")
+    parser.add_argument('--games', type = int, default = 12, help = "games per season")
+    parser.add_argument('--padding', type = int, default = 30, help = "KB of boilerplate per page")
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--snapshots', default = None, help = "snapshot store to serve recorded pages from")
+    parser.add_argument('--latency', type = float, default = 0.0, help = "seconds before every response")
+    parser.add_argument('--jitter', type = float, default = 0.0, help = "up to this many more seconds")
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = "share of requests answered with an error")
+    parser.add_argument('--error-status', type = int, default = 503)
+
+
+def server_from_arguments(args, port = 0):
+    site = FixtureSite(teams = args.teams, years = parse_years(args.years), players = args.players, games = args.games,
+                       padding = args.padding, seed = args.seed)
+    return FixtureServer(('127.0.0.1', port), site = site, snapshots = args.snapshots, latency = args.latency,
+                         jitter = args.jitter, error_rate = args.error_rate, error_status = args.error_status)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Local stats.ncaa.org stand-in (use it as the http_proxy)")
+    parser.add_argument('--port', type = int, default = 8650)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    server = server_from_arguments(args, args.port)
+    print("Serving stats.ncaa.org fixtures on %s (http_proxy=%s)" % (server.url, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats())
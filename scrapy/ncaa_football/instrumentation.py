@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+# Where a crawl's time goes and what it produces
+#
+# With INSTRUMENTATION_ENABLED = True a crawl keeps these counters in the
+# stats collector, under instrumentation/
+#
+#   callback/<name>/calls, wall_seconds, cpu_seconds, output_seconds
+#       per spider callback (parse, parse_stats, parse_data, ...): the call
+#       and the iteration of its output, output_seconds is the iteration
+#       alone (cleaning the tables, building the items and requests).  With
+#       PARSE_PROCESSES = 0 the call includes reading the tables.
+#   tables/parse_seconds
+#       reading the HTML tables (ncaa_football.parsing), wherever it ran
+#   items/<file>/items, rows, bytes, export_seconds
+#       per item file, counted by the pipelines (the Parquet files are
+#       counted when their buffers are written out)
+#   responses/<page>/count, bytes, latency_seconds, latency_max
+#       per kind of page (ncaa_football.urls.URL_PATTERNS), latency is the
+#       download latency of the request
+#
+# Every INSTRUMENTATION_INTERVAL seconds (default 60) and when the spider
+# closes the counters are appended as one JSON line to INSTRUMENTATION_FILE
+# (default instrumentation.jsonl), so a crawl can be graphed as it goes:
+#
+#   {"time": ..., "spider": "GameByGame", "elapsed": 60.0, "final": false, "stats": {"callback/parse_data/calls": 812, ...}}
+#
+#   scrapy crawl GameByGame -s INSTRUMENTATION_ENABLED=1 -s INSTRUMENTATION_INTERVAL=10
+import json
+import time
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.misc import arg_to_iter
+from twisted.internet import defer, task
+from ncaa_football.urls import url_pattern
+
+PREFIX = 'instrumentation/'
+
+
+def record_items(stats, file, items = 0, rows = 0, nbytes = 0, seconds = 0.0):
+    """Add to the counters of an item file"""
+    for name, value in [('items', items), ('rows', rows), ('bytes', nbytes), ('export_seconds', seconds)]:
+        if value:
+            stats.inc_value('%sitems/%s/%s' % (PREFIX, file, name), value)
+
+
+class CallbackInstrumentation(object):
+    """Spider middleware timing the spider callbacks (enabled by INSTRUMENTATION_ENABLED)
+
+    Swaps the callback of each response's request for a timed one before
+    Scrapy calls it.  Callbacks returning a Deferred (the tables read by
+    HtmlParsingSpider) have the output of the Deferred timed.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('INSTRUMENTATION_ENABLED'):
+            raise NotConfigured
+        return cls(crawler.stats)
+
+    def process_spider_input(self, response, spider):
+        request = response.request
+        callback = request.callback or spider.parse
+        if not getattr(callback, 'instrumented', False):
+            request.callback = self.timed(callback, spider)
+        return None
+
+    def add(self, spider, name, values):
+        for key, value in values.items():
+            self.stats.inc_value('%scallback/%s/%s' % (PREFIX, name, key), value, spider = spider)
+
+    def timed(self, callback, spider):
+        """Return callback wrapped to add its times to the stats"""
+        name = getattr(callback, '__name__', 'callback')
+
+        def instrumented(response, **kwargs):
+            started, started_cpu = time.perf_counter(), time.process_time()
+            try:
+                result = callback(response, **kwargs)
+            finally:
+                self.add(spider, name, {'calls': 1,
+                                        'wall_seconds': time.perf_counter() - started,
+                                        'cpu_seconds': time.process_time() - started_cpu})
+            if isinstance(result, defer.Deferred):
+                return result.addCallback(self.timed_output, spider, name)
+            return self.timed_output(result, spider, name)
+
+        instrumented.instrumented = True
+        return instrumented
+
+    def timed_output(self, result, spider, name):
+        if result is None:
+            return result
+        return self.iterate(iter(arg_to_iter(result)), spider, name)
+
+    def iterate(self, result, spider, name):
+        # The callbacks are generators, the items and requests are built as the output is iterated
+        wall = cpu = 0.0
+        try:
+            while True:
+                started, started_cpu = time.perf_counter(), time.process_time()
+                try:
+                    out = next(result)
+                except StopIteration:
+                    break
+                finally:
+                    wall += time.perf_counter() - started
+                    cpu += time.process_time() - started_cpu
+                yield out
+        finally:
+            self.add(spider, name, {'wall_seconds': wall, 'cpu_seconds': cpu, 'output_seconds': wall})
+
+
+class Instrumentation(object):
+    """Extension counting the responses by kind of page and writing the instrumentation
+    counters to the JSON lines file (enabled by INSTRUMENTATION_ENABLED)
+
+    path : JSON lines file
+    interval : seconds between writes
+    """
+
+    def __init__(self, stats, path, interval = 60.0):
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self.started = None
+        self.file = None
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('INSTRUMENTATION_ENABLED'):
+            raise NotConfigured
+        extension = cls(crawler.stats, settings.get('INSTRUMENTATION_FILE', 'instrumentation.jsonl'),
+                        settings.getfloat('INSTRUMENTATION_INTERVAL', 60.0))
+        crawler.signals.connect(extension.spider_opened, signal = signals.spider_opened)
+        crawler.signals.connect(extension.response_received, signal = signals.response_received)
+        crawler.signals.connect(extension.spider_closed, signal = signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.started = time.time()
+        self.file = open(self.path, 'a')
+        if self.interval > 0:
+            self.task = task.LoopingCall(self.emit, spider)
+            self.task.start(self.interval, now = False)
+
+    def response_received(self, response, request, spider):
+        key = '%sresponses/%s/' % (PREFIX, url_pattern(response.url))
+        self.stats.inc_value(key + 'count', spider = spider)
+        self.stats.inc_value(key + 'bytes', len(response.body), spider = spider)
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.stats.inc_value(key + 'latency_seconds', latency, spider = spider)
+            self.stats.max_value(key + 'latency_max', latency, spider = spider)
+
+    def emit(self, spider, final = False, reason = None):
+        """Append the instrumentation counters to the JSON lines file"""
+        parser = getattr(spider, 'html_parser', None)
+        if parser is not None:
+            self.stats.set_value(PREFIX + 'tables/parse_seconds', parser.parse_seconds, spider = spider)
+        counters = {key[len(PREFIX):]: round(value, 6) if isinstance(value, float) else value
+                    for key, value in sorted(self.stats.get_stats(spider).items()) if key.startswith(PREFIX)}
+        line = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'spider': spider.name,
+                'elapsed': round(time.time() - self.started, 3),
+                'final': final,
+                'pages': self.stats.get_value('response_received_count', 0, spider = spider),
+                'items': self.stats.get_value('item_scraped_count', 0, spider = spider),
+                'stats': counters,
+               }
+        if reason is not None:
+            line['finish_reason'] = reason
+        self.file.write(json.dumps(line) + '\n')
+        self.file.flush()
+
+    def spider_closed(self, spider, reason):
+        # The pipelines have written out their files by now
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.emit(spider, final = True, reason = reason)
+        self.file.close()
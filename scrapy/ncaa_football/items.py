@@ -5,13 +5,89 @@
 # See documentation in:
 # http://doc.scrapy.org/en/latest/topics/items.html
 
+from dataclasses import dataclass
 import scrapy
-from scrapy.item import DictItem, Field
-    
+from scrapy.item import Field
+
+# Item classes already created, keyed on (base class, class name, fields)
+item_classes = {}
+
+
 def create_item_class(class_name,field_list):
-    """Create item class"""
-    field_dict = {}
-    for field_name in field_list:
-        field_dict[field_name] = Field()
+    """Create item class (reused if the name and fields have been seen before)"""
+    key = (scrapy.Item, class_name, frozenset(field_list))
+    if key not in item_classes:
+        field_dict = {}
+        for field_name in field_list:
+            field_dict[field_name] = Field()
+
+        item_classes[key] = type(class_name, (scrapy.Item,), {'fields':field_dict})
+    return item_classes[key]
+
+
+class RowItem(scrapy.Item):
+    """Table row item: a tuple of values read against the field schema shared by
+    every row of the class.  Create the classes with create_row_class.
+
+    A scrapy.Item (the field names are table headers, not identifiers, so not a
+    dataclass) holding its values in a tuple instead of the Item's dict.
+    """
+    __slots__ = ('_values',)
+    _index = {}
+
+    def __init__(self, values):
+        self._values = tuple(values)
+
+    def copy(self):
+        return type(self)(self._values)
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def items(self):
+        return zip(self._index, self._values)
+
+    def get(self, key, default = None):
+        return self[key] if key in self._index else default
+
+    def __repr__(self):
+        return "%s%r" % (type(self).__name__, self._values)
+
+
+def create_row_class(class_name, field_list):
+    """Create row item class (reused if the name and fields have been seen before)"""
+    field_list = tuple(field_list)
+    key = (RowItem, class_name, field_list)
+    if key not in item_classes:
+        item_classes[key] = type(class_name, (RowItem,), {'__slots__': (),
+                                                          'fields': {field_name: Field() for field_name in field_list},
+                                                          '_index': {field_name: idx for idx, field_name in enumerate(field_list)},
+                                                         })
+    return item_classes[key]
+
+
+@dataclass(repr = False)
+class TableItem(object):
+    """Item carrying a whole parsed table through the pipeline in one piece
+
+       name : logical item name, used for the output file like an item class name
+       table : pandas DataFrame (or anything with to_pandas(), e.g. an Arrow record batch)
+    """
+    __slots__ = ('name', 'table')
+    name: str
+    table: object
 
-    return type(class_name, (DictItem,), {'fields':field_dict})
+    def __repr__(self):
+        return "%s(%r, %d rows)" % (type(self).__name__, self.name, len(self.table))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# HTML table parsing for the spider callbacks
+#
+# Table extraction (ncaa_football.tables) runs on the reactor thread, so
+# while a page is parsed nothing is downloaded.  With
+# PARSE_PROCESSES > 0 the response bodies are parsed in a process pool and
+# the callbacks get the tables back through a Deferred, so the reactor keeps
+# downloading while every core parses.  Scrapy chains a Deferred returned by
+# a callback and iterates its result as the callback output, and the scraper
+# caps the responses being processed (SCRAPER_SLOT_MAX_ACTIVE_SIZE), which
+# bounds the bodies waiting for the pool.
+#
+#   PARSE_PROCESSES = 0     parse on the reactor thread (default)
+#   PARSE_PROCESSES = 4     parse in 4 worker processes
+import concurrent.futures
+import multiprocessing
+import time
+from scrapy import signals
+from twisted.internet import defer, reactor
+from ncaa_football.tables import read_tables
+
+
+def timed(func, *args):
+    """Return (seconds, func(*args)), to time work done in the pool"""
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+class HtmlParser(object):
+    """Parses HTML tables inline or in a process pool, returning Deferreds
+
+    parse_seconds adds up the time spent parsing, wherever it ran.
+    """
+
+    def __init__(self, processes = 0):
+        self.processes = processes
+        self.pool = None
+        self.parse_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.getint('PARSE_PROCESSES', 0))
+
+    def read_tables(self, body, tables):
+        """Returns a Deferred firing with read_tables(body, tables)"""
+        return self.submit(read_tables, body, tables)
+
+    def submit(self, func, *args):
+        """Returns a Deferred firing with func(*args), func a module level function"""
+        if self.processes <= 0:
+            started = time.perf_counter()
+            try:
+                return defer.maybeDeferred(func, *args)
+            finally:
+                self.parse_seconds += time.perf_counter() - started
+        if self.pool is None:
+            # Spawned workers don't inherit the reactor's threads and locks
+            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers = self.processes,
+                                                               mp_context = multiprocessing.get_context('spawn'))
+        d = defer.Deferred()
+        future = self.pool.submit(timed, func, *args)
+        future.add_done_callback(lambda f: reactor.callFromThread(self.fire, d, f))
+        return d
+
+    def fire(self, d, future):
+        """Fire the Deferred with the future's result, on the reactor thread"""
+        try:
+            seconds, result = future.result()
+        except Exception as e:
+            d.errback(e)
+        else:
+            self.parse_seconds += seconds
+            d.callback(result)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait = True)
+            self.pool = None
+
+
+class HtmlParsingSpider(object):
+    """Spider mixin adding read_tables(response, tables), a Deferred of the page's tables
+
+    Mix in ahead of scrapy.Spider; the pool is shut down when the spider closes.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(HtmlParsingSpider, cls).from_crawler(crawler, *args, **kwargs)
+        spider.html_parser = HtmlParser.from_settings(crawler.settings)
+        crawler.signals.connect(spider.close_html_parser, signal = signals.spider_closed)
+        return spider
+
+    def close_html_parser(self):
+        self.html_parser.close()
+
+    def read_tables(self, response, tables):
+        """Returns a Deferred firing with {key: DataFrame} for the tables asked for (see ncaa_football.tables)"""
+        if not hasattr(self, 'html_parser'):
+            self.html_parser = HtmlParser()
+        return self.html_parser.read_tables(response.body, tables)
@@ -4,8 +4,56 @@
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: http://doc.scrapy.org/en/latest/topics/item-pipeline.html
+import csv
+import glob
+import logging
 import os
+import shutil
+import time
+import pandas as pd
+from scrapy.exceptions import NotConfigured
 from scrapy.exporters import CsvItemExporter
+from ncaa_football.items import TableItem
+from ncaa_football.instrumentation import record_items
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+
+def item_file(item):
+    """Return the output file name and directory for an item"""
+    if isinstance(item, TableItem): 
+        name = item.name
+    else: 
+        name = type(item).__name__
+    file = name.replace("item_", "").lower()
+    if "link" in file: 
+        _dir = "Links" 
+    else: 
+        _dir = "Data"
+    return file, _dir
+
+def existing_header(path):
+    """Return the header of a non-empty CSV file (None if there isn't one)"""
+    if not os.path.isfile(path) or not os.path.getsize(path): 
+        return None
+    with open(path, newline = '', encoding = 'utf-8') as f: 
+        return next(csv.reader(f), None)
+
+def trim_partial_row(path):
+    """Cut a row left half written by a killed crawl off the end of a file"""
+    with open(path, 'rb+') as f: 
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        f.seek(max(0, end - 65536))
+        tail = f.read()
+        if tail and not tail.endswith(b'\n'): 
+            f.truncate(end - len(tail) + tail.rfind(b'\n') + 1)
 
 class Pipeline(object):
     """Scrapy Pipeline Object"""
@@ -13,29 +61,309 @@ class Pipeline(object):
     def __init__(self):
         self.files = {}
         self.exporters = {}
+        # Sharded crawls (ncaa_football.sharding) write <file>.<shard>.csv and append when resuming
+        self.suffix = ''
+        self.append = False
+        # Item file counters (ncaa_football.instrumentation), with INSTRUMENTATION_ENABLED
+        self.stats = None
+    
+    def open_spider(self, spider):
+        crawler = getattr(spider, 'crawler', None)
+        if crawler is not None and crawler.settings.getbool('INSTRUMENTATION_ENABLED'): 
+            self.stats = crawler.stats
+        progress = getattr(spider, 'shard_progress', None)
+        if progress is not None: 
+            self.suffix = '.' + progress.name
+            self.append = progress.resumed
+            progress.flush_hooks.append(self.flush_files)
     
     def create_file(self, file, _dir): 
         # if the file doesn't exist create it 
         if file not in self.files:
-            self.files[file] = open(os.path.join(_dir, file + '.csv'), 'wb')
+            path = os.path.join(_dir, file + self.suffix + '.csv')
+            header = existing_header(path) if self.append else None
+            if header: 
+                trim_partial_row(path)
+            self.files[file] = open(path, 'ab' if header else 'wb')
             self.exporters[file] = CsvItemExporter(self.files[file])
+            if header: 
+                # Keep writing the columns of the file being resumed
+                self.exporters[file].fields_to_export = header
+                self.exporters[file]._headers_not_written = False
             self.exporters[file].start_exporting()
     
+    def flush_files(self):
+        [f.flush() for f in self.files.values() if not f.closed]
+        [os.fsync(f.fileno()) for f in self.files.values() if not f.closed]
+    
     def close_spider(self, spider):
         [e.finish_exporting() for e in self.exporters.values()]
         [f.close() for f in self.files.values()]
  
+    def export_table(self, file, table):
+        """Write a whole table to the file in one call"""
+        if hasattr(table, 'to_pandas'): 
+            table = table.to_pandas()
+        exporter = self.exporters[file]
+        # First write sets the columns for the file like the first item does for the exporter
+        header = exporter.fields_to_export is None
+        if header: 
+            exporter.fields_to_export = list(table.columns)
+            exporter._headers_not_written = False
+        csv = table.reindex(columns = exporter.fields_to_export).to_csv(index = False, header = header)
+        self.files[file].write(csv.encode('utf-8'))
+ 
     def process_item(self, item, spider):
         # Define what item type it is 
-        file = type(item).__name__.replace("item_", "").lower()
-        if "link" in file: 
-            _dir = "Links" 
-        else: 
-            _dir = "Data"
+        file, _dir = item_file(item)
         
         self.create_file(file, _dir)
+        started, position = time.perf_counter(), self.files[file].tell()
         
         # Export 
-        self.exporters[file].export_item(item)
+        if isinstance(item, TableItem): 
+            self.export_table(file, item.table)
+        else: 
+            self.exporters[file].export_item(item)
         
+        if self.stats is not None: 
+            record_items(self.stats, file, items = 1, rows = len(item.table) if isinstance(item, TableItem) else 1, 
+                         nbytes = self.files[file].tell() - position, seconds = time.perf_counter() - started)
+        return item
+
+
+class ParquetPipeline(Pipeline):
+    """Scrapy Pipeline writing the Data items as partitioned Parquet datasets
+
+       Rows are buffered per item type and flushed as typed, compressed Parquet
+       files laid out as Data/<item>/season=<yyyy>/[org_id=<id>/]part-<n>.parquet
+       so loads can pick the columns and seasons they need, e.g.
+
+           pd.read_parquet('Data/gamebygame_rushing', columns = [...], filters = [('season', '=', 2016)])
+
+       Link items are still written as CSV since the other spiders read them back.
+       Sharded crawls write part-<shard>-<n>.parquet files, so shards share the datasets.
+       A new crawl replaces the parts of an earlier one (a new shard only its own parts),
+       a resumed shard adds to them.
+
+       Columns are typed by the first flush with values in them, a column that turns up
+       later or only has values later widens the schema and the parts already written
+       are rewritten to it, so every part of the crawl has the same columns.
+
+       Settings:
+
+       PARQUET_PARTITION_COLS : partition columns, 'season' and optionally 'org_id' (default ['season'])
+       PARQUET_ROW_GROUP_SIZE : rows per row group, also the buffer size that triggers a flush (default 50000)
+       PARQUET_MEMORY_BUDGET : bytes buffered across all item types before the largest buffer is flushed (default 64MB)
+       PARQUET_COMPRESSION : parquet compression codec (default 'snappy')
+    """
+
+    def __init__(self, partition_cols = ('season',), row_group_size = 50000, 
+                 memory_budget = 64 * 1024 ** 2, compression = 'snappy', root = 'Data'):
+        if pa is None:
+            raise NotConfigured("ParquetPipeline requires pyarrow")
+        super(ParquetPipeline, self).__init__()
+        self.partition_cols = list(partition_cols)
+        self.row_group_size = row_group_size
+        self.memory_budget = memory_budget
+        self.compression = compression
+        self.root = root
+        # Per item type: buffered frames, buffered rows, buffered bytes, schema, parts counter, part files
+        self.frames = {}
+        self.rows = {}
+        self.nbytes = {}
+        self.schemas = {}
+        self.parts = {}
+        self.written = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(partition_cols = settings.getlist('PARQUET_PARTITION_COLS', ['season']), 
+                   row_group_size = settings.getint('PARQUET_ROW_GROUP_SIZE', 50000), 
+                   memory_budget = settings.getint('PARQUET_MEMORY_BUDGET', 64 * 1024 ** 2), 
+                   compression = settings.get('PARQUET_COMPRESSION', 'snappy'))
+
+    def process_item(self, item, spider):
+        file, _dir = item_file(item)
+        if _dir != "Data": 
+            return super(ParquetPipeline, self).process_item(item, spider)
+
+        if isinstance(item, TableItem): 
+            table = item.table.to_pandas() if hasattr(item.table, 'to_pandas') else item.table
+            self.frames.setdefault(file, []).append(table)
+            rows = len(table)
+            self.rows[file] = self.rows.get(file, 0) + rows
+            self.nbytes[file] = self.nbytes.get(file, 0) + int(table.memory_usage(deep = True).sum())
+        else: 
+            row = dict(item.items())
+            self.frames.setdefault(file, []).append(row)
+            rows = 1
+            self.rows[file] = self.rows.get(file, 0) + 1
+            self.nbytes[file] = self.nbytes.get(file, 0) + 64 * len(row)
+        if self.stats is not None: 
+            record_items(self.stats, file, items = 1, rows = rows)
+
+        if self.rows[file] >= self.row_group_size: 
+            self.flush(file)
+        # Keep the buffers under the memory budget by flushing the biggest one 
+        while sum(self.nbytes.values()) > self.memory_budget: 
+            self.flush(max(self.nbytes, key = self.nbytes.get))
         return item
+
+    def close_spider(self, spider):
+        for file in list(self.frames): 
+            self.flush(file)
+        super(ParquetPipeline, self).close_spider(spider)
+
+    def flush_files(self):
+        # A shard checkpoint writes out everything buffered
+        for file in list(self.frames): 
+            self.flush(file)
+        super(ParquetPipeline, self).flush_files()
+
+    def buffered_frame(self, file):
+        """Combine the buffered tables and rows for an item type into one DataFrame"""
+        frames, rows = [], []
+        for entry in self.frames.pop(file, []): 
+            if isinstance(entry, dict): 
+                rows.append(entry)
+            else: 
+                if rows: 
+                    frames.append(pd.DataFrame(rows))
+                    rows = []
+                frames.append(entry)
+        if rows: 
+            frames.append(pd.DataFrame(rows))
+        self.rows.pop(file, None)
+        self.nbytes.pop(file, None)
+        if not frames: 
+            return None
+        return pd.concat(frames, ignore_index = True, sort = False)
+
+    def typed_frame(self, file, data):
+        """Type the columns (numbers as float64, everything else as string), a column typed
+           by an earlier flush keeps its type and one without values yet is left untyped (null)
+        """
+        data = data.loc[:, ~data.columns.duplicated()]
+        schema = self.schemas.get(file)
+        if schema is not None: 
+            # Columns missing from this buffer are written as nulls, new ones go after the others
+            data = data.reindex(columns = schema.names + [col for col in data.columns if col not in schema.names])
+        for col in data.columns: 
+            if schema is not None and col in schema.names and not pa.types.is_null(schema.field(col).type): 
+                numeric = pa.types.is_floating(schema.field(col).type)
+            elif data[col].isnull().all(): 
+                data[col] = pd.Series(None, index = data.index, dtype = object)
+                continue
+            else: 
+                numeric = pd.to_numeric(data[col].dropna(), errors = 'coerce').notnull().all()
+            if numeric: 
+                values = pd.to_numeric(data[col], errors = 'coerce').astype('float64')
+                lost = values.isnull() & data[col].notnull() & (data[col].astype(str).str.strip() != '')
+                if lost.any(): 
+                    logger.warning("%s.%s: %d non-numeric values written as null (e.g. %r)", 
+                                   file, col, lost.sum(), data[col][lost].iloc[0])
+                data[col] = values
+            else: 
+                data[col] = data[col].where(data[col].isnull(), data[col].astype(str)).astype(object)
+        return data
+
+    def partition_values(self, data):
+        """Return the partition columns for the rows of a table
+
+           season : four digit season taken from the year/Year column (2016-17 -> 2016) or the Date
+           anything else (e.g. org_id) : the column itself, which is then only kept in the path
+           (rows without a value are written to <col>=-1)
+        """
+        partitions = pd.DataFrame(index = data.index)
+        for col in self.partition_cols: 
+            if col == 'season': 
+                source = next((c for c in ['year', 'Year'] if c in data.columns), None)
+                if source is not None: 
+                    values = pd.to_numeric(data[source].astype(str).str.extract(r"(\d{4})", expand = False), errors = 'coerce')
+                elif 'Date' in data.columns: 
+                    values = pd.to_datetime(data['Date'], errors = 'coerce').dt.year
+                else: 
+                    values = pd.Series(float('nan'), index = data.index)
+            else: 
+                values = pd.to_numeric(data[col], errors = 'coerce') if col in data.columns else pd.Series(float('nan'), index = data.index)
+            partitions[col] = values.fillna(-1).astype(int)
+        return partitions
+
+    def part_pattern(self):
+        """Return the glob pattern of the part files this crawl (or shard) writes"""
+        if self.suffix: 
+            return "part%s-[0-9]*.parquet" % self.suffix.replace('.', '-')
+        return "part-[0-9]*.parquet"
+
+    def start_dataset(self, file):
+        """Clear the parts an earlier crawl left in an item type's dataset before the first flush,
+           a resumed shard instead carries on with its parts and their schema
+        """
+        path = os.path.join(self.root, file)
+        parts = sorted(glob.glob(os.path.join(path, '**', self.part_pattern()), recursive = True))
+        if self.append: 
+            self.written[file] = parts
+            if parts: 
+                self.schemas[file] = pq.read_schema(parts[0]).remove_metadata()
+        elif not self.suffix: 
+            shutil.rmtree(path, ignore_errors = True)
+            self.written[file] = []
+        else: 
+            # Other shards' parts are theirs to replace
+            for part in parts: 
+                os.remove(part)
+            self.written[file] = []
+
+    def widen_schema(self, file, data):
+        """Return the schema of the dataset with the columns of data, rewriting the parts
+           already written when it adds columns or types a column that was all null
+        """
+        schema = pa.Schema.from_pandas(data, preserve_index = False).remove_metadata()
+        if file in self.schemas: 
+            schema = pa.unify_schemas([self.schemas[file], schema])
+            if not schema.equals(self.schemas[file]) and self.written[file]: 
+                logger.info("%s: schema widened, rewriting %d parts", file, len(self.written[file]))
+                for part in self.written[file]: 
+                    table = pq.read_table(part, partitioning = None)
+                    columns = [table[field.name].cast(field.type) if field.name in table.column_names 
+                               else pa.nulls(len(table), field.type) for field in schema]
+                    pq.write_table(pa.Table.from_arrays(columns, schema = schema), part, 
+                                   row_group_size = self.row_group_size, compression = self.compression)
+        self.schemas[file] = schema
+        return schema
+
+    def flush(self, file):
+        """Write the buffered rows of an item type to a new part in each partition"""
+        started = time.perf_counter()
+        data = self.buffered_frame(file)
+        if data is None or not len(data): 
+            return
+        if file not in self.written: 
+            self.start_dataset(file)
+        written = 0
+        partitions = self.partition_values(data)
+        data = self.typed_frame(file, data.drop(columns = partitions.columns, errors = 'ignore'))
+        schema = self.widen_schema(file, data)
+        if self.partition_cols: 
+            groups = data.groupby([s for _, s in partitions.items()], sort = True)
+        else: 
+            groups = [((), data)]
+        for key, group in groups: 
+            key = key if isinstance(key, tuple) else (key,)
+            path = os.path.join(self.root, file, *["%s=%s" % (col, value) for col, value in zip(self.partition_cols, key)])
+            os.makedirs(path, exist_ok = True)
+            table = pa.Table.from_pandas(group, schema = schema, preserve_index = False)
+            self.parts[file] = self.parts.get(file, 0) + 1
+            # Shards write their own parts, a resumed shard carries on after its last one
+            name = "part%s-%05d.parquet" % (self.suffix.replace('.', '-'), self.parts[file])
+            while self.append and os.path.exists(os.path.join(path, name)): 
+                self.parts[file] += 1
+                name = "part%s-%05d.parquet" % (self.suffix.replace('.', '-'), self.parts[file])
+            pq.write_table(table, os.path.join(path, name), 
+                           row_group_size = self.row_group_size, compression = self.compression)
+            self.written[file].append(os.path.join(path, name))
+            written += os.path.getsize(os.path.join(path, name))
+        if self.stats is not None: 
+            record_items(self.stats, file, nbytes = written, seconds = time.perf_counter() - started)
@@ -50,21 +50,64 @@ ROBOTSTXT_OBEY = False
 #    'ncaa_football.middlewares.NcaaFootballSpiderMiddleware': 543,
 #}
 
+# Track finished start links for sharded, resumable crawls (ncaa_football.sharding),
+# e.g. scrapy crawl GameByGame -a "shard=years=2016;hash=0/4"
+SPIDER_MIDDLEWARES = {'ncaa_football.sharding.ShardProgressMiddleware': 950,
+                      'ncaa_football.instrumentation.CallbackInstrumentation': 960,}
+#SHARD_PROGRESS_DIR = 'Progress'
+#SHARD_CHECKPOINT_EVERY = 20
+
+# Seasons crawled by the teamlinks spider (or -a years=2010-2017)
+#TEAM_YEARS = [2014, 2015, 2016, 2017]
+
 # Enable or disable downloader middlewares
 # See http://scrapy.readthedocs.org/en/latest/topics/downloader-middleware.html
 #DOWNLOADER_MIDDLEWARES = {
 #    'ncaa_football.middlewares.MyCustomDownloaderMiddleware': 543,
 #}
 
+# Record raw responses to the snapshot store, or replay them with no network
+# (ncaa_football.snapshots), e.g. scrapy crawl GameByGame -s SNAPSHOT_MODE=replay, or reuse
+# the pages earlier runs and spiders stored with SNAPSHOT_MODE=reuse
+DOWNLOADER_MIDDLEWARES = {'ncaa_football.coalescing.CoalescingMiddleware': 940,
+                          'ncaa_football.snapshots.SnapshotMiddleware': 950,}
+#SNAPSHOT_MODE = 'record'
+#SNAPSHOT_DIR = 'Snapshots'
+#SNAPSHOT_COMPRESSION = 6
+#SNAPSHOT_MAX_AGE = 86400
+
+# Download each page once and hand it to every (team, year, stat) that asked
+# for it (ncaa_football.coalescing)
+DUPEFILTER_CLASS = 'ncaa_football.coalescing.ContextDupeFilter'
+#COALESCE_ENABLED = True
+#COALESCE_CACHE_SIZE = 64
+
 # Enable or disable extensions
 # See http://scrapy.readthedocs.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
 #}
 
+# Time the callbacks, item files and pages of a crawl into the stats and a JSON lines
+# file (ncaa_football.instrumentation), e.g. scrapy crawl GameByGame -s INSTRUMENTATION_ENABLED=1
+EXTENSIONS = {'ncaa_football.instrumentation.Instrumentation': 500,}
+#INSTRUMENTATION_ENABLED = True
+#INSTRUMENTATION_FILE = 'instrumentation.jsonl'
+#INSTRUMENTATION_INTERVAL = 60
+
 # Configure item pipelines
 # See http://scrapy.readthedocs.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {'ncaa_football.pipelines.Pipeline':800,}
+# Write the Data items as Parquet partitioned by season instead of CSV
+#ITEM_PIPELINES = {'ncaa_football.pipelines.ParquetPipeline':800,}
+#PARQUET_PARTITION_COLS = ['season']        # add 'org_id' to also partition by team
+#PARQUET_ROW_GROUP_SIZE = 50000
+#PARQUET_MEMORY_BUDGET = 64 * 1024 ** 2
+#PARQUET_COMPRESSION = 'snappy'
+
+# Parse the HTML tables in worker processes instead of on the reactor thread
+# (0, the default, parses inline)
+#PARSE_PROCESSES = 4
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See http://doc.scrapy.org/en/latest/topics/autothrottle.html
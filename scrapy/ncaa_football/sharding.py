@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+# Sharded, resumable crawls of the link driven spiders
+#
+# -a shard=SPEC splits the start links of a spider between workers, each on
+# its own process or machine:
+#
+#   scrapy crawl GameByGame -a shard=all                         one resumable shard
+#   scrapy crawl GameByGame -a shard=years=2010-2014,2016        seasons 2010 to 2014 and 2016
+#   scrapy crawl GameByGame -a shard=hash=0/4                    worker 0 of 4, split on org_id
+#   scrapy crawl GameByGame -a "shard=years=2016;hash=0/4"       both
+#
+# Seasons are academic years (2016-17 and academic_year=2017 are 2017) and
+# the hash split is a crc32 of the org_id, so N workers given hash=0/N to
+# hash=N-1/N crawl every link exactly once between them.
+#
+# Start links to the same page (ncaa_football.urls.url_fingerprint) that
+# differ in the spider's context_keys (team, year, ...) are all kept, each is
+# requested with its context in meta['coalesce_context'] so the page is
+# downloaded once and parsed for every context (ncaa_football.coalescing).
+# Links repeating a page and context are dropped, sharded or not.
+#
+# A sharded crawl keeps a ledger of the start links it has finished,
+# Progress/<spider>.<shard>.done.  A start link is finished once its page
+# and every request made from it have been parsed.  Every
+# SHARD_CHECKPOINT_EVERY finished links the pipelines flush their files and
+# the links are appended to the ledger, so a killed worker restarted with
+# the same arguments skips what was checkpointed and appends to its files.
+# Links in flight when a worker dies are crawled again (at least once), so
+# merge_shards drops duplicate rows.
+#
+# The outputs of a shard are written to <file>.<shard>.csv next to the
+# usual files, combine them with
+#
+#   python -m ncaa_football.sharding merge Data Links
+import csv
+import glob
+import os
+import re
+import sys
+import zlib
+from scrapy import signals
+from ncaa_football.urls import url_fingerprint, url_ids
+
+
+def parse_years(text):
+    """Return the list of years in '2010-2014,2016' style text"""
+    years = []
+    for part in str(text).split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-')
+            years.extend(range(int(start), int(end) + 1))
+        elif part:
+            years.append(int(part))
+    return years
+
+
+def season(value):
+    """Return the academic year of a year value (2016, '2016', '2016-17' -> 2017), None if there isn't one"""
+    match = re.search(r"(\d{4})(?:-(\d{2}))?", str(value))
+    if match is None:
+        return None
+    start = int(match.group(1))
+    if match.group(2):
+        end = start - start % 100 + int(match.group(2))
+        return end if end > start else end + 100
+    return start
+
+
+def org_bucket(org_id, parts):
+    """Return the hash partition of an org_id"""
+    try:
+        key = str(int(float(org_id)))
+    except (TypeError, ValueError):
+        key = str(org_id)
+    return zlib.crc32(key.encode('utf-8')) % parts
+
+
+class ShardSpec(object):
+    """Which start links a worker crawls
+
+    years : seasons to crawl (None for all)
+    part, parts : hash partition of the org_ids to crawl (0, 1 for all)
+    """
+
+    def __init__(self, years = None, part = 0, parts = 1):
+        if not 0 <= part < parts:
+            raise ValueError("Shard part %d is not in 0 to %d" % (part, parts - 1))
+        self.years = None if years is None else set(years)
+        self.part = part
+        self.parts = parts
+
+    @classmethod
+    def parse(cls, text):
+        """Parse 'all', 'years=2010-2014,2016', 'hash=0/4' or 'years=...;hash=...'"""
+        years, part, parts = None, 0, 1
+        for term in str(text).split(';'):
+            term = term.strip()
+            if not term or term == 'all':
+                continue
+            key, _, value = term.partition('=')
+            if key == 'years':
+                years = parse_years(value)
+            elif key == 'hash':
+                part, parts = [int(x) for x in value.split('/')]
+            else:
+                raise ValueError("Unknown shard term %r" % term)
+        return cls(years, part, parts)
+
+    @property
+    def name(self):
+        """Shard name used in the progress and output file names"""
+        terms = []
+        if self.years is not None:
+            terms.append('years%d-%d_%d' % (min(self.years), max(self.years), len(self.years)))
+        if self.parts > 1:
+            terms.append('hash%dof%d' % (self.part, self.parts))
+        return '_'.join(terms) or 'all'
+
+    def contains(self, year = None, org_id = None):
+        """Return True if a start link for this season and org_id (or url) belongs to the shard"""
+        if self.years is not None and season(year) not in self.years:
+            return False
+        return self.parts == 1 or org_bucket(org_id, self.parts) == self.part
+
+
+class Progress(object):
+    """Ledger of the finished start links of a shard
+
+    path : ledger file
+    checkpoint_every : finished links between checkpoints
+    """
+
+    def __init__(self, path, checkpoint_every = 20):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = set(line.strip() for line in f if line.strip())
+        self.resumed = bool(self.done)
+        self.pending = []
+        # Called before a checkpoint so the outputs of the links are on disk first
+        self.flush_hooks = []
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)[:-len('.done')].split('.', 1)[1]
+
+    def __contains__(self, url):
+        return url in self.done
+
+    def finish(self, url):
+        """Record a finished start link, checkpointing every checkpoint_every links"""
+        self.pending.append(url)
+        if len(self.pending) >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self, flush = True):
+        """Flush the outputs and append the finished links to the ledger"""
+        if not self.pending:
+            return
+        if flush:
+            for hook in self.flush_hooks:
+                hook()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok = True)
+        with open(self.path, 'a') as f:
+            f.write(''.join(url + '\n' for url in self.pending))
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(self.pending)
+        self.pending = []
+
+
+class ShardedSpider(object):
+    """Spider mixin for -a shard=SPEC (see the module notes)
+
+    Mix in ahead of scrapy.Spider and pass the start links through shard_links.
+    context_keys : start link fields a page is parsed for (links to one page differing in them are all crawled)
+    """
+    shard = None
+    shard_progress = None
+    context_keys = ()
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(ShardedSpider, cls).from_crawler(crawler, *args, **kwargs)
+        if spider.shard is not None:
+            spider.shard_spec = ShardSpec.parse(spider.shard)
+            path = os.path.join(crawler.settings.get('SHARD_PROGRESS_DIR', 'Progress'),
+                                '%s.%s.done' % (spider.name, spider.shard_spec.name))
+            spider.shard_progress = Progress(path, crawler.settings.getint('SHARD_CHECKPOINT_EVERY', 20))
+        return spider
+
+    def link_context(self, link):
+        """Return the context of a start link, for meta['coalesce_context']"""
+        return tuple(link.get(key) for key in self.context_keys)
+
+    def shard_links(self, links, url_key, year_key = 'year', org_key = 'org_id'):
+        """Return the start links (dicts) of this shard that aren't finished yet, one per page and context"""
+        keep, seen, pages = [], set(), set()
+        for link in links:
+            url = link[url_key]
+            fingerprint = url_fingerprint(url)
+            # repr so missing (NaN) values compare equal
+            key = (fingerprint, repr(self.link_context(link)))
+            if key in seen:
+                continue
+            seen.add(key)
+            if self.shard_progress is not None:
+                org_id = link.get(org_key)
+                if org_id is None or org_id != org_id:
+                    # Older link files have no org_id column
+                    org_id = url_ids(url)['org_id'] or url
+                if url in self.shard_progress or not self.shard_spec.contains(link.get(year_key), org_id):
+                    continue
+            keep.append(link)
+            pages.add(fingerprint)
+        if self.shard_progress is not None:
+            self.logger.info("Shard %s: %d of %d start links to crawl (%d finished), %d pages (%d contexts merged into them)",
+                             self.shard_spec.name, len(keep), len(links), len(self.shard_progress.done), len(pages),
+                             len(keep) - len(pages))
+        else:
+            self.logger.info("%d of %d start links to crawl, %d pages (%d contexts merged into them)", len(keep), len(links),
+                             len(pages), len(keep) - len(pages))
+        return keep
+
+
+class ShardProgressMiddleware(object):
+    """Spider middleware tracking when the start links of a sharded crawl are finished
+
+    Every request made from a start link's page (and from those pages) carries
+    the start link in meta['shard_root']; the link is finished when none of
+    its requests are left.  Requests dropped as duplicates count as done,
+    requests that fail (download errors, callback exceptions) never finish
+    their start link, which is crawled again by the next run.
+    """
+
+    def __init__(self):
+        self.outstanding = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls()
+        crawler.signals.connect(middleware.request_dropped, signal = signals.request_dropped)
+        crawler.signals.connect(middleware.spider_closed, signal = signals.spider_closed)
+        return middleware
+
+    def release(self, root, spider):
+        """One request of a start link is done"""
+        self.outstanding[root] -= 1
+        if not self.outstanding[root]:
+            del self.outstanding[root]
+            spider.shard_progress.finish(root)
+
+    def process_start_requests(self, start_requests, spider):
+        for request in start_requests:
+            if getattr(spider, 'shard_progress', None) is not None:
+                request.meta['shard_root'] = request.url
+                self.outstanding[request.url] = self.outstanding.get(request.url, 0) + 1
+            yield request
+
+    def process_spider_output(self, response, result, spider):
+        root = response.meta.get('shard_root')
+        for out in result:
+            if root is not None and hasattr(out, 'meta') and hasattr(out, 'callback'):
+                out.meta['shard_root'] = root
+                self.outstanding[root] += 1
+            yield out
+        if root is not None:
+            self.release(root, spider)
+
+    def request_dropped(self, request, spider):
+        root = request.meta.get('shard_root')
+        if root is not None and root in self.outstanding:
+            self.release(root, spider)
+
+    def spider_closed(self, spider):
+        # The pipelines have closed their files by now
+        if getattr(spider, 'shard_progress', None) is not None:
+            spider.shard_progress.checkpoint(flush = False)
+
+
+def merge_shards(directory):
+    """Combine the <file>.<shard>.csv outputs of a directory into <file>.csv
+
+    Rows repeated by resumed shards are dropped, the header is kept once.
+    Returns the list of files written.
+    """
+    shards = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.*.csv'))):
+        shards.setdefault(os.path.basename(path).split('.', 1)[0], []).append(path)
+
+    written = []
+    for name, paths in sorted(shards.items()):
+        out = os.path.join(directory, name + '.csv')
+        header, seen = None, set()
+        with open(out + '.tmp', 'w', newline = '') as f:
+            writer = csv.writer(f)
+            for path in paths:
+                with open(path, newline = '') as shard:
+                    reader = csv.reader(shard)
+                    columns = next(reader, None)
+                    if columns is None:
+                        continue
+                    if header is None:
+                        header = columns
+                        writer.writerow(header)
+                    index = [columns.index(col) if col in columns else None for col in header]
+                    for row in reader:
+                        row = tuple('' if idx is None or idx >= len(row) else row[idx] for idx in index)
+                        if row not in seen:
+                            seen.add(row)
+                            writer.writerow(row)
+        os.replace(out + '.tmp', out)
+        written.append(out)
+    return written
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'merge':
+        sys.exit("usage: python -m ncaa_football.sharding merge DIR [DIR ...]")
+    for directory in sys.argv[2:]:
+        for out in merge_shards(directory):
+            print(out)
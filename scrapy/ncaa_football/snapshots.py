@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# Raw response snapshots for re-parsing without the network
+#
+# SNAPSHOT_MODE = 'record' stores every response the spiders get (status
+# below 400, redirects included) and SNAPSHOT_MODE = 'replay' answers every
+# request from the store, so a changed callback can be re-run over a whole
+# crawl at disk speed.  A request that isn't in the store is dropped in
+# replay mode (snapshot/missing in the stats), it never goes to the network.
+# SNAPSHOT_MODE = 'reuse' does both: a page already in the store (fetched by
+# an earlier run or another spider, and no older than SNAPSHOT_MAX_AGE
+# seconds if that is set) is answered from it, anything else is downloaded
+# and recorded, so each page is fetched once across the spider chain.
+#
+#   scrapy crawl GameByGame -s SNAPSHOT_MODE=record
+#   scrapy crawl GameByGame -s SNAPSHOT_MODE=replay
+#   scrapy crawl GameByGame -s SNAPSHOT_MODE=reuse -s SNAPSHOT_MAX_AGE=86400
+#
+# Store layout (SNAPSHOT_DIR, default Snapshots)
+#
+#   index.sqlite                  canonical url -> digest, status, headers, size, fetch time
+#   objects/<2 hex>/<38 hex>      zlib compressed bodies named by their sha1, shared by
+#                                 every url (and spider) with the same body
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from collections import namedtuple
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from ncaa_football.urls import canonical_url
+
+Snapshot = namedtuple('Snapshot', ['url', 'status', 'headers', 'body'])
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, digest TEXT NOT NULL, status INTEGER NOT NULL,
+                                                    headers TEXT NOT NULL, size INTEGER NOT NULL, fetched REAL NOT NULL)"""
+
+
+class SnapshotStore(object):
+    """Content addressed store of raw responses keyed by canonical url
+
+    path : store directory
+    level : zlib compression level
+    commit_every : index writes between commits
+    """
+
+    def __init__(self, path, level = 6, commit_every = 500):
+        self.path = path
+        self.level = level
+        self.commit_every = commit_every
+        self.pending = 0
+        os.makedirs(os.path.join(path, 'objects'), exist_ok = True)
+        self.db = sqlite3.connect(os.path.join(path, 'index.sqlite'), timeout = 30)
+        self.db.execute(SCHEMA)
+        self.db.commit()
+
+    def object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest[2:])
+
+    def put(self, url, status, headers, body):
+        """Store a response body and index it under the url, returns the body digest"""
+        digest = hashlib.sha1(body).hexdigest()
+        file = self.object_path(digest)
+        if not os.path.exists(file):
+            os.makedirs(os.path.dirname(file), exist_ok = True)
+            tmp = '%s.%d.tmp' % (file, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(zlib.compress(body, self.level))
+            os.replace(tmp, file)
+
+        self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                        (canonical_url(url), digest, status, json.dumps(headers), len(body), time.time()))
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+        return digest
+
+    def get(self, url, max_age = None):
+        """Return the Snapshot stored for the url (None if there isn't one, or it is older than max_age seconds)"""
+        row = self.db.execute("SELECT digest, status, headers, fetched FROM responses WHERE url = ?",
+                              (canonical_url(url),)).fetchone()
+        if row is None:
+            return None
+        digest, status, headers, fetched = row
+        if max_age and time.time() - fetched > max_age:
+            return None
+        with open(self.object_path(digest), 'rb') as f:
+            body = zlib.decompress(f.read())
+        return Snapshot(url, status, json.loads(headers), body)
+
+    def __contains__(self, url):
+        return self.db.execute("SELECT 1 FROM responses WHERE url = ?", (canonical_url(url),)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def urls(self):
+        """Return the stored canonical urls"""
+        return [row[0] for row in self.db.execute("SELECT url FROM responses ORDER BY url")]
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+
+def headers_dict(headers):
+    """Return scrapy Headers as a JSON-able dict of lists of strings"""
+    return {key.decode('latin-1'): [value.decode('latin-1') for value in values] for key, values in headers.items()}
+
+
+class SnapshotMiddleware(object):
+    """Downloader middleware recording responses to, or replaying them from, the snapshot store
+
+    Sits next to the downloader, ahead of the redirect, retry and decompression
+    middlewares, so it records and replays the raw responses.
+    """
+
+    def __init__(self, store, mode, stats, max_age = None):
+        self.store = store
+        self.mode = mode
+        self.stats = stats
+        self.max_age = max_age
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mode = crawler.settings.get('SNAPSHOT_MODE')
+        if not mode:
+            raise NotConfigured
+        if mode not in ('record', 'replay', 'reuse'):
+            raise ValueError("SNAPSHOT_MODE must be 'record', 'replay' or 'reuse', not %r" % mode)
+        store = SnapshotStore(crawler.settings.get('SNAPSHOT_DIR', 'Snapshots'),
+                              level = crawler.settings.getint('SNAPSHOT_COMPRESSION', 6))
+        middleware = cls(store, mode, crawler.stats, crawler.settings.getfloat('SNAPSHOT_MAX_AGE', 0) or None)
+        crawler.signals.connect(middleware.spider_closed, signal = signals.spider_closed)
+        return middleware
+
+    def spider_closed(self, spider):
+        self.store.close()
+
+    def process_request(self, request, spider):
+        if self.mode == 'record':
+            return None
+        snapshot = self.store.get(request.url, self.max_age if self.mode == 'reuse' else None)
+        if snapshot is None:
+            if self.mode == 'reuse':
+                return None
+            self.stats.inc_value('snapshot/missing', spider = spider)
+            raise IgnoreRequest("Not in the snapshot store: %s" % request.url)
+        self.stats.inc_value('snapshot/replayed' if self.mode == 'replay' else 'snapshot/reused', spider = spider)
+        headers = Headers(snapshot.headers)
+        respcls = responsetypes.from_args(headers = headers, url = request.url, body = snapshot.body)
+        return respcls(url = request.url, status = snapshot.status, headers = headers, body = snapshot.body,
+                       request = request, flags = ['snapshot'])
+
+    def process_response(self, request, response, spider):
+        # Copies of a coalesced response (ncaa_football.coalescing) were recorded with the original
+        if (self.mode in ('record', 'reuse') and response.status < 400 and 'snapshot' not in response.flags and
+                'coalesced' not in response.flags):
+            self.store.put(request.url, response.status, headers_dict(response.headers), response.body)
+            self.stats.inc_value('snapshot/recorded', spider = spider)
+        return response
@@ -3,10 +3,13 @@ import scrapy, re, urllib, os
 import pandas as pd
 from scrapy import Request
 from scrapy.linkextractors import LinkExtractor
-from ncaa_football.items import create_item_class
+from ncaa_football.items import create_row_class
+from ncaa_football.parsing import HtmlParsingSpider
+from ncaa_football.sharding import ShardedSpider
 
-class CoachSpider(scrapy.Spider): 
+class CoachSpider(ShardedSpider, HtmlParsingSpider, scrapy.Spider): 
     name = "Coach"
+    context_keys = ('txt', 'team', 'org_id', 'season_id')
     
     def start_requests(self): 
 
@@ -16,7 +19,7 @@ class CoachSpider(scrapy.Spider):
             data = pd.read_csv(file_in)
             df = data[data.key == 'people'].drop_duplicates()
             df.sort_values(['team'], inplace = True)
-            _list = df.to_dict(orient='record')
+            _list = self.shard_links(df.to_dict(orient='record'), 'link')
         else:
             raise Exception("Run PeopleHistoryRosterStats Spider....") 
 
@@ -26,12 +29,17 @@ class CoachSpider(scrapy.Spider):
                                  callback=self.parse, 
                                  meta={'name':url['txt'], 
                                        'team':url['team'],
+                                       'org_id':url.get('org_id'),
+                                       'season_id':url.get('season_id'),
+                                       'coalesce_context':self.link_context(url),
                                       }
                                 )
     
     def parse(self, response):         
-        # Create table 
-        tables = pd.read_html(response.body)
+        # Parse the tables (off the reactor with PARSE_PROCESSES)
+        return self.read_tables(response, {1: {}}).addCallback(self.parse_tables, response)
+    
+    def parse_tables(self, tables, response):         
         # Stop index
         tables[1].rename(columns={"WL%":"WL"}, inplace = True)
         stop_index = [1 if 'Unnamed: ' in column  else 0 for idx, column in enumerate(tables[1].columns)]
@@ -42,14 +50,13 @@ class CoachSpider(scrapy.Spider):
         tables[1] = tables[1][:-1].iloc[:,:stop_index].copy()   
         tables[1]['Name'] = response.meta['name']
         tables[1]['Team'] = response.meta['team']
+        tables[1]['org_id'] = response.meta['org_id']
+        tables[1]['season_id'] = response.meta['season_id']
 
 	# Create dynamic items
         field_list = tables[1].columns
-        DynamicItem = create_item_class('Coaches', field_list)
-        item = DynamicItem()
+        DynamicItem = create_row_class('Coaches', field_list)
         
         # yield items
-        for record in tables[1].to_dict(orient='record'):
-            for k, v in record.items(): 
-                item[k] = v
-            yield item
+        for record in tables[1].itertuples(index = False, name = None):
+            yield DynamicItem(record)
@@ -2,29 +2,37 @@ import scrapy, re, urllib, os
 import pandas as pd
 from scrapy import Request
 from scrapy.linkextractors import LinkExtractor
-from ncaa_football.items import create_item_class
+from ncaa_football.items import TableItem
+from ncaa_football.urls import url_ids, clean_text
+from ncaa_football.parsing import HtmlParsingSpider
+from ncaa_football.sharding import ShardedSpider
 
-class GameByGame(scrapy.Spider): 
+class GameByGame(ShardedSpider, HtmlParsingSpider, scrapy.Spider): 
     name = "GameByGame"
+    context_keys = ('team', 'year')
     regex = 'http\:\/\/stats\.ncaa\.org\/player\/index\?id\=\d+\&org_id\=\d+\&stats_player_seq\=\-\d+\&year_stat_category_id\=\d+'
+    teamregex = 'http\:\/\/stats\.ncaa\.org\/team\/\d+\/\d+'
     
     def start_requests(self): 
         file_in = os.path.join("Links", 'links_gamebygames.csv')
         if os.path.isfile(file_in):
             # Pull in the data 
             data = pd.read_csv(file_in)
-            _list = data.to_dict(orient='record')
+            _list = self.shard_links(data.to_dict(orient='record'), 'link')
         else: 
             raise Exception("Run teamstats spider")
         
         # Loop through the links 
         for url in _list: 
             print(url['link'])
+            meta = {'team':url['team'], 
+                    'year' :url['year'],
+                    'coalesce_context':self.link_context(url),
+                   }
+            meta.update(url_ids(url['link']))
             yield scrapy.Request(url=url['link'], 
                                  callback=self.parse,
-                                 meta = {'team':url['team'], 
-                                         'year' :url['year'],
-                                        }
+                                 meta = meta
                                 )
     
     def parse(self, response): 
@@ -33,63 +41,55 @@ class GameByGame(scrapy.Spider):
         le = LinkExtractor(allow = self.regex) 
         links = le.extract_links(response)
         
-        # Build up the output 
+        # Build up the output, categories showing the same table are downloaded once
+        # and parsed for each stat (ncaa_football.coalescing)
         for link in links: 
             stat = link.text.replace(" ", "").replace("/", "").replace(".", "")
             yield scrapy.Request(url = link.url, 
                                  callback = self.parse_data, 
                                  meta = {'team': response.meta['team'], 
                                          'year': response.meta['year'],
-                                         'stat': stat
+                                         'stat': stat,
+                                         'org_id': response.meta['org_id'],
+                                         'season_id': response.meta['season_id'],
+                                         'coalesce_context': (response.meta['team'], response.meta['year'], stat),
                                         }
                                 )
             
             
     def parse_data(self, response): 
-        
-        # Create tables 
-        tables = pd.read_html(response.body)
+        # Parse the tables (off the reactor with PARSE_PROCESSES)
+        tables = {2: {'header_row': 1, 'clean_names': True}, 
+                  4: {'header_row': 1, 'clean_names': True},
+                 }
+        return self.read_tables(response, tables).addCallback(self.parse_tables, response)
+    
+    def parse_tables(self, tables, response): 
         
         # Create yearly table 
         yearly = self.yearlystats(tables[2])
+        yearly['org_id'] = response.meta['org_id']
+        yearly['season_id'] = response.meta['season_id']
         
-        # Create dynamic items
+        # yield the table 
         stat = response.meta['stat'].replace(" ","").replace("/","").replace(".","").replace("-", "")
-        field_list = yearly.columns
-        DynamicItem = create_item_class("yearly_" + stat, field_list)
-        item = DynamicItem()
-        
-        # yield items
-        for record in yearly.to_dict(orient='record'):
-            for k, v in record.items(): 
-                item[k] = v
-            yield item
+        yield TableItem("yearly_" + stat, yearly)
         
         # Create game-by-game table 
-        gamebygame = self.gamestats(tables[4], response.meta['team'])
+        gamebygame = self.gamestats(tables[4], response.meta['team'], self.opponent_ids(response))
+        gamebygame['org_id'] = response.meta['org_id']
+        gamebygame['season_id'] = response.meta['season_id']
         
-        # Create dynamic items
-        field_list = gamebygame.columns
-        DynamicItem = create_item_class('gamebygame_' + stat, field_list)
-        item = DynamicItem()
-        
-        # yield items
-        for record in gamebygame.to_dict(orient='record'):
-            for k, v in record.items(): 
-                item[k] = v
-            yield item
+        # yield the table 
+        yield TableItem('gamebygame_' + stat, gamebygame)
         
         
     def yearlystats(self, table):
         """Clean up the yearly game-to-game stats table
             table : pandas DF you want to clean 
         """
-        # Drop unneeded header row
-        tmp = table.iloc[1:,]
-        # Create a header row removing spaces, /'s, and x's
-        tmp.columns = [x.replace(" ", "").replace("/","").replace(".","") for x in tmp.iloc[0]]
-        # Drop the row used to create header row
-        tmp = tmp.drop(tmp.index[0])
+        # The header row was picked and its names cleaned by read_tables (header_row, clean_names)
+        tmp = table
         # Forward fill the year for analysis later 
         tmp['Year'].fillna(method='ffill', inplace = True)
         # Create a new offense/defense variable 
@@ -102,18 +102,22 @@ class GameByGame(scrapy.Spider):
         tmp['OffenseDefense'] = tmp['OffenseDefense'].apply(lambda x: 'Offense' if x == curr_team else x)
         return tmp 
     
-    def gamestats(self, table, curr_team):
+    def opponent_ids(self, response):
+        """Map the opponent link text on a game-by-game page to the opponent's org_id
+            response : game-by-game page response 
+        """
+        le = LinkExtractor(allow = self.teamregex)
+        return {clean_text(link.text): url_ids(link.url)['org_id'] for link in le.extract_links(response)}
+    
+    def gamestats(self, table, curr_team, opponent_ids = None):
         """ Clean up game stats table
             table : pandas DF you want to clean 
             curr_team : team name you want to add 
+            opponent_ids : dict of opponent name to org_id 
         """
 
-        # Drop unneeded header 
-        tmp = table.iloc[1:,]
-        # Fix the column names by reading line 0
-        tmp.columns = [x.replace(" ", "").replace("/","").replace(".","") for x in tmp.iloc[0]]
-        # Drop row zero which held the header row
-        tmp = tmp.drop(tmp.index[0])
+        # The header row was picked and its names cleaned by read_tables (header_row, clean_names)
+        tmp = table
         # Forward fill the dates for defensive split later 
         tmp['Date'].fillna(method='ffill', inplace = True)
         # Add in the team 
@@ -128,6 +132,9 @@ class GameByGame(scrapy.Spider):
         tmp['Opponent'].fillna(method='ffill', inplace = True)
         # Forward fill the results in for analysis later 
         tmp['Result'].fillna(method='ffill', inplace = True)
+        # Look up the opponent's org_id from the links on the page
+        opponent_ids = opponent_ids or {}
+        tmp['opponent_org_id'] = tmp['Opponent'].apply(lambda x: opponent_ids.get(clean_text(x)))
         return tmp
         
     
@@ -2,10 +2,14 @@ import scrapy, re, urllib, os
 import pandas as pd
 from scrapy import Request
 from scrapy.linkextractors import LinkExtractor
-from ncaa_football.items import create_item_class
+from ncaa_football.items import create_row_class
+from ncaa_football.urls import url_ids
+from ncaa_football.parsing import HtmlParsingSpider
+from ncaa_football.sharding import ShardedSpider
 
-class HistorySpider(scrapy.Spider): 
+class HistorySpider(ShardedSpider, HtmlParsingSpider, scrapy.Spider): 
     name = "History"
+    context_keys = ('team',)
 
     
     def start_requests(self): 
@@ -15,32 +19,35 @@ class HistorySpider(scrapy.Spider):
             data = pd.read_csv(file_in)
             df = data[data.key == 'history'].drop_duplicates()
             df.sort_values(['team'], inplace = True)
-            _list = df.to_dict(orient='record')
+            _list = self.shard_links(df.to_dict(orient='record'), 'link')
         else: 
             raise Exception("Run PeopleHistoryRosterStats Spider....") 
     
         
-        for url in self._list:
+        for url in _list:
  
             yield scrapy.Request(url=url['link'], 
                                  callback=self.parse, 
-                                 meta={'team':url['team']}
+                                 meta={'team':url['team'], 
+                                       'org_id':url_ids(url['link'])['org_id'],
+                                       'coalesce_context':self.link_context(url),
+                                      }
                                 )
     
     def parse(self, response):         
-        # Create tables 
-        tables = pd.read_html(response.body)
+        # Parse the tables (off the reactor with PARSE_PROCESSES)
+        return self.read_tables(response, {0: {}}).addCallback(self.parse_tables, response)
+    
+    def parse_tables(self, tables, response):         
         tables[0]['Team'] = response.meta['team']
+        tables[0]['org_id'] = response.meta['org_id']
         tables[0].rename(columns={"WL%":"WL", "Head Coaches":"HeadCoaches"}, inplace = True)
 
         # Create dynamic items
         field_list = tables[0].columns
-        DynamicItem = create_item_class('History', field_list)
-        item = DynamicItem()
+        DynamicItem = create_row_class('History', field_list)
         
         # yield items
-        for record in tables[0][:-1].to_dict(orient='record'):
-            for k, v in record.items(): 
-                item[k] = v
-            yield item
+        for record in tables[0][:-1].itertuples(index = False, name = None):
+            yield DynamicItem(record)
 
@@ -2,11 +2,15 @@ import scrapy, re, urllib, os
 import pandas as pd
 from scrapy import Request
 from scrapy.linkextractors import LinkExtractor 
-from ncaa_football.items import create_item_class
+from ncaa_football.items import create_item_class, create_row_class
+from ncaa_football.urls import url_ids
+from ncaa_football.parsing import HtmlParsingSpider
+from ncaa_football.sharding import ShardedSpider
 
 
-class PeopleHistoryRosterStats(scrapy.Spider): 
+class PeopleHistoryRosterStats(ShardedSpider, HtmlParsingSpider, scrapy.Spider): 
     name = "PeopleHistoryRosterStats"
+    context_keys = ('Year',)
     
     # Settings 
     custom_settings = {'DOWNLOAD_DELAY': '.75'}
@@ -23,26 +27,32 @@ class PeopleHistoryRosterStats(scrapy.Spider):
         file_in = os.path.join("Links", "links_team.csv")
         if os.path.isfile(file_in): 
             links = pd.read_csv(file_in)
-            links = links.to_dict(orient='record')
+            links = self.shard_links(links.to_dict(orient='record'), 'Link', year_key = 'Year')
         
             for link in links: 
                 yield Request(url=link['Link'], 
                               callback=self.parse,
-                              meta= {'year':link['Year']}
+                              meta= {'year':link['Year'], 'coalesce_context':self.link_context(link)}
                              )
         else: 
             raise Exception("Run teamlinks spider...")
     
     def parse(self, response): 
-        # Extract Team Name
+        # Parse the tables (off the reactor with PARSE_PROCESSES)
+        tables = {1: {'header_row': 1}, 2: {'header_row': 1}, 3: {'header_row': 1}}
+        return self.read_tables(response, tables).addCallback(self.parse_tables, response)
+    
+    def parse_tables(self, tables, response): 
+        # Extract Team Name and ids
         team = response.selector.xpath("//body//div//fieldset//legend//a/text()").extract()[0]
+        ids = url_ids(response.url)
         
         # Get all the links on the page
         le = LinkExtractor() 
         links = le.extract_links(response)
                 
         # Extract the links pass it to the pipeline for saving
-        field_list0 = ['team', 'link', 'txt', 'key', 'year']
+        field_list0 = ['team', 'link', 'txt', 'key', 'year', 'org_id', 'season_id']
         dyn_item0 = create_item_class('links_teaminfo', field_list0)
         for link in links: 
             item0 = dyn_item0()
@@ -52,58 +62,48 @@ class PeopleHistoryRosterStats(scrapy.Spider):
                               'link':link.url, 
                               'txt':link.text, 
                               'key':k, 
-                              'year':response.meta['year']
+                              'year':response.meta['year'],
+                              'org_id':ids['org_id'],
+                              'season_id':ids['season_id'],
                              }
                     
                     for k, v in record.items(): 
                         item0[k] = v
                     yield item0
         
-        # Find all the tables 
-        tables = pd.read_html(response.body)
-        
         # Create a results table
-        tables[1].rename(columns=tables[1].iloc[1], inplace = True)
-        tables[1].drop([0,1], inplace = True)
         tables[1]['Team'] = team
+        tables[1]['org_id'] = ids['org_id']
+        tables[1]['season_id'] = ids['season_id']
         
         # Convert to table to a list, use dict to create scrapy item, send item to pipeline 
         field_list1 = tables[1].columns
         print(field_list1)
-        dyn_item1 = create_item_class('results', field_list1)
-        item1 = dyn_item1()
-        for record in tables[1].to_dict(orient='record'):
-            for k, v in record.items(): 
-                item1[k] = v
-            yield item1
+        dyn_item1 = create_row_class('results', field_list1)
+        for record in tables[1].itertuples(index = False, name = None):
+            yield dyn_item1(record)
                 
         # Team stats 
-        tables[2].rename(columns=tables[2].iloc[1], inplace = True)
-        tables[2].drop([0,1], inplace = True)
         tables[2]['Team'] = team
         tables[2]['Year'] = response.meta['year']
+        tables[2]['org_id'] = ids['org_id']
+        tables[2]['season_id'] = ids['season_id']
         
         # Convert to table to a list, use dict to create scrapy item, send item to pipeline 
         field_list2 = tables[2].columns
-        dyn_item2 = create_item_class('teamstats', field_list2)
-        item2 = dyn_item2()
-        for record in tables[2][:-1].to_dict(orient='record'):
-            for k, v in record.items(): 
-                item2[k] = v
-            yield item2
+        dyn_item2 = create_row_class('teamstats', field_list2)
+        for record in tables[2][:-1].itertuples(index = False, name = None):
+            yield dyn_item2(record)
                 
         # Individual stats
-        tables[3].rename(columns=tables[3].iloc[1], inplace = True)
-        tables[3].drop([0,1], inplace = True)
         tables[3]['Team'] = team
         tables[3]['Year'] = response.meta['year']
+        tables[3]['org_id'] = ids['org_id']
+        tables[3]['season_id'] = ids['season_id']
         
         # Convert to table to a list, use dict to create scrapy item, send item to pipeline 
         field_list3 = tables[3].columns
-        dyn_item3 = create_item_class('individualleaders', field_list3)
-        item3 = dyn_item3()
-        for record in tables[3][:-1].to_dict(orient='record'):
-            for k, v in record.items(): 
-                item3[k] = v
-            yield item3
+        dyn_item3 = create_row_class('individualleaders', field_list3)
+        for record in tables[3][:-1].itertuples(index = False, name = None):
+            yield dyn_item3(record)
             
@@ -2,49 +2,55 @@ import scrapy, re, urllib, os
 import pandas as pd
 from scrapy import Request
 from scrapy.linkextractors import LinkExtractor
-from ncaa_football.items import create_item_class
+from ncaa_football.items import create_row_class
+from ncaa_football.urls import url_ids
+from ncaa_football.parsing import HtmlParsingSpider
+from ncaa_football.sharding import ShardedSpider
 
-class rosterSpider(scrapy.Spider): 
+class rosterSpider(ShardedSpider, HtmlParsingSpider, scrapy.Spider): 
     name = "Roster"
+    context_keys = ('team',)
     
     def start_requests(self): 
         # Read in data
         file_in = os.path.join("Links", "links_teaminfo.csv")
         if os.path.isfile(file_in): 
-            data = pd.read_csv(os.path.join("Links", file_in))
+            data = pd.read_csv(file_in)
             df = data[data.key == 'roster'].drop_duplicates()
             df.sort_values(['team'], inplace = True)
-            _list = df.to_dict(orient='record')
+            _list = self.shard_links(df.to_dict(orient='record'), 'link')
         else: 
             raise Exception("Run PeopleHistoryRosterStats Spider....") 
     
     
         
-        for url in self._list: 
+        for url in _list: 
+            meta = {'team':url['team'], 'coalesce_context':self.link_context(url)}
+            meta.update(url_ids(url['link']))
             yield scrapy.Request(url=url['link'], 
                                  callback=self.parse, 
-                                 meta={'team':url['team']}
+                                 meta=meta
                                 )
     
     def parse(self, response):
+        # Parse the tables (off the reactor with PARSE_PROCESSES)
+        return self.read_tables(response, {0: {'header_level': -1}}).addCallback(self.parse_tables, response)
+    
+    def parse_tables(self, tables, response):
         # year 
         year = response.selector.xpath("//body//div[@id='contentarea']//fieldset//div/" +
                  "/form[@id='change_sport_form']//select[@id='year_list']//option[@select" +
                  "ed='selected']//text()").extract()
 
-        # Create tables 
-        tables = pd.read_html(response.body)
-        tables[0].columns = tables[0].columns.droplevel(0)
         tables[0]['Year'] = year[0]
         tables[0]['Team'] = response.meta['team']
+        tables[0]['org_id'] = response.meta['org_id']
+        tables[0]['season_id'] = response.meta['season_id']
 
         # Create dynamic items
         field_list = tables[0].columns
-        DynamicItem = create_item_class('Roster', field_list)
-        item = DynamicItem()
+        DynamicItem = create_row_class('Roster', field_list)
         
         # yield items
-        for record in tables[0].to_dict(orient='record'):
-            for k, v in record.items(): 
-                item[k] = v
-            yield item
+        for record in tables[0].itertuples(index = False, name = None):
+            yield DynamicItem(record)
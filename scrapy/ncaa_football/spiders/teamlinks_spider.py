@@ -2,16 +2,24 @@ import scrapy, re, urllib, os
 import pandas as pd
 from scrapy.linkextractors import LinkExtractor
 from ncaa_football.items import create_item_class
+from ncaa_football.urls import url_ids
+from ncaa_football.sharding import parse_years
 
 class TeamSpider(scrapy.Spider): 
     name = "teamlinks"
     
-    # List of years to build up URLs to crawl 
+    # List of years to build up URLs to crawl, override with -a years=2010-2017 or the TEAM_YEARS setting 
     years = [2014, 2015, 2016, 2017] 
+    division = 11
+    url = "http://stats.ncaa.org/team/inst_team_list?academic_year={year}&conf_id=-1&division={division}&sport_code=MFB"
     
-    # Build list of URLs and crawl 
-    start_urls = ["http://stats.ncaa.org/team/inst_team_list?academic_year={year}&conf_id=-1&division=11&sport_code=MFB".format(year = year)
-            for year in years]
+    def start_requests(self): 
+        """Build list of URLs and crawl"""
+        years = vars(self).get('years') or self.settings.get('TEAM_YEARS') or self.years
+        if not isinstance(years, (list, tuple)): 
+            years = parse_years(years)
+        for year in years: 
+            yield scrapy.Request(self.url.format(year = year, division = self.division))
     
     def parse(self, response): 
         """Parse the crawled pages"""
@@ -31,12 +39,14 @@ class TeamSpider(scrapy.Spider):
             if match != None: 
 		
                 # Create dynamic items
-                field_list = ['Link', 'Team', 'Year']
+                field_list = ['Link', 'Team', 'Year', 'org_id', 'season_id']
                 DynamicItem = create_item_class('Links_Team', field_list)
                 item = DynamicItem()
 		
                 # yield items
-                for k, v in {'Link':link.url, 'Team':link.text, 'Year':curr_year }.items(): 
+                record = {'Link':link.url, 'Team':link.text, 'Year':curr_year }
+                record.update(url_ids(link.url))
+                for k, v in record.items(): 
                     item[k] = v
                 yield item
 
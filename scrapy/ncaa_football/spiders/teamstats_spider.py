@@ -2,69 +2,78 @@ import scrapy, re, urllib, os
 import pandas as pd
 from scrapy import Request
 from scrapy.linkextractors import LinkExtractor
-from ncaa_football.items import create_item_class
+from ncaa_football.items import create_item_class, TableItem
+from ncaa_football.urls import url_ids
+from ncaa_football.parsing import HtmlParsingSpider
+from ncaa_football.sharding import ShardedSpider
 
-class StatsSpider(scrapy.Spider): 
+class StatsSpider(ShardedSpider, HtmlParsingSpider, scrapy.Spider): 
     name = "teamstats"
+    context_keys = ('team',)
     regex = '.*\/stats\?id\=\d+\&year_stat_category_id\=\d+'
     gamebygameregex = '.*\/player\/game_by_game\?'
     xpath = "//body//div[@id='contentarea']//div[@id='stats_div']//table"
+    # NCAA kicks out unlabeled columns for some reason, keep the columns before the first one
+    # and take the spaces, /'s and .'s out of the names
+    table_options = {'until_unnamed': True, 'clean_names': True}
     
     def start_requests(self): 
         file_in = os.path.join("Links", 'links_teaminfo.csv') 
         if os.path.isfile(file_in):
             # Pull in the data 
-            data = pd.read_csv()
+            data = pd.read_csv(file_in)
             stats = data[data.key == 'stats'].drop_duplicates()
             stats.sort_values(['team'], inplace = True)
-            stats_list = stats.to_dict(orient='record')
+            stats_list = self.shard_links(stats.to_dict(orient='record'), 'link')
         else: 
             raise Exception("Run PeopleHistoryRosterStats Spider....") 
         # Loop through the links 
         for url in stats_list: 
+            meta = {'team':url['team'], 'coalesce_context':self.link_context(url)}
+            meta.update(url_ids(url['link']))
             yield scrapy.Request(url=url['link'], 
                                  callback=self.parse,
-                                 meta = {'team':url['team']}
+                                 meta = meta
                                 )
     
     def parse(self, response): 
+        # Parse the tables (off the reactor with PARSE_PROCESSES)
+        return self.read_tables(response, {2: self.table_options}).addCallback(self.parse_tables, response)
+    
+    def parse_tables(self, tables, response): 
         # Year 
         year = response.selector.xpath("//body//div[@id='contentarea']//fieldset//div/" +
                  "/form[@id='change_sport_form']//select[@id='year_list']//option[@select" +
                  "ed='selected']//text()").extract()[0]
         
         # Write out the rushing stats 
-        table = self.table_cleaner(html = response.body, 
-                           target_table = 2, 
+        table = self.table_cleaner(table = tables[2], 
                            stat = 'rushing', 
                            year = year, 
                            team = response.meta['team'],
-                           trim_n_rows = 1
+                           trim_n_rows = 1,
+                           org_id = response.meta['org_id'],
+                           season_id = response.meta['season_id']
                           )
         
-        # Create dynamic items
-        stat = 'rushing'
-        field_list = table.columns
-        DynamicItem = create_item_class(stat, field_list)
-        item = DynamicItem()
-        
-        # yield items
-        for record in table.to_dict(orient='record'):
-            for k, v in record.items(): 
-                item[k] = v
-            yield item
+        # yield the table 
+        yield TableItem('rushing', table)
             
         # Write out the game-by-game links 
         gamebygame = LinkExtractor(allow = self.gamebygameregex) 
         gamebygamelinks = gamebygame.extract_links(response)
         
-        gamebygameItem = create_item_class('links_gamebygames', ['team', 'year', 'link'])
-        gameitem = gamebygameItem()
+        gamebygameItem = create_item_class('links_gamebygames', ['team', 'year', 'link', 'org_id', 'season_id'])
         
         for link in gamebygamelinks: 
+            # A new item per link, the pipeline may still hold the last one
+            ids = url_ids(link.url)
+            gameitem = gamebygameItem()
             gameitem['team'] = response.meta['team']
             gameitem['year'] = year
             gameitem['link'] = link.url
+            gameitem['org_id'] = ids['org_id'] or response.meta['org_id']
+            gameitem['season_id'] = ids['season_id'] or response.meta['season_id']
             yield gameitem
             
         
@@ -76,54 +85,51 @@ class StatsSpider(scrapy.Spider):
         
         links = le.extract_links(response)
         
-        # Build up the output 
+        # Build up the output (one download per page, parsed for each stat, ncaa_football.coalescing)
         for link in links: 
             yield scrapy.Request(link.url, 
                                  callback=self.parse_stats,
-                                 meta = {'year':year, 'team':response.meta['team'], 'stat':link.text}
+                                 meta = {'year':year, 
+                                         'team':response.meta['team'], 
+                                         'stat':link.text,
+                                         'org_id':response.meta['org_id'],
+                                         'season_id':response.meta['season_id'],
+                                         'coalesce_context':(response.meta['team'], year, link.text),
+                                        }
                                 )
     
     def parse_stats(self, response):
+        # Parse the tables (off the reactor with PARSE_PROCESSES)
+        return self.read_tables(response, {2: self.table_options}).addCallback(self.parse_stats_tables, response)
+    
+    def parse_stats_tables(self, tables, response):
         print(response.meta['stat'], response.meta['year'], response.meta['team'])
         # Parse tables 
-        table = self.table_cleaner(html = response.body, 
-                                   target_table = 2, 
+        table = self.table_cleaner(table = tables[2], 
                                    stat = response.meta['stat'], 
                                    year = response.meta['year'], 
                                    team = response.meta['team'],
-                                   trim_n_rows = 3
+                                   trim_n_rows = 3,
+                                   org_id = response.meta['org_id'],
+                                   season_id = response.meta['season_id']
                                   )
-        # Create dynamic items
+        # yield the table 
         stat = response.meta['stat'].replace(" ","").replace("/","").replace(".","")
-        field_list = table.columns
-        DynamicItem = create_item_class(stat, field_list)
-        item = DynamicItem()
-        
-        # yield items
-        for record in table.to_dict(orient='record'):
-            for k, v in record.items(): 
-                item[k] = v
-            yield item
+        yield TableItem(stat, table)
     
-    def table_cleaner(self, html, target_table, stat, year, team, trim_n_rows = 0):
-        """Read HTML string and return a table
-           html : HTML string
-           target_table : Target table number
+    def table_cleaner(self, table, stat, year, team, trim_n_rows = 0, org_id = None, season_id = None):
+        """Clean up a stats table read with table_options and return it
+           table : table read from the page
            trim_n_rows : Trim X number of rows from the end of the table (enter as positive number)
+           org_id : team org_id added to the table
+           season_id : season id added to the table
         """
-        # Create tables
-        tables = pd.read_html(html) 
-        # Subset to single table of interest 
-        table = tables[target_table] 
-        # NCAA kicks out unlabeled columns for some reason. Find the first instance and use it to slice
-        stop_index = [1 if 'Unnamed: ' in column  else 0 for idx, column in enumerate(table.columns)].index(1)
-        # Fix the column names so no spaces, /'s, or .'s 
-        columnNamesFixed = {col:col.replace(" ","").replace("/","").replace(".","") for col in table.iloc[:,:stop_index].columns}
-        table.rename(columns = columnNamesFixed, inplace = True)
         # Clean up table 
-        table = table[:-trim_n_rows].iloc[:,:stop_index]
+        table = table[:-trim_n_rows].copy()
         # Add static variables 
         table['stat'] = stat
         table['year'] = year
         table ['team'] = team
+        table['org_id'] = org_id
+        table['season_id'] = season_id
         return table 
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Single table extraction from the stats.ncaa.org pages
+#
+# pd.read_html turns every table on a page into a DataFrame and the spiders
+# then keep one or two of them.  read_tables parses the page with lxml once
+# and only converts the tables asked for.  Tables are numbered the way
+# read_html numbers them (tables with text in them, hidden ones left out),
+# header rows are found the same way and the values are typed by the same
+# text parser, so read_tables(body, {2: {}})[2] equals pd.read_html(body)[2].
+#
+# Table options, applied before the values are typed
+#
+#   header_row : body row holding the column names, the rows above it are dropped
+#   header_level : level of a multi-row header to keep as the column names
+#   until_unnamed : drop the columns from the first 'Unnamed: ' one on
+#   clean_names : remove spaces, /'s and .'s from the column names
+import pandas as pd
+from lxml import etree
+from pandas.io.parsers import TextParser
+
+PARSER = etree.HTMLParser(recover = True)
+
+# Tables with text in them in document order, as read_html finds them (it skips all blank tables)
+TABLES = etree.XPath("//table[.//*[normalize-space(text())]]")
+TABLE_BY_ID = etree.XPath("//table[@id = $id]")
+ROWS = {'head': etree.XPath(".//thead"),
+        'body': etree.XPath(".//tbody//tr|./tr"),
+        'foot': etree.XPath(".//tfoot//tr"),
+       }
+CELLS = etree.XPath("./td|./th")
+STYLED = etree.XPath(".//*[@style]")
+SPANS = etree.XPath("boolean(./*[@rowspan or @colspan])")
+TEXT = etree.XPath("string()")
+
+# read_html's text parser options
+PARSE_OPTIONS = {'thousands': ',', 'decimal': '.', 'parse_dates': False, 'keep_default_na': True}
+
+
+def hidden(element):
+    """Return True if the element is styled display:none"""
+    return "display:none" in element.get("style", "").replace(" ", "")
+
+
+def page_tables(tree):
+    """Return the page's table elements numbered like pd.read_html numbers them"""
+    return [table for table in TABLES(tree) if not hidden(table)]
+
+
+def cell_text(cell):
+    """Return the cell's text with runs of whitespace collapsed"""
+    # Most cells are plain text, the string value is only needed for markup
+    text = TEXT(cell) if len(cell) else cell.text or ""
+    return " ".join(text.split())
+
+
+def expand_spans(rows):
+    """Return the cell texts of <tr> elements with rowspan and colspan cells repeated"""
+    all_texts = []
+    remainder = []
+    for tr in rows:
+        if not remainder and not SPANS(tr):
+            all_texts.append([cell_text(td) for td in CELLS(tr)])
+            continue
+        texts = []
+        next_remainder = []
+        index = 0
+        for td in CELLS(tr):
+            # Cells carried down from rows above that come before this one
+            while remainder and remainder[0][0] <= index:
+                prev_i, prev_text, prev_rowspan = remainder.pop(0)
+                texts.append(prev_text)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+                index += 1
+
+            text = cell_text(td)
+            rowspan = int(td.get("rowspan") or 1)
+            colspan = int(td.get("colspan") or 1)
+            for _ in range(colspan):
+                texts.append(text)
+                if rowspan > 1:
+                    next_remainder.append((index, text, rowspan - 1))
+                index += 1
+
+        for prev_i, prev_text, prev_rowspan in remainder:
+            texts.append(prev_text)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+        all_texts.append(texts)
+        remainder = next_remainder
+
+    # Rows made only of cells carried down from above
+    while remainder:
+        texts = []
+        next_remainder = []
+        for prev_i, prev_text, prev_rowspan in remainder:
+            texts.append(prev_text)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+        all_texts.append(texts)
+        remainder = next_remainder
+    return all_texts
+
+
+def table_rows(table):
+    """Return the header and body (with the footer) rows of a table element as lists of texts"""
+    for element in STYLED(table):
+        if hidden(element):
+            element.getparent().remove(element)
+    for br in table.iter('br'):
+        br.tail = "\n" + (br.tail or "")
+
+    head = []
+    for thead in ROWS['head'](table):
+        head.extend(thead.xpath("./tr"))
+        # <thead> with cells but no <tr>
+        if CELLS(thead):
+            head.append(thead)
+    body = ROWS['body'](table)
+    if not head:
+        # No <thead>: the top rows of <th> cells are the header
+        while body and all(cell.tag == 'th' for cell in CELLS(body[0])):
+            head.append(body.pop(0))
+    return expand_spans(head), expand_spans(body) + expand_spans(ROWS['foot'](table))
+
+
+def parse_rows(rows, header):
+    """Type the text rows into a DataFrame the way read_html does"""
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    with TextParser(rows, header = header, **PARSE_OPTIONS) as parser:
+        return parser.read()
+
+
+def clean_name(name):
+    """Remove spaces, /'s and .'s from a column name"""
+    return name.replace(" ", "").replace("/", "").replace(".", "")
+
+
+def read_table(table, header_row = None, header_level = None, until_unnamed = False, clean_names = False):
+    """Return a table element as a DataFrame
+
+    table : lxml table element
+    header_row : body row holding the column names (default: the table's header rows)
+    header_level : level of a multi-row header to keep as the column names
+    until_unnamed : drop the columns from the first 'Unnamed: ' one on
+    clean_names : remove spaces, /'s and .'s from the column names
+    """
+    head, body = table_rows(table)
+    if header_row is None:
+        header = None
+        if head:
+            header = 0 if len(head) == 1 else [idx for idx, row in enumerate(head) if any(row)]
+        frame = parse_rows(head + body, header)
+    else:
+        rows = body[header_row:]
+        width = max(len(row) for row in rows)
+        names = rows[0] + [""] * (width - len(rows[0]))
+        if len(rows) > 1:
+            frame = parse_rows(rows[1:], None)
+            frame.columns = names[:frame.shape[1]]
+        else:
+            frame = pd.DataFrame(columns = names)
+
+    if header_level is not None and isinstance(frame.columns, pd.MultiIndex):
+        frame.columns = frame.columns.get_level_values(header_level)
+    if until_unnamed:
+        unnamed = [idx for idx, col in enumerate(frame.columns) if 'Unnamed: ' in str(col)]
+        if unnamed:
+            frame = frame.iloc[:, :unnamed[0]]
+    if clean_names:
+        frame.columns = [clean_name(col) if isinstance(col, str) else col for col in frame.columns]
+    return frame
+
+
+def read_tables(body, tables):
+    """Return {key: DataFrame} for the tables asked for on a page
+
+    body : page HTML
+    tables : dict of table position (int, numbered like pd.read_html) or id (str) -> read_table options
+    """
+    tree = etree.fromstring(body, parser = PARSER)
+    numbered = None
+    out = {}
+    for key, options in tables.items():
+        if isinstance(key, str):
+            found = TABLE_BY_ID(tree, id = key)
+            if not found:
+                raise ValueError("No table with id %r" % key)
+            table = found[0]
+        else:
+            if numbered is None:
+                numbered = page_tables(tree)
+            if key >= len(numbered):
+                raise ValueError("Table %d asked for, the page has %d" % (key, len(numbered)))
+            table = numbered[key]
+        out[key] = read_table(table, **options)
+    return out
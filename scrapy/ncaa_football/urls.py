@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# Helpers for the ids stats.ncaa.org puts in its URLs
+#
+#   /team/721/11520                                   org_id, season_id
+#   /team/721/roster/11520, /team/721/stats/11520     org_id, season_id
+#   /teams/history/MFB/721                            org_id
+#   /player/game_by_game?game_sport_year_ctl_id=11520&org_id=721&...
+#   /player/index?id=11520&org_id=721&...
+#
+# and for the key a page is fetched, stored and coalesced under
+# (canonical_url, url_fingerprint), the same for every spelling of its URL
+import hashlib
+import re
+from w3lib.url import canonicalize_url
+
+ORG_PATTERNS = [re.compile(r"[?&]org_id=(\d+)"),
+                re.compile(r"/team/(\d+)"),
+                re.compile(r"/teams/history/\w+/(\d+)"),
+               ]
+
+SEASON_PATTERNS = [re.compile(r"[?&]game_sport_year_ctl_id=(\d+)"),
+                   re.compile(r"/player/index\?id=(\d+)"),
+                   re.compile(r"/team/\d+/(?:\w+/)?(\d+)"),
+                  ]
+
+# Kinds of page, the first pattern found in a URL names it
+URL_PATTERNS = [('team_list', re.compile(r"/team/inst_team_list")),
+                ('history', re.compile(r"/teams/history/")),
+                ('roster', re.compile(r"/team/\d+/roster/")),
+                ('stats', re.compile(r"/team/\d+/stats")),
+                ('people', re.compile(r"/people/")),
+                ('game_by_game', re.compile(r"/player/(?:game_by_game|index)")),
+                ('team', re.compile(r"/team/\d+/\d+")),
+               ]
+
+
+def search_id(patterns, url):
+    """Return the first id matched by patterns as an int (None if there isn't one)"""
+    for pattern in patterns:
+        match = pattern.search(url)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def url_ids(url):
+    """Return the org_id and season_id in a stats.ncaa.org URL"""
+    return {'org_id': search_id(ORG_PATTERNS, url),
+            'season_id': search_id(SEASON_PATTERNS, url),
+           }
+
+
+def clean_text(text):
+    """Collapse runs of whitespace so link text matches the parsed table text"""
+    return " ".join(str(text).split())
+
+
+def url_pattern(url):
+    """Return the kind of page a stats.ncaa.org URL is (URL_PATTERNS), 'other' if it isn't one of them"""
+    for name, pattern in URL_PATTERNS:
+        if pattern.search(url):
+            return name
+    return 'other'
+
+
+def canonical_url(url):
+    """Return the key a url is stored under (sorted query arguments, no fragment)"""
+    return canonicalize_url(url)
+
+
+def url_fingerprint(url):
+    """Return the sha1 of the canonical url, the same for links that differ only in query order or fragment"""
+    return hashlib.sha1(canonical_url(url).encode('utf-8')).hexdigest()